@@ -0,0 +1,297 @@
+"""
+Deterministic synthetic Bronze data at a scale factor
+
+Scale 1 has the row counts of the real CRM/ERP extracts (18,484 customers,
+~530 product versions, 60,398 sales lines); customers and sales grow linearly
+with the scale factor, products with its square root and categories stay
+fixed. The same (scale, seed) always produces the same rows.
+
+The rows carry the quirks the Silver loaders clean up: duplicate cst_ids with
+older create dates, NULL cst_ids, padded names and codes, several versions per
+prd_key, NULL costs, 0/7-digit/impossible YYYYMMDD order dates, sales that do
+not match quantity × price, NULL or negative prices, NAS-prefixed ERP customer
+ids, dashed location ids, future birthdates and mixed country spellings.
+"""
+import io
+import math
+import random
+from datetime import date, timedelta
+
+import sys
+sys.path.append('.')
+from bulk_load import format_copy_value
+
+BASE_CUSTOMERS = 18484
+BASE_PRODUCTS = 295
+BASE_SALES = 60398
+# Rows buffered per COPY
+COPY_CHUNK_SIZE = 50000
+
+BRONZE_TABLES = {
+    'crm_cust_info': """
+        cst_id INT,
+        cst_key TEXT,
+        cst_firstname TEXT,
+        cst_lastname TEXT,
+        cst_marital_status TEXT,
+        cst_gndr TEXT,
+        cst_create_date DATE
+    """,
+    'crm_prd_info': """
+        prd_id INT,
+        prd_key TEXT,
+        prd_nm TEXT,
+        prd_cost INT,
+        prd_line TEXT,
+        prd_start_dt DATE,
+        prd_end_dt DATE
+    """,
+    'crm_sales_details': """
+        sls_ord_num TEXT,
+        sls_prd_key TEXT,
+        sls_cust_id INT,
+        sls_order_dt INT,
+        sls_ship_dt INT,
+        sls_due_dt INT,
+        sls_sales INT,
+        sls_quantity INT,
+        sls_price INT
+    """,
+    'erp_cust_az12': """
+        cid TEXT,
+        bdate DATE,
+        gen TEXT
+    """,
+    'erp_loc_a101': """
+        cid TEXT,
+        cntry TEXT
+    """,
+    'erp_px_cat_g1v2': """
+        id TEXT,
+        cat TEXT,
+        subcat TEXT,
+        maintenance TEXT
+    """,
+}
+
+# (category, subcategory) per category id prefix of prd_key
+CATEGORIES = {
+    'AC_BR': ('Accessories', 'Bike Racks'), 'AC_BS': ('Accessories', 'Bike Stands'),
+    'AC_BC': ('Accessories', 'Bottles and Cages'), 'AC_CL': ('Accessories', 'Cleaners'),
+    'AC_FE': ('Accessories', 'Fenders'), 'AC_HE': ('Accessories', 'Helmets'),
+    'AC_HP': ('Accessories', 'Hydration Packs'), 'AC_LI': ('Accessories', 'Lights'),
+    'AC_LO': ('Accessories', 'Locks'), 'AC_PA': ('Accessories', 'Panniers'),
+    'AC_PU': ('Accessories', 'Pumps'), 'AC_TT': ('Accessories', 'Tires and Tubes'),
+    'BI_MB': ('Bikes', 'Mountain Bikes'), 'BI_RB': ('Bikes', 'Road Bikes'),
+    'BI_TB': ('Bikes', 'Touring Bikes'), 'CL_BS': ('Clothing', 'Bib-Shorts'),
+    'CL_CA': ('Clothing', 'Caps'), 'CL_GL': ('Clothing', 'Gloves'),
+    'CL_JE': ('Clothing', 'Jerseys'), 'CL_SH': ('Clothing', 'Shorts'),
+    'CL_SO': ('Clothing', 'Socks'), 'CL_TI': ('Clothing', 'Tights'),
+    'CL_VE': ('Clothing', 'Vests'), 'CO_HB': ('Components', 'Handlebars'),
+    'CO_BB': ('Components', 'Bottom Brackets'), 'CO_BR': ('Components', 'Brakes'),
+    'CO_CS': ('Components', 'Chains'), 'CO_CR': ('Components', 'Cranksets'),
+    'CO_DE': ('Components', 'Derailleurs'), 'CO_FO': ('Components', 'Forks'),
+    'CO_HS': ('Components', 'Headsets'), 'CO_MF': ('Components', 'Mountain Frames'),
+    'CO_PD': ('Components', 'Pedals'), 'CO_RF': ('Components', 'Road Frames'),
+    'CO_SA': ('Components', 'Saddles'), 'CO_TF': ('Components', 'Touring Frames'),
+    'CO_WH': ('Components', 'Wheels'),
+}
+
+FIRST_NAMES = ['Jon', 'Elizabeth', 'Eugene', 'Ruben', 'Christy', 'Elizabeth', 'Julio', 'Janet',
+               'Marco', 'Rob', 'Shannon', 'Jacquelyn', 'Curtis', 'Lauren', 'Ian', 'Sydney']
+LAST_NAMES = ['Yang', 'Huang', 'Zhu', 'Torres', 'Johnson', 'Ruiz', 'Alvarez', 'Mehta',
+              'Verhoff', 'Carlson', 'Suarez', 'Lu', 'Walker', 'Jenkins', 'Wright', 'Bennett']
+COUNTRIES = ['DE', 'US', 'USA', 'Germany', 'United States', 'Australia', 'Canada', 'France',
+             'United Kingdom', ' France', '', None]
+MODELS = ['R93R', 'M82B', 'T44U', 'W49Y', 'H80T', 'C11L', 'S29G', 'F19R']
+
+
+def table_rng(seed, table):
+    """Independent random stream per table, so one table's size never shifts another's rows"""
+    return random.Random(f"{seed}:{table}")
+
+
+def date_int(value):
+    """date to its YYYYMMDD integer"""
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def pad(rng, value):
+    """Occasionally surround a value with stray whitespace"""
+    return f" {value} " if rng.random() < 0.05 else value
+
+
+def product_keys(scale, seed):
+    """The distinct prd_keys of a scale, e.g. 'CO-RF-FR-R93R-58'"""
+    rng = table_rng(seed, 'product_keys')
+    prefixes = sorted(CATEGORIES)
+    count = int(BASE_PRODUCTS * math.sqrt(scale))
+    keys = []
+    seen = set()
+    for i in range(count):
+        category = rng.choice(prefixes).replace('_', '-')
+        key = f"{category}-{rng.choice(['FR', 'BK', 'HL', 'SE', 'TI'])}-{rng.choice(MODELS)}-{38 + i % 24}"
+        if key in seen:
+            key = f"{key}-{i}"
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def generate_customers(scale, seed):
+    """bronze.crm_cust_info rows: ~2% of cst_ids repeated with an older record, some NULL ids"""
+    rng = table_rng(seed, 'crm_cust_info')
+    for i in range(int(BASE_CUSTOMERS * scale)):
+        cst_id = 11000 + i
+        created = date(2025, 10, 6) - timedelta(days=rng.randrange(2000))
+        row = [cst_id, f"AW{cst_id:08d}", pad(rng, rng.choice(FIRST_NAMES)), pad(rng, rng.choice(LAST_NAMES)),
+               rng.choice(['M', 'S', ' m', None]), rng.choice(['M', 'F', 'f ', None]), created]
+        yield row
+        if rng.random() < 0.02:
+            older = list(row)
+            older[6] = created - timedelta(days=rng.randrange(1, 365))
+            older[4] = rng.choice(['M', 'S'])
+            yield older
+        if rng.random() < 0.001:
+            yield [None, f"AW{cst_id:08d}", None, None, None, None, None]
+
+
+def generate_products(scale, seed):
+    """bronze.crm_prd_info rows: 1-3 versions per prd_key, NULL costs and lines"""
+    rng = table_rng(seed, 'crm_prd_info')
+    prd_id = 210
+    for prd_key in product_keys(scale, seed):
+        start = date(2011, 7, 1) + timedelta(days=rng.randrange(900))
+        cost = rng.randrange(1, 1500)
+        for _ in range(rng.choice([1, 1, 2, 3])):
+            yield [prd_id, prd_key, f"{prd_key.split('-')[2]} {prd_key.split('-')[3]}",
+                   cost if rng.random() > 0.02 else None,
+                   rng.choice(['M', 'R', 'S', 'T', 'R ', None]), start, None]
+            prd_id += 1
+            start += timedelta(days=rng.randrange(180, 720))
+            cost = max(1, cost + rng.randrange(-50, 100))
+
+
+def generate_sales(scale, seed):
+    """
+    bronze.crm_sales_details rows: 1-4 lines per order, with invalid order dates
+    (0, 7 digits, 2012-13-40) and sales/price that are NULL, negative or inconsistent
+    """
+    rng = table_rng(seed, 'crm_sales_details')
+    # sls_prd_key is the prd_key without its category prefix
+    prd_keys = [key[6:] for key in product_keys(scale, seed)]
+    customers = int(BASE_CUSTOMERS * scale)
+    count = 0
+    order = 43697
+    while count < int(BASE_SALES * scale):
+        ordered = date(2010, 12, 29) + timedelta(days=rng.randrange(1500))
+        customer = 11000 + rng.randrange(customers)
+        order_dt = date_int(ordered)
+        quirk = rng.random()
+        if quirk < 0.0005:
+            order_dt = 0
+        elif quirk < 0.001:
+            order_dt = order_dt // 10
+        elif quirk < 0.0012:
+            order_dt = 20121340
+        for _ in range(rng.choice([1, 1, 2, 3, 4])):
+            quantity = rng.choice([1, 1, 1, 2, 3])
+            price = rng.randrange(2, 3600)
+            sales = quantity * price
+            quirk = rng.random()
+            if quirk < 0.002:
+                sales = None
+            elif quirk < 0.004:
+                sales = -sales
+            elif quirk < 0.006:
+                sales += rng.randrange(1, 50)
+            elif quirk < 0.008:
+                price = None
+            elif quirk < 0.010:
+                price = -price
+            yield [f"SO{order}", rng.choice(prd_keys), customer, order_dt,
+                   date_int(ordered + timedelta(days=7)), date_int(ordered + timedelta(days=12)),
+                   sales, quantity, price]
+            count += 1
+        order += 1
+
+
+def generate_erp_customers(scale, seed):
+    """bronze.erp_cust_az12 rows: NAS-prefixed ids, future birthdates, mixed gender spellings"""
+    rng = table_rng(seed, 'erp_cust_az12')
+    for i in range(int(BASE_CUSTOMERS * scale)):
+        cid = f"AW{11000 + i:08d}"
+        born = date(1916, 1, 1) + timedelta(days=rng.randrange(32000))
+        if rng.random() < 0.002:
+            born = date(2030, 1, 1) + timedelta(days=rng.randrange(9000))
+        yield [f"NAS{cid}" if rng.random() < 0.5 else cid, born,
+               rng.choice(['M', 'F', 'Male', 'Female', ' Female', '', None])]
+
+
+def generate_erp_locations(scale, seed):
+    """bronze.erp_loc_a101 rows: dashed ids and inconsistent country names"""
+    rng = table_rng(seed, 'erp_loc_a101')
+    for i in range(int(BASE_CUSTOMERS * scale)):
+        yield [f"AW-{11000 + i:08d}", rng.choice(COUNTRIES)]
+
+
+def generate_erp_categories(scale, seed):
+    """bronze.erp_px_cat_g1v2 rows: one per category id (not scaled)"""
+    rng = table_rng(seed, 'erp_px_cat_g1v2')
+    for category_id, (category, subcategory) in sorted(CATEGORIES.items()):
+        yield [category_id, category, subcategory, rng.choice(['Yes', 'No'])]
+
+
+GENERATORS = {
+    'crm_cust_info': generate_customers,
+    'crm_prd_info': generate_products,
+    'crm_sales_details': generate_sales,
+    'erp_cust_az12': generate_erp_customers,
+    'erp_loc_a101': generate_erp_locations,
+    'erp_px_cat_g1v2': generate_erp_categories,
+}
+
+
+def column_names(table):
+    """Column names of a bronze table, from its definition"""
+    return [line.split()[0] for line in BRONZE_TABLES[table].strip().splitlines()]
+
+
+def copy_rows(conn, table, rows):
+    """COPY rows into bronze.<table> in chunks of COPY_CHUNK_SIZE; returns the row count"""
+    copy_sql = f"COPY bronze.{table} ({', '.join(column_names(table))}) FROM STDIN WITH (FORMAT csv)"
+    cur = conn.cursor()
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(format_copy_value(value) for value in row))
+        buffer.write('\n')
+        count += 1
+        if count % COPY_CHUNK_SIZE == 0:
+            buffer.seek(0)
+            cur.copy_expert(copy_sql, buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cur.copy_expert(copy_sql, buffer)
+    cur.close()
+    return count
+
+
+def generate_bronze(conn, scale=1, seed=42):
+    """
+    (Re)create the six bronze tables and fill them for a scale factor
+    Returns {table: rows}. Meant for a throwaway benchmark database: existing
+    bronze tables are dropped.
+    """
+    cur = conn.cursor()
+    cur.execute("CREATE SCHEMA IF NOT EXISTS bronze;")
+    results = {}
+    for table, columns in BRONZE_TABLES.items():
+        cur.execute(f"DROP TABLE IF EXISTS bronze.{table};")
+        cur.execute(f"CREATE TABLE bronze.{table} ({columns});")
+        results[table] = copy_rows(conn, table, GENERATORS[table](scale, seed))
+        cur.execute(f"ANALYZE bronze.{table};")
+        print(f"  ✓ Generated {results[table]:,} rows into bronze.{table}")
+    conn.commit()
+    cur.close()
+    return results
@@ -0,0 +1,154 @@
+"""
+End-to-end ETL benchmark on synthetic Bronze data
+
+For every scale factor a throwaway database is created on the configured
+PostgreSQL server, filled by bronze_generator and loaded by run_full_etl. The
+per-stage metrics the run records (see metrics.py) are collected into one
+report: rows per second and peak RSS of every Silver and Gold stage.
+
+    python benchmarks/run_benchmarks.py --scale 1 10 100
+    python benchmarks/run_benchmarks.py --scale 1 --bulk --parallel --keep
+    python benchmarks/run_benchmarks.py --scale 10 --bulk --sales-partitions 4
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import psycopg2
+
+import sys
+sys.path.append('.')
+from db import DB_CONFIG, close_pool, pooled_connection
+from etl_pipeline import run_full_etl
+from benchmarks.bronze_generator import generate_bronze
+
+BENCH_DBNAME = 'datawarehouse_bench'
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def admin_execute(statement):
+    """Run a statement outside a transaction on the server's maintenance database"""
+    conn = psycopg2.connect(**{**DB_CONFIG, 'dbname': 'postgres'})
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute(statement)
+        cur.close()
+    finally:
+        conn.close()
+
+
+def use_database(dbname):
+    """Point the connection pool (and the worker processes it forks) at another database"""
+    close_pool()
+    DB_CONFIG['dbname'] = dbname
+
+
+def read_run_stages(conn):
+    """Stage metrics of the latest run recorded in silver.etl_stage_metrics"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT *
+        FROM silver.etl_stage_metrics
+        WHERE run_id = (SELECT run_id FROM silver.etl_stage_metrics ORDER BY started_at DESC LIMIT 1)
+        ORDER BY started_at
+    """)
+    columns = [column[0] for column in cur.description]
+    stages = [dict(zip(columns, row)) for row in cur.fetchall()]
+    cur.close()
+    return stages
+
+
+def run_scale(scale, seed=42, dbname=BENCH_DBNAME, keep=False, **etl_options):
+    """Generate Bronze at a scale factor in a fresh database, run the full ETL and return its stages"""
+    print("\n" + "="*60)
+    print(f"   BENCHMARK scale {scale}× (database {dbname})")
+    print("="*60)
+    
+    admin_execute(f"DROP DATABASE IF EXISTS {dbname}")
+    admin_execute(f"CREATE DATABASE {dbname}")
+    original_dbname = DB_CONFIG['dbname']
+    use_database(dbname)
+    
+    try:
+        print("\n[Bench] Generating synthetic Bronze data...")
+        start = time.perf_counter()
+        with pooled_connection() as conn:
+            bronze_rows = generate_bronze(conn, scale, seed)
+        generate_seconds = time.perf_counter() - start
+        
+        run_full_etl(**etl_options)
+        
+        with pooled_connection() as conn:
+            stages = read_run_stages(conn)
+    finally:
+        use_database(original_dbname)
+        if not keep:
+            admin_execute(f"DROP DATABASE IF EXISTS {dbname}")
+    
+    return {
+        'scale': scale,
+        'seed': seed,
+        'options': etl_options,
+        'bronze_rows': bronze_rows,
+        'generate_seconds': round(generate_seconds, 3),
+        'stages': stages,
+    }
+
+
+def print_report(results):
+    """Print rows/s and peak memory per stage for every scale factor"""
+    print("\n📊 BENCHMARK REPORT")
+    for result in results:
+        print(f"\n  Scale {result['scale']}× ({sum(result['bronze_rows'].values()):,} bronze rows)")
+        print(f"  {'stage':<28} {'rows out':>12} {'seconds':>9} {'rows/s':>11} {'peak RSS MB':>12}")
+        print("  " + "-" * 76)
+        for stage in result['stages']:
+            peak = stage['peak_rss_bytes'] / 1024 / 1024 if stage['peak_rss_bytes'] else 0
+            print(f"  {stage['stage']:<28} {stage['rows_out']:>12,} {stage['wall_seconds']:>9.2f} "
+                  f"{stage['rows_per_second']:>11,.0f} {peak:>12.1f}")
+
+
+def write_report(results, directory=RESULTS_DIR):
+    """Write the results to <directory>/benchmark_<timestamp>.json and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"benchmark_{datetime.now():%Y%m%dT%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end ETL benchmark on synthetic Bronze data")
+    parser.add_argument('--scale', type=float, nargs='+', default=[1, 10], help="scale factors to run")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dbname', default=BENCH_DBNAME, help="throwaway database (dropped and recreated)")
+    parser.add_argument('--keep', action='store_true', help="keep the database after the run")
+    parser.add_argument('--parallel', action='store_true')
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--bulk', action='store_true')
+    parser.add_argument('--batch', action='store_true')
+    parser.add_argument('--set-based-fact', action='store_true')
+    parser.add_argument('--sales-partitions', type=int, default=1, metavar='N')
+    args = parser.parse_args(argv)
+    
+    etl_options = {
+        'parallel': args.parallel,
+        'streaming': args.streaming,
+        'bulk': args.bulk,
+        'batch': args.batch,
+        'set_based_fact': args.set_based_fact,
+        'sales_partitions': args.sales_partitions,
+    }
+    results = [
+        run_scale(int(scale) if scale.is_integer() else scale, args.seed, args.dbname, args.keep, **etl_options)
+        for scale in args.scale
+    ]
+    print_report(results)
+    print(f"\n✓ Benchmark report written to {write_report(results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Database-free microbenchmarks of the per-row Silver transforms
+
+Every transform helper and transform_*_row wrapper is fed rows drawn from the
+synthetic Bronze generator (same value distributions and quirks as a real
+load) and timed in ns/row. Allocations are measured in a separate pass with
+the outputs kept alive: memory blocks (sys.getallocatedblocks) and traced
+bytes (tracemalloc) per row.
+
+Results are compared with the committed baseline (transform_baseline.json);
+a run without a baseline fails unless it records one. Timings are normalised by a
+fixed pure-Python calibration loop measured on both runs, so a baseline taken
+on another machine still compares roughly. A transform slower than its
+baseline by more than the threshold fails the run (exit status 1).
+
+    python benchmarks/transform_benchmarks.py                   # compare with the baseline
+    python benchmarks/transform_benchmarks.py --save-baseline   # record a new baseline
+"""
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+from itertools import islice
+
+import sys
+sys.path.append('.')
+from benchmarks.bronze_generator import GENERATORS, column_names
+from sources.customers import transform_customer_row, transform_marital_status, transform_gender, clean_name
+from sources.products import transform_product_row, transform_product_line, extract_cat_id, extract_prd_key
+from sources.sales import transform_sales_row, parse_date_int, calculate_sales, calculate_price
+from sources.erp_customer import transform_erp_customer_row, validate_birthdate
+from sources.erp_customer import clean_cid as clean_nas_cid
+from sources.erp_location import transform_erp_location_row, transform_country
+from sources.erp_location import clean_cid as clean_dashed_cid
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transform_baseline.json')
+ROWS = 20000
+REPEAT = 5
+# Allowed slowdown over the baseline (0.25 = 25%)
+THRESHOLD = 0.25
+
+
+def bronze_rows(table, count=ROWS, seed=42):
+    """The first `count` synthetic bronze rows of a table as dicts shaped like its extract"""
+    columns = column_names(table)
+    if table == 'crm_prd_info':
+        columns = ['original_prd_key' if column == 'prd_key' else column for column in columns]
+    scale = 1
+    rows = []
+    while len(rows) < count:
+        rows = [dict(zip(columns, row)) for row in islice(GENERATORS[table](scale, seed), count)]
+        scale *= 10
+    if table == 'crm_cust_info':
+        # The extract drops NULL ids and keeps one record per cst_id
+        rows = [row for row in rows if row['cst_id'] is not None]
+    return rows
+
+
+def benchmark_cases(count=ROWS):
+    """name -> (function, inputs, mutates) where mutates means each call needs a fresh row copy"""
+    customers = bronze_rows('crm_cust_info', count)
+    products = bronze_rows('crm_prd_info', count)
+    sales = bronze_rows('crm_sales_details', count)
+    erp_customers = bronze_rows('erp_cust_az12', count)
+    erp_locations = bronze_rows('erp_loc_a101', count)
+    order_dates = [row['sls_order_dt'] for row in sales]
+    return {
+        'clean_name': (clean_name, [row['cst_firstname'] for row in customers], False),
+        'transform_marital_status': (transform_marital_status,
+                                     [row['cst_marital_status'] for row in customers], False),
+        'transform_gender': (transform_gender, [row['cst_gndr'] for row in customers], False),
+        'transform_customer_row': (transform_customer_row, customers, True),
+        'transform_product_line': (transform_product_line, [row['prd_line'] for row in products], False),
+        'extract_cat_id': (extract_cat_id, [row['original_prd_key'] for row in products], False),
+        'extract_prd_key': (extract_prd_key, [row['original_prd_key'] for row in products], False),
+        'transform_product_row': (transform_product_row, products, True),
+        'parse_date_int': (parse_date_int, order_dates, False),
+        'calculate_sales': (calculate_sales, sales, False),
+        'calculate_price': (calculate_price, sales, False),
+        'transform_sales_row': (transform_sales_row, sales, True),
+        'clean_cid (erp_cust_az12)': (clean_nas_cid, [row['cid'] for row in erp_customers], False),
+        'validate_birthdate': (validate_birthdate, [row['bdate'] for row in erp_customers], False),
+        'transform_erp_customer_row': (transform_erp_customer_row, erp_customers, True),
+        'clean_cid (erp_loc_a101)': (clean_dashed_cid, [row['cid'] for row in erp_locations], False),
+        'transform_country': (transform_country, [row['cntry'] for row in erp_locations], False),
+        'transform_erp_location_row': (transform_erp_location_row, erp_locations, True),
+    }
+
+
+def fresh_inputs(inputs, mutates):
+    """Inputs for one pass: row copies for transforms that modify their row in place"""
+    return [dict(row) for row in inputs] if mutates else inputs
+
+
+def time_pass(function, inputs, mutates):
+    """ns/row of one pass over the inputs (row copies are made outside the timed loop)"""
+    rows = fresh_inputs(inputs, mutates)
+    gc.disable()
+    started = time.perf_counter_ns()
+    for row in rows:
+        function(row)
+    elapsed = time.perf_counter_ns() - started
+    gc.enable()
+    return elapsed / len(rows)
+
+
+def allocations_per_row(function, inputs, mutates):
+    """(memory blocks, traced bytes) allocated per row, with every output kept alive"""
+    rows = fresh_inputs(inputs, mutates)
+    outputs = []
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    bytes_before, _ = tracemalloc.get_traced_memory()
+    for row in rows:
+        outputs.append(function(row))
+    bytes_after, _ = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    gc.enable()
+    # The outputs list itself grows by one pointer per row
+    list_bytes = sys.getsizeof(outputs)
+    return ((blocks_after - blocks_before) / len(inputs),
+            max(bytes_after - bytes_before - list_bytes, 0) / len(inputs))
+
+
+def calibration_workload(i):
+    """Fixed dict/str work whose speed normalises timings across machines"""
+    row = {'key': i, 'value': str(i)}
+    row['value'] = row['value'].strip().upper()
+    return row
+
+
+def run_benchmarks(count=ROWS, repeat=REPEAT):
+    """
+    Return {'calibration_ns': ..., 'transforms': {name: {ns_per_row, blocks_per_row, bytes_per_row}}}
+    Passes are interleaved across the transforms (and the calibration loop) and
+    the best of `repeat` is kept, so a burst of machine noise hits every case alike
+    """
+    cases = benchmark_cases(count)
+    results = {}
+    for name, (function, inputs, mutates) in cases.items():
+        blocks, traced = allocations_per_row(function, inputs, mutates)
+        results[name] = {'blocks_per_row': round(blocks, 2), 'bytes_per_row': round(traced, 1)}
+    
+    cases['calibration'] = (calibration_workload, list(range(count)), False)
+    best = {}
+    for _ in range(repeat):
+        for name, (function, inputs, mutates) in cases.items():
+            elapsed = time_pass(function, inputs, mutates)
+            best[name] = min(best.get(name, elapsed), elapsed)
+    
+    for name, result in results.items():
+        result['ns_per_row'] = round(best[name], 1)
+    return {'calibration_ns': round(best['calibration'], 2), 'rows': count, 'transforms': results}
+
+
+def compare_with_baseline(current, baseline, threshold=THRESHOLD):
+    """Return the names of the transforms slower than baseline × (1 + threshold), after calibration"""
+    speed = current['calibration_ns'] / baseline['calibration_ns']
+    regressions = []
+    for name, result in current['transforms'].items():
+        reference = baseline['transforms'].get(name)
+        if reference is None:
+            continue
+        allowed = reference['ns_per_row'] * speed * (1 + threshold)
+        if result['ns_per_row'] > allowed:
+            regressions.append(name)
+    return regressions
+
+
+def print_results(current, baseline=None, regressions=()):
+    """Print one line per transform, with the change from the calibrated baseline"""
+    speed = current['calibration_ns'] / baseline['calibration_ns'] if baseline else None
+    print(f"\n{'transform':<30} {'ns/row':>10} {'blocks/row':>11} {'bytes/row':>10} {'vs baseline':>12}")
+    print("-" * 77)
+    for name, result in current['transforms'].items():
+        change = ''
+        reference = baseline['transforms'].get(name) if baseline else None
+        if reference:
+            change = f"{result['ns_per_row'] / (reference['ns_per_row'] * speed) - 1:+.1%}"
+        status = '❌' if name in regressions else ' '
+        print(f"{name:<30} {result['ns_per_row']:>10,.1f} {result['blocks_per_row']:>11.2f} "
+              f"{result['bytes_per_row']:>10.1f} {change:>12} {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the Silver row transforms")
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="allowed slowdown, e.g. 0.25")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    args = parser.parse_args(argv)
+    
+    current = run_benchmarks(args.rows, args.repeat)
+    
+    if args.save_baseline:
+        print_results(current)
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"\n✓ Baseline written to {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        # Without a baseline nothing is checked, which must not pass silently
+        print_results(current)
+        print(f"\n❌ No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 1
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(current, baseline, args.threshold)
+    print_results(current, baseline, regressions)
+    
+    if regressions:
+        print(f"\n❌ {len(regressions)} transform(s) slower than the baseline by more than "
+              f"{args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\n✓ No transform slower than the baseline by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+COPY-based bulk writer for the Data Warehouse ETL
+"""
+import io
+from decimal import Decimal, ROUND_HALF_UP
+
+import pygrametl
+
+BULK_BUFFER_SIZE = 10000
+
+
+def format_copy_value(value):
+    """Format a single value as a quoted CSV field for COPY (None -> NULL)"""
+    if value is None:
+        return ''
+    # Derived measures such as sls_price are floats (10.0, 12.5); write them
+    # as ints rounded half away from zero, as the INTEGER columns round the
+    # numeric literal of an INSERT
+    if isinstance(value, float):
+        value = int(Decimal(value).quantize(0, ROUND_HALF_UP))
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CopyTable(object):
+    """
+    Drop-in replacement for a pygrametl Dimension/FactTable used only for
+    inserts: rows are buffered in memory and streamed into the target table
+    with COPY FROM STDIN every `buffersize` rows and on commit.
+    """
+
+    def __init__(self, name, attributes, targetconnection, buffersize=BULK_BUFFER_SIZE):
+        self.name = name
+        self.attributes = list(attributes)
+        self.targetconnection = targetconnection
+        self.buffersize = buffersize
+        self.copy_sql = (
+            f"COPY {name} ({', '.join(self.attributes)}) "
+            "FROM STDIN WITH (FORMAT csv)"
+        )
+        self._buffer = io.StringIO()
+        self._buffered = 0
+        # Registered like pygrametl's own tables so that
+        # ConnectionWrapper.commit() flushes the remaining rows
+        pygrametl._alltables.append(self)
+
+    def insert(self, row):
+        """Buffer a row, flushing to the database when the buffer is full"""
+        self._buffer.write(','.join(format_copy_value(row.get(att)) for att in self.attributes))
+        self._buffer.write('\n')
+        self._buffered += 1
+        if self._buffered >= self.buffersize:
+            self.flush()
+
+    def flush(self):
+        """Stream all buffered rows into the table with COPY"""
+        if self._buffered == 0:
+            return
+        self._buffer.seek(0)
+        cur = self.targetconnection.cursor()
+        cur.copy_expert(self.copy_sql, self._buffer)
+        cur.close()
+        self._buffer = io.StringIO()
+        self._buffered = 0
+
+    def endload(self):
+        """Called by pygrametl when the transaction is committed"""
+        self.flush()
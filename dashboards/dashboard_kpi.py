@@ -4,10 +4,17 @@ from matplotlib.gridspec import GridSpec
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import hashlib
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import sys
 sys.path.append('.')
-from db import get_connection
+from db import pooled_connection, get_gold_load_version
+from dashboards.query_cache import DataFrameCache
+from dashboards.kpi_data import load_kpi_data, chart_data
+from dashboards.sales_cube import load_sales_cube, cube_kpi_data
 
 
 plt.style.use('seaborn-v0_8-whitegrid')
@@ -17,33 +24,55 @@ plt.rcParams['font.size'] = 10
 plt.rcParams['axes.titlesize'] = 12
 plt.rcParams['axes.labelsize'] = 10
 
+# Paramètres de savefig, inclus dans l'empreinte de chaque graphique
+RENDER_PARAMS = {'dpi': 150, 'bbox_inches': 'tight', 'facecolor': 'white'}
+
+# Processus de rendu par défaut pour generate_all_dashboards(parallel=True)
+RENDER_WORKERS = os.cpu_count() or 1
+
 COLORS = ['#2E86AB', '#A23B72', '#F18F01', '#C73E1D', '#3B1F2B', 
           '#95C623', '#5C4D7D', '#E84855', '#F9DC5C', '#3185FC']
 
 
-def get_dataframe(query):
-    """Execute query and return DataFrame"""
-    conn = get_connection()
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+def run_query(query):
+    """Execute query on a pooled connection and return DataFrame"""
+    with pooled_connection() as conn:
+        df = pd.read_sql_query(query, conn)
     return df
 
 
+def current_load_version():
+    """Version of the gold load the dashboards are built from"""
+    with pooled_connection() as conn:
+        return get_gold_load_version(conn)
+
+
+# Query results are reused until the pipeline stamps a new gold load version,
+# checked on every query (once per render inside query_cache.pinned_version())
+query_cache = DataFrameCache(current_load_version)
+
+
+def get_dataframe(query, use_cache=True):
+    """Return the DataFrame of a query, from the cache unless use_cache=False"""
+    if not use_cache:
+        return run_query(query)
+    return query_cache.get_dataframe(query, run_query)
+
+
 
-def kpi_sales_by_category():
+def kpi_sales_by_category(data=None):
     """Graphique en barres - Ventes par catégorie"""
     query = """
         SELECT 
-            COALESCE(p.category, 'Non catégorisé') as category,
-            SUM(f.sales_amount) as total_sales,
-            SUM(f.quantity) as total_quantity,
-            COUNT(*) as nb_transactions
-        FROM gold.fact_sales f
-        JOIN gold.dim_products p ON f.product_key = p.product_key
-        GROUP BY p.category
+            COALESCE(category, 'Non catégorisé') as category,
+            SUM(total_sales)::bigint as total_sales,
+            SUM(total_quantity)::bigint as total_quantity,
+            SUM(nb_transactions)::bigint as nb_transactions
+        FROM gold.agg_sales_cube
+        GROUP BY category
         ORDER BY total_sales DESC
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, ax = plt.subplots(figsize=(10, 6))
     bars = ax.barh(df['category'], df['total_sales'], color=COLORS[:len(df)])
@@ -60,19 +89,18 @@ def kpi_sales_by_category():
 
 
 
-def kpi_sales_by_country():
+def kpi_sales_by_country(data=None):
     """Graphique camembert - Répartition par pays"""
     query = """
         SELECT 
-            COALESCE(c.country, 'Inconnu') as country,
-            SUM(f.sales_amount) as total_sales
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.country
+            COALESCE(country, 'Inconnu') as country,
+            SUM(total_sales)::bigint as total_sales
+        FROM gold.agg_sales_cube
+        GROUP BY country
         ORDER BY total_sales DESC
         LIMIT 8
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, ax = plt.subplots(figsize=(10, 8))
     wedges, texts, autotexts = ax.pie(
@@ -95,19 +123,14 @@ def kpi_sales_by_country():
 
 
 
-def kpi_sales_over_time():
+def kpi_sales_over_time(data=None):
     """Graphique courbe - Évolution temporelle des ventes"""
     query = """
-        SELECT 
-            DATE_TRUNC('month', order_date) as month,
-            SUM(sales_amount) as total_sales,
-            COUNT(DISTINCT order_number) as nb_orders
-        FROM gold.fact_sales
-        WHERE order_date IS NOT NULL
-        GROUP BY DATE_TRUNC('month', order_date)
+        SELECT month, total_sales, nb_orders
+        FROM gold.agg_sales_monthly
         ORDER BY month
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     df['month'] = pd.to_datetime(df['month'])
     
     fig, ax1 = plt.subplots(figsize=(12, 6))
@@ -132,20 +155,15 @@ def kpi_sales_over_time():
     return fig
 
 
-def kpi_top_products():
+def kpi_top_products(data=None):
     """Graphique en barres horizontales - Top produits"""
     query = """
-        SELECT 
-            p.product_name,
-            SUM(f.sales_amount) as total_sales,
-            SUM(f.quantity) as total_quantity
-        FROM gold.fact_sales f
-        JOIN gold.dim_products p ON f.product_key = p.product_key
-        GROUP BY p.product_name
+        SELECT product_name, total_sales, total_quantity
+        FROM gold.agg_sales_by_product
         ORDER BY total_sales DESC
         LIMIT 10
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, ax = plt.subplots(figsize=(12, 6))
     
@@ -165,21 +183,15 @@ def kpi_top_products():
 
 
 
-def kpi_top_customers():
+def kpi_top_customers(data=None):
     """Graphique en barres - Top clients"""
     query = """
-        SELECT 
-            c.first_name || ' ' || c.last_name as customer_name,
-            c.country,
-            SUM(f.sales_amount) as total_spent,
-            COUNT(DISTINCT f.order_number) as nb_orders
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.customer_key, c.first_name, c.last_name, c.country
+        SELECT customer_name, country, total_spent, nb_orders
+        FROM gold.agg_sales_by_customer
         ORDER BY total_spent DESC
         LIMIT 10
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, ax = plt.subplots(figsize=(12, 6))
     
@@ -200,19 +212,18 @@ def kpi_top_customers():
 
 
 
-def kpi_sales_by_gender():
+def kpi_sales_by_gender(data=None):
     """Graphique camembert - Ventes par genre"""
     query = """
         SELECT 
-            c.gender,
-            SUM(f.sales_amount) as total_sales,
-            COUNT(DISTINCT c.customer_key) as nb_customers
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.gender
+            gender,
+            SUM(total_spent)::bigint as total_sales,
+            COUNT(*) as nb_customers
+        FROM gold.agg_sales_by_customer
+        GROUP BY gender
         ORDER BY total_sales DESC
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
     
@@ -233,20 +244,19 @@ def kpi_sales_by_gender():
 
 
 
-def kpi_sales_by_product_line():
+def kpi_sales_by_product_line(data=None):
     """Graphique en barres groupées - Ventes par ligne de produit"""
     query = """
         SELECT 
-            p.product_line,
-            SUM(f.sales_amount) as total_sales,
-            SUM(f.quantity) as total_quantity,
-            AVG(f.price) as avg_price
-        FROM gold.fact_sales f
-        JOIN gold.dim_products p ON f.product_key = p.product_key
-        GROUP BY p.product_line
+            product_line,
+            SUM(total_sales)::bigint as total_sales,
+            SUM(total_quantity)::bigint as total_quantity,
+            SUM(price_sum)::numeric / NULLIF(SUM(price_count), 0) as avg_price
+        FROM gold.agg_sales_cube
+        GROUP BY product_line
         ORDER BY total_sales DESC
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, axes = plt.subplots(1, 3, figsize=(15, 5))
     
@@ -272,19 +282,18 @@ def kpi_sales_by_product_line():
 
 
 
-def kpi_sales_by_marital_status():
+def kpi_sales_by_marital_status(data=None):
     """Histogramme - Ventes par statut marital"""
     query = """
         SELECT 
-            c.marital_status,
-            SUM(f.sales_amount) as total_sales,
-            AVG(f.sales_amount) as avg_order_value,
-            COUNT(*) as nb_transactions
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.marital_status
+            marital_status,
+            SUM(total_sales)::bigint as total_sales,
+            SUM(total_sales)::numeric / NULLIF(SUM(nb_sales), 0) as avg_order_value,
+            SUM(nb_transactions)::bigint as nb_transactions
+        FROM gold.agg_sales_cube
+        GROUP BY marital_status
     """
-    df = get_dataframe(query)
+    df = get_dataframe(query) if data is None else data.copy()
     
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
     
@@ -310,35 +319,31 @@ def kpi_sales_by_marital_status():
 
 
 
-def kpi_dashboard_summary():
-    """Dashboard récapitulatif avec KPI principaux"""
+def kpi_dashboard_summary(data=None):
+    """
+    Dashboard récapitulatif avec KPI principaux
+    data: slices de kpi_data.chart_data() (sinon une requête par indicateur)
+    """
     
     query_global = """
-        SELECT 
-            SUM(sales_amount) as total_revenue,
-            COUNT(DISTINCT order_number) as total_orders,
-            COUNT(DISTINCT customer_key) as total_customers,
-            AVG(sales_amount) as avg_order_value,
-            SUM(quantity) as total_units
-        FROM gold.fact_sales
+        SELECT total_revenue, total_orders, total_customers, avg_order_value, total_units
+        FROM gold.agg_sales_summary
     """
-    global_metrics = get_dataframe(query_global).iloc[0]
+    global_metrics = get_dataframe(query_global).iloc[0] if data is None else data['global']
     
     query_top_cat = """
-        SELECT p.category, SUM(f.sales_amount) as sales
-        FROM gold.fact_sales f
-        JOIN gold.dim_products p ON f.product_key = p.product_key
-        GROUP BY p.category ORDER BY sales DESC LIMIT 1
+        SELECT category, SUM(total_sales)::bigint as sales
+        FROM gold.agg_sales_cube
+        GROUP BY category ORDER BY sales DESC LIMIT 1
     """
-    top_cat = get_dataframe(query_top_cat)
+    top_cat = get_dataframe(query_top_cat) if data is None else data['top_category']
     
     query_top_country = """
-        SELECT c.country, SUM(f.sales_amount) as sales
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.country ORDER BY sales DESC LIMIT 1
+        SELECT country, SUM(total_sales)::bigint as sales
+        FROM gold.agg_sales_cube
+        GROUP BY country ORDER BY sales DESC LIMIT 1
     """
-    top_country = get_dataframe(query_top_country)
+    top_country = get_dataframe(query_top_country) if data is None else data['top_country']
     
     fig = plt.figure(figsize=(16, 10))
     gs = GridSpec(3, 3, figure=fig, hspace=0.3, wspace=0.3)
@@ -364,34 +369,31 @@ def kpi_dashboard_summary():
     # Ligne 2: Ventes par catégorie et pays
     ax_cat = fig.add_subplot(gs[1, :2])
     query_cat = """
-        SELECT COALESCE(p.category, 'N/A') as category, SUM(f.sales_amount) as sales
-        FROM gold.fact_sales f
-        JOIN gold.dim_products p ON f.product_key = p.product_key
-        GROUP BY p.category ORDER BY sales DESC LIMIT 5
+        SELECT COALESCE(category, 'N/A') as category, SUM(total_sales)::bigint as sales
+        FROM gold.agg_sales_cube
+        GROUP BY category ORDER BY sales DESC LIMIT 5
     """
-    df_cat = get_dataframe(query_cat)
+    df_cat = get_dataframe(query_cat) if data is None else data['categories']
     ax_cat.barh(df_cat['category'], df_cat['sales'], color=COLORS[0])
     ax_cat.set_title('Top 5 Catégories', fontweight='bold')
     ax_cat.invert_yaxis()
     
     ax_country = fig.add_subplot(gs[1, 2])
     query_country = """
-        SELECT COALESCE(c.country, 'N/A') as country, SUM(f.sales_amount) as sales
-        FROM gold.fact_sales f
-        JOIN gold.dim_customers c ON f.customer_key = c.customer_key
-        GROUP BY c.country ORDER BY sales DESC LIMIT 5
+        SELECT COALESCE(country, 'N/A') as country, SUM(total_sales)::bigint as sales
+        FROM gold.agg_sales_cube
+        GROUP BY country ORDER BY sales DESC LIMIT 5
     """
-    df_country = get_dataframe(query_country)
+    df_country = get_dataframe(query_country) if data is None else data['countries']
     ax_country.pie(df_country['sales'], labels=df_country['country'], autopct='%1.1f%%', colors=COLORS[:5])
     ax_country.set_title('Répartition par pays', fontweight='bold')
     
     ax_time = fig.add_subplot(gs[2, :])
     query_time = """
-        SELECT DATE_TRUNC('month', order_date) as month, SUM(sales_amount) as sales
-        FROM gold.fact_sales WHERE order_date IS NOT NULL
-        GROUP BY DATE_TRUNC('month', order_date) ORDER BY month
+        SELECT month, total_sales as sales
+        FROM gold.agg_sales_monthly ORDER BY month
     """
-    df_time = get_dataframe(query_time)
+    df_time = get_dataframe(query_time) if data is None else data['months'].copy()
     df_time['month'] = pd.to_datetime(df_time['month'])
     ax_time.fill_between(df_time['month'], df_time['sales'], alpha=0.3, color=COLORS[0])
     ax_time.plot(df_time['month'], df_time['sales'], color=COLORS[0], linewidth=2)
@@ -405,9 +407,87 @@ def kpi_dashboard_summary():
 
 
 
-def generate_all_dashboards(save_path='dashboards'):
-    import os
-    
+def load_chart_data(in_memory=False):
+    """
+    Toutes les données des graphiques en une seule requête sur les tables d'agrégats ({} en cas d'échec)
+    Avec in_memory=True les agrégats sont calculés par le cube NumPy (sales_cube)
+    """
+    try:
+        if in_memory:
+            return chart_data(cube_kpi_data(load_sales_cube()))
+        return chart_data(load_kpi_data(get_dataframe))
+    except Exception as e:
+        print(f"   ⚠ Données groupées indisponibles, une requête par graphique: {e}")
+        return {}
+
+
+def use_headless_backend():
+    """Backend sans affichage pour les processus de rendu"""
+    plt.switch_backend('Agg')
+
+
+def save_dashboard(func, data, filepath):
+    """Construit un graphique et l'enregistre en PNG"""
+    fig = func(data=data)
+    fig.savefig(filepath, **RENDER_PARAMS)
+    plt.close(fig)
+    return filepath
+
+
+def dashboard_digest(func, data):
+    """
+    Empreinte SHA-256 des données d'un graphique, de son code et des paramètres de rendu
+    Le code source couvre titres et constantes ; la palette et les rcParams
+    (style matplotlib compris, hors backend) couvrent l'apparence.
+    data: DataFrame, Series ou dict de ceux-ci (slice de chart_data)
+    """
+    digest = hashlib.sha256()
+    digest.update(func.__name__.encode('utf-8'))
+    digest.update(inspect.getsource(func).encode('utf-8'))
+    digest.update(repr(COLORS).encode('utf-8'))
+    digest.update(repr(sorted((key, repr(value)) for key, value in plt.rcParams.items()
+                              if key != 'backend')).encode('utf-8'))
+    digest.update(repr(sorted(RENDER_PARAMS.items())).encode('utf-8'))
+    
+    items = sorted(data.items()) if isinstance(data, dict) else [('data', data)]
+    for name, value in items:
+        digest.update(name.encode('utf-8'))
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest.update(repr(list(columns)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def digest_path(filepath):
+    """Fichier d'empreinte enregistré à côté du PNG"""
+    return f'{filepath}.sha256'
+
+
+def is_up_to_date(filepath, digest):
+    """Vrai si le PNG existe et a été rendu à partir des mêmes entrées"""
+    try:
+        with open(digest_path(filepath)) as f:
+            return os.path.exists(filepath) and f.read().strip() == digest
+    except OSError:
+        return False
+
+
+def write_digest(filepath, digest):
+    """Enregistre l'empreinte du dernier rendu réussi"""
+    if digest is not None:
+        with open(digest_path(filepath), 'w') as f:
+            f.write(digest)
+
+
+def generate_all_dashboards(save_path='dashboards', parallel=False, workers=RENDER_WORKERS, force=False,
+                            in_memory=False):
+    """
+    Génère et enregistre tous les tableaux de bord
+    Avec parallel=True chaque graphique est rendu dans son propre processus
+    (backend Agg), sur `workers` processus. Les graphiques dont les données
+    n'ont pas changé depuis le dernier rendu sont ignorés, sauf avec force=True.
+    in_memory=True calcule les données avec le cube NumPy au lieu de SQL.
+    """
     # Créer le dossier si nécessaire
     os.makedirs(save_path, exist_ok=True)
     
@@ -427,16 +507,44 @@ def generate_all_dashboards(save_path='dashboards'):
         ('kpi_sales_by_marital_status', kpi_sales_by_marital_status, 'Analyse statut marital'),
     ]
     
+    with query_cache.pinned_version():
+        slices = load_chart_data(in_memory)
+    
+    # Sans slice (données groupées indisponibles) le graphique est toujours rendu
+    pending = []
     for filename, func, description in dashboards:
-        try:
-            print(f"\n📊 Génération: {description}...")
-            fig = func()
-            filepath = os.path.join(save_path, f'{filename}.png')
-            fig.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close(fig)
-            print(f"   ✓ Sauvegardé: {filepath}")
-        except Exception as e:
-            print(f"   ❌ Erreur: {e}")
+        data = slices.get(filename)
+        filepath = os.path.join(save_path, f'{filename}.png')
+        digest = dashboard_digest(func, data) if data is not None else None
+        if not force and digest is not None and is_up_to_date(filepath, digest):
+            print(f"\n📊 {description}: inchangé, ignoré")
+            continue
+        pending.append((func, data, filepath, digest, description))
+    
+    if parallel and pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 initializer=use_headless_backend) as executor:
+            futures = {
+                executor.submit(save_dashboard, func, data, filepath): (filepath, digest, description)
+                for func, data, filepath, digest, description in pending
+            }
+            for future in as_completed(futures):
+                filepath, digest, description = futures[future]
+                print(f"\n📊 Génération: {description}...")
+                try:
+                    print(f"   ✓ Sauvegardé: {future.result()}")
+                    write_digest(filepath, digest)
+                except Exception as e:
+                    print(f"   ❌ Erreur: {e}")
+    else:
+        for func, data, filepath, digest, description in pending:
+            try:
+                print(f"\n📊 Génération: {description}...")
+                save_dashboard(func, data, filepath)
+                write_digest(filepath, digest)
+                print(f"   ✓ Sauvegardé: {filepath}")
+            except Exception as e:
+                print(f"   ❌ Erreur: {e}")
     
     print("\n" + "="*60)
     print("   ✓ TOUS LES DASHBOARDS ONT ÉTÉ GÉNÉRÉS!")
@@ -444,7 +552,7 @@ def generate_all_dashboards(save_path='dashboards'):
     print("="*60 + "\n")
 
 
-def show_all_dashboards():
+def show_all_dashboards(in_memory=False):
     print("\n📊 Affichage des tableaux de bord...")
     
     dashboards = [
@@ -459,9 +567,12 @@ def show_all_dashboards():
         kpi_sales_by_marital_status,
     ]
     
+    with query_cache.pinned_version():
+        slices = load_chart_data(in_memory)
+    
     for func in dashboards:
         try:
-            func()
+            func(data=slices.get(func.__name__))
         except Exception as e:
             print(f"Erreur {func.__name__}: {e}")
     
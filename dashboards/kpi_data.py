@@ -0,0 +1,161 @@
+"""
+Single-query data layer for the KPI dashboards
+
+One UNION ALL query reads every grouping the charts need (category, country,
+month, gender, marital status, product line, product, customer and the global
+totals) from the KPI aggregate tables built at the end of the gold load
+(dimensions/kpi_aggregates.py), so no dashboard query scans gold.fact_sales.
+chart_data() cuts the result into the slice each chart function expects as its
+`data` argument, shaped like the chart's own query.
+"""
+import pandas as pd
+
+# Columns of the query, cast in every branch so the UNION ALL types match
+KPI_COLUMNS = {
+    'category': 'text',
+    'country': 'text',
+    'month': 'timestamptz',
+    'gender': 'text',
+    'marital_status': 'text',
+    'product_line': 'text',
+    'product_name': 'text',
+    'customer_key': 'integer',
+    'customer_name': 'text',
+    'total_sales': 'bigint',
+    'total_quantity': 'bigint',
+    'nb_transactions': 'bigint',
+    'nb_orders': 'bigint',
+    'nb_customers': 'bigint',
+    'avg_sales': 'numeric',
+    'avg_price': 'numeric',
+}
+
+# Measures of a roll-up of gold.agg_sales_cube (averages are sum / count)
+CUBE_MEASURES = {
+    'total_sales': 'SUM(total_sales)',
+    'total_quantity': 'SUM(total_quantity)',
+    'nb_transactions': 'SUM(nb_transactions)',
+    'avg_sales': 'SUM(total_sales)::numeric / NULLIF(SUM(nb_sales), 0)',
+    'avg_price': 'SUM(price_sum)::numeric / NULLIF(SUM(price_count), 0)',
+}
+
+# grouping name -> (FROM clause, {column: expression}); columns left out are NULL
+KPI_GROUPINGS = {
+    'category': ('gold.agg_sales_cube GROUP BY category', {'category': 'category', **CUBE_MEASURES}),
+    'country': ('gold.agg_sales_cube GROUP BY country', {'country': 'country', **CUBE_MEASURES}),
+    'month': ('gold.agg_sales_monthly', {
+        'month': 'month',
+        'total_sales': 'total_sales',
+        'nb_orders': 'nb_orders',
+    }),
+    # An order belongs to one customer, so per-customer order counts add up
+    'gender': ('gold.agg_sales_by_customer GROUP BY gender', {
+        'gender': 'gender',
+        'total_sales': 'SUM(total_spent)',
+        'nb_orders': 'SUM(nb_orders)',
+        'nb_customers': 'COUNT(*)',
+    }),
+    'marital_status': ('gold.agg_sales_cube GROUP BY marital_status',
+                       {'marital_status': 'marital_status', **CUBE_MEASURES}),
+    'product_line': ('gold.agg_sales_cube GROUP BY product_line',
+                     {'product_line': 'product_line', **CUBE_MEASURES}),
+    'product': ('gold.agg_sales_by_product', {
+        'product_name': 'product_name',
+        'total_sales': 'total_sales',
+        'total_quantity': 'total_quantity',
+    }),
+    'customer': ('gold.agg_sales_by_customer', {
+        'customer_key': 'customer_key',
+        'customer_name': 'customer_name',
+        'country': 'country',
+        'total_sales': 'total_spent',
+        'nb_orders': 'nb_orders',
+    }),
+    'global': ('gold.agg_sales_summary', {
+        'total_sales': 'total_revenue',
+        'total_quantity': 'total_units',
+        'nb_orders': 'total_orders',
+        'nb_customers': 'total_customers',
+        'avg_sales': 'avg_order_value',
+    }),
+}
+
+
+def grouping_select(name, source, expressions):
+    """SELECT of one grouping with every KPI column (NULL where the grouping has none)"""
+    columns = ',\n            '.join(
+        f"({expressions.get(column, 'NULL')})::{column_type} AS {column}"
+        for column, column_type in KPI_COLUMNS.items()
+    )
+    return f"""
+        SELECT
+            '{name}' AS grouping_name,
+            {columns}
+        FROM {source}"""
+
+
+KPI_QUERY = "\n    UNION ALL".join(
+    grouping_select(name, source, expressions) for name, (source, expressions) in KPI_GROUPINGS.items()
+) + "\n"
+
+
+def load_kpi_data(get_dataframe):
+    """
+    Run the KPI query (through get_dataframe, so it is cached like any
+    dashboard query) and return {grouping name: DataFrame}
+    """
+    df = get_dataframe(KPI_QUERY)
+    return {
+        name: df[df['grouping_name'] == name].reset_index(drop=True)
+        for name in KPI_GROUPINGS
+    }
+
+
+def top_sales(df, column='total_sales', n=None):
+    """Sort a grouping by descending sales, optionally keeping the top n rows"""
+    df = df.sort_values(column, ascending=False).reset_index(drop=True)
+    return df.head(n) if n is not None else df
+
+
+def chart_data(kpi_data):
+    """Return {chart function name: data slice} built from load_kpi_data()"""
+    category = top_sales(kpi_data['category'])
+    country = top_sales(kpi_data['country'])
+    month = kpi_data['month'].dropna(subset=['month']).sort_values('month').reset_index(drop=True)
+    totals = kpi_data['global'].iloc[0]
+    sales = {'total_sales': 'sales'}
+
+    return {
+        'kpi_sales_by_category': category.fillna({'category': 'Non catégorisé'})[
+            ['category', 'total_sales', 'total_quantity', 'nb_transactions']],
+        'kpi_sales_by_country': country.head(8).fillna({'country': 'Inconnu'})[
+            ['country', 'total_sales']],
+        'kpi_sales_over_time': month[['month', 'total_sales', 'nb_orders']],
+        'kpi_top_products': top_sales(kpi_data['product'], n=10)[
+            ['product_name', 'total_sales', 'total_quantity']],
+        'kpi_top_customers': top_sales(kpi_data['customer'], n=10).rename(
+            columns={'total_sales': 'total_spent'})[['customer_name', 'country', 'total_spent', 'nb_orders']],
+        'kpi_sales_by_gender': top_sales(kpi_data['gender'])[
+            ['gender', 'total_sales', 'nb_customers']],
+        'kpi_sales_by_product_line': top_sales(kpi_data['product_line'])[
+            ['product_line', 'total_sales', 'total_quantity', 'avg_price']],
+        'kpi_sales_by_marital_status': kpi_data['marital_status'].rename(
+            columns={'avg_sales': 'avg_order_value'})[
+            ['marital_status', 'total_sales', 'avg_order_value', 'nb_transactions']],
+        'kpi_dashboard_summary': {
+            'global': pd.Series({
+                'total_revenue': totals['total_sales'],
+                'total_orders': totals['nb_orders'],
+                'total_customers': totals['nb_customers'],
+                'avg_order_value': totals['avg_sales'],
+                'total_units': totals['total_quantity'],
+            }),
+            'top_category': category.head(1).rename(columns=sales)[['category', 'sales']],
+            'top_country': country.head(1).rename(columns=sales)[['country', 'sales']],
+            'categories': category.head(5).fillna({'category': 'N/A'}).rename(columns=sales)[
+                ['category', 'sales']],
+            'countries': country.head(5).fillna({'country': 'N/A'}).rename(columns=sales)[
+                ['country', 'sales']],
+            'months': month.rename(columns=sales)[['month', 'sales']],
+        },
+    }
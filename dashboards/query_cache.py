@@ -0,0 +1,156 @@
+"""
+Two-tier cache of dashboard query results
+
+DataFrames are keyed by query text plus the gold load version stamped by the
+ETL pipeline (see db.stamp_gold_load_version), so a new gold load invalidates
+every cached result. The version is read from the database for every query,
+or once for a whole render inside pinned_version(). An in-memory LRU tier serves repeated renders in the same
+process; a pickle tier on disk is shared between processes and runs. Both tiers
+evict least recently used entries once they exceed their size budget.
+"""
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from contextlib import contextmanager
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.query_cache')
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class DataFrameCache(object):
+    """LRU cache of query DataFrames invalidated by the gold load version"""
+
+    def __init__(self, version_loader, cache_dir=CACHE_DIR, memory_bytes=MEMORY_CACHE_BYTES,
+                 disk_bytes=DISK_CACHE_BYTES):
+        """version_loader() returns the current gold load version (None disables caching)"""
+        self.version_loader = version_loader
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()  # key -> (DataFrame, size in bytes)
+        self.memory_used = 0
+        self.version = None
+        self.pinned = False
+
+    def current_version(self):
+        """Return the gold load version: the pinned one inside pinned_version(), else read now"""
+        if self.pinned:
+            return self.version
+        return self.refresh_version()
+
+    def refresh_version(self):
+        """Read the gold load version, dropping the memory tier if it changed"""
+        version = self.version_loader()
+        if version != self.version:
+            self.clear_memory()
+        self.version = version
+        return version
+
+    @contextmanager
+    def pinned_version(self):
+        """Read the load version once and use it for every query of the block (e.g. one render)"""
+        if self.pinned:
+            yield self.version
+            return
+        self.refresh_version()
+        self.pinned = True
+        try:
+            yield self.version
+        finally:
+            self.pinned = False
+
+    def get_dataframe(self, query, run_query):
+        """Return the cached result of `query`, calling run_query(query) on a miss"""
+        version = self.current_version()
+        if version is None:
+            return run_query(query)
+
+        key = hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key][0].copy()
+
+        df = self.read_disk(version, key)
+        if df is None:
+            df = run_query(query)
+            self.write_disk(version, key, df)
+        self.store_memory(key, df)
+        return df.copy()
+
+    def store_memory(self, key, df):
+        """Keep a DataFrame in the memory tier, evicting the least recently used ones"""
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.memory_bytes:
+            return
+        self.memory[key] = (df, size)
+        self.memory_used += size
+        while self.memory_used > self.memory_bytes:
+            _, (_, evicted) = self.memory.popitem(last=False)
+            self.memory_used -= evicted
+
+    def clear_memory(self):
+        """Drop the memory tier"""
+        self.memory.clear()
+        self.memory_used = 0
+
+    def disk_path(self, version, key):
+        """Disk tier file of a query result; the version prefix lets stale entries be found"""
+        return os.path.join(self.cache_dir, f"{version}_{key}.pkl")
+
+    def read_disk(self, version, key):
+        """Load a DataFrame from the disk tier (None on a miss)"""
+        path = self.disk_path(version, key)
+        try:
+            with open(path, 'rb') as f:
+                df = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+        os.utime(path)  # mtime records the last use for LRU eviction
+        return df
+
+    def write_disk(self, version, key, df):
+        """Store a DataFrame in the disk tier and enforce its size budget"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.disk_path(version, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial file
+        self.evict_disk(version)
+
+    def evict_disk(self, version):
+        """Remove entries of older load versions, then the least recently used ones over budget"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if not name.startswith(f"{version}_"):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            used -= size
+
+    def clear(self):
+        """Drop both tiers"""
+        self.clear_memory()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
@@ -0,0 +1,299 @@
+"""
+In-process columnar sales cube
+
+gold.fact_sales and its dimension attributes are loaded once into compact NumPy
+columns: text attributes are dictionary-encoded into small integer codes,
+order dates are int32 days since 1970-01-01 and measures are float64 (NaN for
+NULL). The attributes are read once per dimension key and the fact columns
+stream in chunks straight into typed arrays, so no joined row set is built. Group-by, sums, counts, distinct counts and top-N then run in memory
+with bincount/argpartition, without a database round trip.
+
+    cube = load_sales_cube()
+    cube.group_by(['country', 'gender'])
+    cube.top_n('product_name', 10)
+    cube.where(category='Bikes').group_by('month')
+"""
+import numpy as np
+import pandas as pd
+
+import sys
+sys.path.append('.')
+from db import pooled_connection
+
+# order_date code of a NULL date
+NULL_DAY = np.iinfo(np.int32).min
+
+MEASURES = ['sales_amount', 'quantity', 'price']
+
+PRODUCT_ATTRIBUTES_QUERY = """
+    SELECT product_key, category, product_line, product_name
+    FROM gold.dim_products
+"""
+
+CUSTOMER_ATTRIBUTES_QUERY = """
+    SELECT customer_key, country, gender, marital_status, first_name || ' ' || last_name AS customer_name
+    FROM gold.dim_customers
+"""
+
+PRODUCT_ATTRIBUTES = ['category', 'product_line', 'product_name']
+CUSTOMER_ATTRIBUTES = ['country', 'gender', 'marital_status', 'customer_name']
+
+# Fact columns only, already numeric: a missing key is -1 and a NULL date NULL_DAY
+FACT_QUERY = f"""
+    SELECT
+        order_number,
+        COALESCE(product_key, -1),
+        COALESCE(customer_key, -1),
+        COALESCE(order_date - DATE '1970-01-01', {NULL_DAY}),
+        sales_amount::float8,
+        quantity::float8,
+        price::float8
+    FROM gold.fact_sales
+"""
+
+# Typed array of each FACT_QUERY column (order numbers become int64 codes)
+FACT_COLUMNS = {
+    'order_number': np.int64,
+    'product_key': np.int64,
+    'customer_key': np.int64,
+    'day': np.int32,
+    **{name: np.float64 for name in MEASURES},
+}
+
+# Fact rows fetched from the server-side cursor at a time
+CUBE_CHUNK_ROWS = 100_000
+
+# Above this many key combinations group_by switches from bincount to np.unique
+DENSE_GROUP_LIMIT = 10_000_000
+
+
+def smallest_code_dtype(size):
+    """Smallest signed integer dtype holding codes 0..size-1"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def encode_column(values):
+    """Dictionary-encode a column: returns (codes, labels); NULL is a label of its own"""
+    codes, labels = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    return codes.astype(smallest_code_dtype(len(labels))), np.asarray(labels, dtype=object)
+
+
+def attribute_columns(rows, keys, names):
+    """
+    (codes, labels) per fact row of each column of a dimension
+    rows: the dimension table's rows, key first, encoded once per key; names:
+    their column names; keys: the fact rows' keys. An unknown key gets NULL
+    attributes, as with a LEFT JOIN.
+    """
+    positions = pd.Index(np.array([row[0] for row in rows], dtype=np.int64)).get_indexer(keys)
+    # Row len(rows) is the all-NULL row of the unknown keys
+    positions[positions < 0] = len(rows)
+    columns = zip(*rows) if rows else [()] * len(names)
+    dims = {}
+    for name, values in zip(names, columns):
+        codes, labels = encode_column(list(values) + [None])
+        dims[name] = (codes[positions], labels)
+    return dims
+
+
+class SalesCube(object):
+    """Dictionary-encoded columns of gold.fact_sales joined with its dimensions"""
+
+    def __init__(self, dims, days, measures):
+        """
+        dims: {name: (codes, labels)}; days: int32 order dates;
+        measures: {name: float64 array}
+        """
+        self.dims = dims
+        self.days = days
+        self.measures = measures
+
+    @classmethod
+    def from_chunks(cls, products, customers, chunks):
+        """
+        Build a cube from dimension rows and chunks of fact rows
+        products: (product_key, category, product_line, product_name) rows;
+        customers: (customer_key, country, gender, marital_status, customer_name) rows;
+        chunks: lists of (order_number, product_key, customer_key, day, sales_amount,
+        quantity, price) rows shaped like FACT_QUERY
+        """
+        order_numbers = {}
+        columns = {name: [np.empty(0, dtype)] for name, dtype in FACT_COLUMNS.items()}
+        for rows in chunks:
+            if not rows:
+                continue
+            values = dict(zip(FACT_COLUMNS, zip(*rows)))
+            # Order numbers get global codes: factorize the chunk, then code its new
+            # values (NULL is one label across chunks)
+            codes, uniques = pd.factorize(pd.Series(values.pop('order_number'), dtype=object),
+                                          use_na_sentinel=False)
+            known = np.array([order_numbers.setdefault(None if pd.isna(value) else value, len(order_numbers))
+                              for value in uniques], dtype=np.int64)
+            columns['order_number'].append(known[codes])
+            for name, column in values.items():
+                columns[name].append(np.array(column, dtype=FACT_COLUMNS[name]))
+        arrays = {name: np.concatenate(parts) for name, parts in columns.items()}
+
+        labels = np.empty(len(order_numbers), dtype=object)
+        labels[:] = list(order_numbers)
+        dims = {'order_number': (arrays['order_number'].astype(smallest_code_dtype(len(labels))), labels)}
+        dims.update(attribute_columns(products, arrays['product_key'], ['product_key'] + PRODUCT_ATTRIBUTES))
+        dims.update(attribute_columns(customers, arrays['customer_key'], ['customer_key'] + CUSTOMER_ATTRIBUTES))
+        return cls(dims, arrays['day'], {name: arrays[name] for name in MEASURES})
+
+    def __len__(self):
+        return len(self.days)
+
+    def nbytes(self):
+        """Memory held by the column arrays (labels excluded)"""
+        return (self.days.nbytes
+                + sum(codes.nbytes for codes, _ in self.dims.values())
+                + sum(values.nbytes for values in self.measures.values()))
+
+    def dimension(self, name):
+        """(codes, labels) of a dimension; 'month' and 'year' are derived from order_date"""
+        if name in self.dims:
+            return self.dims[name]
+        if name in ('month', 'year'):
+            unit = 'M' if name == 'month' else 'Y'
+            valid = self.days != NULL_DAY
+            periods = np.where(valid, self.days, 0).astype('datetime64[D]').astype(f'datetime64[{unit}]')
+            periods = periods.astype('int64')
+            first = periods[valid].min() if valid.any() else 0
+            codes = np.where(valid, periods - first + 1, 0)
+            size = int(codes.max()) + 1 if len(codes) else 1
+            labels = np.empty(size, dtype=object)
+            labels[0] = pd.NaT
+            labels[1:] = pd.to_datetime(np.arange(first, first + size - 1).astype(f'datetime64[{unit}]'))
+            return codes.astype(smallest_code_dtype(size)), labels
+        raise KeyError(f"Unknown dimension: {name}")
+
+    def where(self, **conditions):
+        """Sub-cube of the rows whose dimensions equal the given labels (e.g. country='France')"""
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in conditions.items():
+            codes, labels = self.dimension(name)
+            matches = np.flatnonzero(pd.Series(labels, dtype=object) == value)
+            mask &= np.isin(codes, matches)
+        return self.take(mask)
+
+    def take(self, mask):
+        """Sub-cube of the rows selected by a boolean mask (labels are kept)"""
+        return SalesCube(
+            {name: (codes[mask], labels) for name, (codes, labels) in self.dims.items()},
+            self.days[mask],
+            {name: values[mask] for name, values in self.measures.items()},
+        )
+
+    def group_keys(self, by):
+        """Combine the codes of the `by` dimensions into one group index per row"""
+        columns = [self.dimension(name) for name in by]
+        sizes = [len(labels) for _, labels in columns]
+        if not columns:
+            return np.zeros(len(self), dtype=np.int64), None, sizes, columns
+        keys = np.ravel_multi_index([codes.astype(np.int64) for codes, _ in columns], sizes)
+        if np.prod(sizes, dtype=np.float64) > DENSE_GROUP_LIMIT:
+            groups, keys = np.unique(keys, return_inverse=True)
+            return keys, groups, sizes, columns
+        return keys, None, sizes, columns
+
+    def group_by(self, by, distinct=('order_number', 'customer_key')):
+        """
+        Aggregate every measure per combination of the `by` dimensions
+        Returns one row per non-empty group with the same measures as the
+        dashboard queries: total_sales, total_quantity, nb_transactions,
+        nb_orders, nb_customers, avg_sales and avg_price
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        keys, groups, sizes, columns = self.group_keys(by)
+        size = len(groups) if groups is not None else int(np.prod(sizes, dtype=np.int64))
+
+        counts = np.bincount(keys, minlength=size)
+
+        def total(values):
+            return np.bincount(keys, weights=np.nan_to_num(values), minlength=size)
+
+        def non_null(values):
+            return np.bincount(keys, weights=~np.isnan(values), minlength=size)
+
+        sales = self.measures['sales_amount']
+        price = self.measures['price']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = {
+                'total_sales': total(sales).round().astype(np.int64),
+                'total_quantity': total(self.measures['quantity']).round().astype(np.int64),
+                'nb_transactions': counts,
+                'avg_sales': total(sales) / non_null(sales),
+                'avg_price': total(price) / non_null(price),
+            }
+        if 'order_number' in distinct:
+            result['nb_orders'] = self.count_distinct(keys, size, 'order_number')
+        if 'customer_key' in distinct:
+            result['nb_customers'] = self.count_distinct(keys, size, 'customer_key')
+
+        present = np.flatnonzero(counts)
+        df = pd.DataFrame({name: values[present] for name, values in result.items()})
+
+        group_ids = groups[present] if groups is not None else present
+        if columns:
+            for name, (_, labels), codes in zip(by, columns, np.unravel_index(group_ids, sizes)):
+                df.insert(len(df.columns) - len(result), name, labels[codes])
+        return df
+
+    def count_distinct(self, keys, size, column):
+        """Number of distinct non-NULL values of an encoded column per group"""
+        codes, labels = self.dims[column]
+        valid = ~pd.isna(pd.Series(labels, dtype=object)).to_numpy()[codes]
+        pairs = np.unique(keys[valid] * len(labels) + codes[valid].astype(np.int64))
+        return np.bincount(pairs // len(labels), minlength=size)
+
+    def top_n(self, by, n=10, measure='total_sales'):
+        """The n groups with the largest `measure`, in descending order (argpartition, no full sort)"""
+        df = self.group_by(by)
+        if len(df) > n:
+            df = df.iloc[np.argpartition(-df[measure].to_numpy(), n - 1)[:n]]
+        return df.sort_values(measure, ascending=False).reset_index(drop=True)
+
+
+def load_sales_cube(chunk_rows=CUBE_CHUNK_ROWS):
+    """
+    Load gold.fact_sales with its dimension attributes into a SalesCube
+    The attributes are read once per product and customer key; the fact
+    columns stream from a server-side cursor chunk_rows rows at a time.
+    """
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(PRODUCT_ATTRIBUTES_QUERY)
+        products = cur.fetchall()
+        cur.execute(CUSTOMER_ATTRIBUTES_QUERY)
+        customers = cur.fetchall()
+        cur.close()
+
+        facts = conn.cursor(name='load_sales_cube')
+        facts.execute(FACT_QUERY)
+        cube = SalesCube.from_chunks(products, customers, iter(lambda: facts.fetchmany(chunk_rows), []))
+        facts.close()
+    return cube
+
+
+def cube_kpi_data(cube):
+    """
+    Answer the dashboard groupings in memory
+    Returns {grouping name: DataFrame} like kpi_data.load_kpi_data, so
+    kpi_data.chart_data can slice it for the chart functions
+    """
+    groupings = {
+        'category': ['category'],
+        'country': ['country'],
+        'month': ['month'],
+        'gender': ['gender'],
+        'marital_status': ['marital_status'],
+        'product_line': ['product_line'],
+        'product': ['product_name'],
+        'customer': ['customer_key', 'customer_name', 'country'],
+        'global': [],
+    }
+    return {name: cube.group_by(by) for name, by in groupings.items()}
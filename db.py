@@ -1,7 +1,13 @@
 """
 Database connection configuration for the Data Warehouse ETL
 """
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import pool
 
 DB_CONFIG = {
     'dbname': 'datawarehouse',
@@ -11,6 +17,21 @@ DB_CONFIG = {
     'password': '12345678'
 }
 
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+
+# Live gold schema, the shadow schema a zero-downtime build loads into, and
+# the previous version kept for rollback after a swap
+GOLD_SCHEMA = 'gold'
+GOLD_SHADOW_SCHEMA = 'gold_shadow'
+GOLD_PREVIOUS_SCHEMA = 'gold_previous'
+
+# Rows fetched per round trip by extracts running on a server-side cursor
+STREAM_ITERSIZE = 2000
+
+_pool = None
+_pool_pid = None
+
 
 def get_connection():
     """Create and return a database connection"""
@@ -19,6 +40,79 @@ def get_connection():
     return conn
 
 
+def get_pool(minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE):
+    """
+    Return the connection pool of the current process, creating it on first use
+    A forked worker process never reuses its parent's pool (sockets cannot be shared)
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = pool.ThreadedConnectionPool(minconn, maxconn, **DB_CONFIG)
+        _pool_pid = os.getpid()
+        print(f'Connection pool created ({minconn}-{maxconn} connections)')
+    return _pool
+
+
+def close_pool():
+    """Close every connection held by the pool of the current process"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.closeall()
+    _pool = None
+    _pool_pid = None
+
+
+def is_connection_healthy(conn):
+    """Check that a pooled connection is still usable"""
+    if conn.closed:
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def checkout_connection():
+    """Take a healthy connection from the pool, replacing dead ones"""
+    connection_pool = get_pool()
+    conn = connection_pool.getconn()
+    while not is_connection_healthy(conn):
+        connection_pool.putconn(conn, close=True)
+        conn = connection_pool.getconn()
+    return conn
+
+
+def release_connection(conn):
+    """Return a connection to the pool with its session state reset"""
+    connection_pool = get_pool()
+    if conn.closed:
+        connection_pool.putconn(conn, close=True)
+        return
+    try:
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute("RESET ALL")
+        cur.close()
+        conn.commit()
+        connection_pool.putconn(conn)
+    except psycopg2.Error:
+        connection_pool.putconn(conn, close=True)
+
+
+@contextmanager
+def pooled_connection():
+    """Check out a pooled connection for the duration of a with block"""
+    conn = checkout_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
 def create_silver_tables(conn):
     """Create silver layer tables"""
     cur = conn.cursor()
@@ -93,6 +187,16 @@ def create_silver_tables(conn):
         );
     """)
     
+    # High-water marks for the incremental (watermark-based) refresh
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS silver.etl_watermarks (
+            table_name TEXT PRIMARY KEY,
+            watermark_column TEXT,
+            high_water_mark TEXT,
+            updated_at TIMESTAMPTZ DEFAULT now()
+        );
+    """)
+    
     conn.commit()
     cur.close()
     print("Silver tables created successfully")
@@ -116,14 +220,53 @@ def truncate_silver_tables(conn):
     print("Silver tables truncated")
 
 
-def create_gold_tables(conn):
-    """Create gold layer tables (Star Schema)"""
+# Secondary indexes and foreign keys of the star schema, dropped and rebuilt
+# around bulk gold loads (see deferred_gold_indexes); {schema} is the target schema
+GOLD_INDEXES = {
+    'idx_fact_sales_customer': "CREATE INDEX IF NOT EXISTS idx_fact_sales_customer ON {schema}.fact_sales(customer_key);",
+    'idx_fact_sales_product': "CREATE INDEX IF NOT EXISTS idx_fact_sales_product ON {schema}.fact_sales(product_key);",
+    'idx_fact_sales_order_date': "CREATE INDEX IF NOT EXISTS idx_fact_sales_order_date ON {schema}.fact_sales(order_date);",
+    'idx_dim_customers_number': "CREATE INDEX IF NOT EXISTS idx_dim_customers_number ON {schema}.dim_customers(customer_number);",
+    'idx_dim_products_number': "CREATE INDEX IF NOT EXISTS idx_dim_products_number ON {schema}.dim_products(product_number);",
+}
+
+# Indexes dropped during a gold load (deferred_gold_indexes): only those of
+# fact_sales. The dimensions are small and loaded first, and the fact load
+# looks product versions up by product_number.
+DEFERRED_GOLD_INDEXES = ['idx_fact_sales_customer', 'idx_fact_sales_product', 'idx_fact_sales_order_date']
+
+GOLD_FOREIGN_KEYS = {
+    'fact_sales_product_key_fkey': "FOREIGN KEY (product_key) REFERENCES {schema}.dim_products(product_key)",
+    'fact_sales_customer_key_fkey': "FOREIGN KEY (customer_key) REFERENCES {schema}.dim_customers(customer_key)",
+}
+
+
+GOLD_PRODUCT_VERSION_COLUMNS = {
+    'row_hash': 'TEXT',
+    'valid_from': 'DATE',
+    'valid_to': 'DATE',
+    'is_current': 'BOOLEAN DEFAULT TRUE',
+}
+
+
+def migrate_gold_product_columns(cur, schema=GOLD_SCHEMA):
+    """Add the type 2 history columns of dim_products to a table created before them"""
+    for column, definition in GOLD_PRODUCT_VERSION_COLUMNS.items():
+        cur.execute(f"ALTER TABLE {schema}.dim_products ADD COLUMN IF NOT EXISTS {column} {definition};")
+
+
+def create_gold_tables(conn, schema=GOLD_SCHEMA, partitioned=False):
+    """
+    Create gold layer tables (Star Schema) in the gold schema or a shadow schema
+    With partitioned=True fact_sales is range-partitioned by order_date month
+    (an existing unpartitioned fact_sales is dropped and recreated)
+    """
     cur = conn.cursor()
     
-    cur.execute("CREATE SCHEMA IF NOT EXISTS gold;")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
     
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS gold.dim_customers (
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.dim_customers (
             customer_key SERIAL PRIMARY KEY,
             customer_id INTEGER,
             customer_number TEXT,
@@ -138,8 +281,8 @@ def create_gold_tables(conn):
         );
     """)
     
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS gold.dim_products (
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.dim_products (
             product_key SERIAL PRIMARY KEY,
             product_id INTEGER,
             product_number TEXT,
@@ -151,16 +294,28 @@ def create_gold_tables(conn):
             cost INTEGER,
             product_line TEXT,
             start_date DATE,
-            dwh_create_date TIMESTAMPTZ DEFAULT now()
+            dwh_create_date TIMESTAMPTZ DEFAULT now(),
+            row_hash TEXT,
+            valid_from DATE,
+            valid_to DATE,
+            is_current BOOLEAN DEFAULT TRUE
         );
     """)
     
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS gold.fact_sales (
-            sale_key SERIAL PRIMARY KEY,
+    migrate_gold_product_columns(cur, schema)
+    
+    if partitioned and table_exists(conn, f"{schema}.fact_sales") \
+            and not is_partitioned(conn, f"{schema}.fact_sales"):
+        cur.execute(f"DROP TABLE {schema}.fact_sales;")
+    
+    # A partitioned table's primary key would have to include order_date,
+    # which is NULL for some sales (they go to the default partition)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.fact_sales (
+            sale_key SERIAL{'' if partitioned else ' PRIMARY KEY'},
             order_number TEXT,
-            product_key INTEGER REFERENCES gold.dim_products(product_key),
-            customer_key INTEGER REFERENCES gold.dim_customers(customer_key),
+            product_key INTEGER REFERENCES {schema}.dim_products(product_key),
+            customer_key INTEGER REFERENCES {schema}.dim_customers(customer_key),
             order_date DATE,
             shipping_date DATE,
             due_date DATE,
@@ -168,26 +323,262 @@ def create_gold_tables(conn):
             quantity INTEGER,
             price INTEGER,
             dwh_create_date TIMESTAMPTZ DEFAULT now()
-        );
+        ){' PARTITION BY RANGE (order_date)' if partitioned else ''};
     """)
+    if partitioned:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {schema}.fact_sales_default "
+                    f"PARTITION OF {schema}.fact_sales DEFAULT;")
     
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_sales_customer ON gold.fact_sales(customer_key);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_sales_product ON gold.fact_sales(product_key);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_sales_order_date ON gold.fact_sales(order_date);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_dim_customers_number ON gold.dim_customers(customer_number);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_dim_products_number ON gold.dim_products(product_number);")
+    for index_sql in GOLD_INDEXES.values():
+        cur.execute(index_sql.format(schema=schema))
     
     conn.commit()
     cur.close()
     print("Gold tables (Star Schema) created successfully")
 
 
-def truncate_gold_tables(conn):
-    """Truncate all gold tables before reload"""
+def table_exists(conn, table):
+    """Check whether a (schema-qualified) table exists"""
     cur = conn.cursor()
-    cur.execute("TRUNCATE TABLE gold.fact_sales CASCADE;")
-    cur.execute("TRUNCATE TABLE gold.dim_customers CASCADE;")
-    cur.execute("TRUNCATE TABLE gold.dim_products CASCADE;")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    exists = cur.fetchone()[0]
+    cur.close()
+    return exists
+
+
+def is_partitioned(conn, table):
+    """Check whether a (schema-qualified) table is a partitioned table"""
+    cur = conn.cursor()
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    cur.close()
+    return bool(row and row[0])
+
+
+def fact_partition_name(month_start):
+    """Name of the fact_sales partition holding one order month"""
+    return f"fact_sales_p{month_start:%Y%m}"
+
+
+def create_fact_partitions(conn, months, schema=GOLD_SCHEMA):
+    """
+    Create the missing monthly partitions of a partitioned fact_sales
+    months: [start, end) date ranges, e.g. from get_order_month_chunks.
+    Returns the number of partitions created.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (f"{schema}.fact_sales",))
+    existing = {row[0] for row in cur.fetchall()}
+    
+    created = 0
+    for start, end in months:
+        partition = fact_partition_name(start)
+        if partition in existing:
+            continue
+        cur.execute(f"""
+            CREATE TABLE {schema}.{partition} PARTITION OF {schema}.fact_sales
+            FOR VALUES FROM (%s) TO (%s)
+        """, (start, end))
+        created += 1
+    conn.commit()
+    cur.close()
+    return created
+
+
+def truncate_gold_tables(conn, schema=GOLD_SCHEMA):
+    """
+    Truncate gold tables before reload
+    dim_products keeps its Type 2 version history and is maintained incrementally
+    """
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE TABLE {schema}.fact_sales CASCADE;")
+    cur.execute(f"TRUNCATE TABLE {schema}.dim_customers CASCADE;")
     conn.commit()
     cur.close()
     print("Gold tables truncated")
+
+
+def drop_gold_indexes(conn, schema=GOLD_SCHEMA):
+    """Drop the secondary indexes and foreign keys of fact_sales before a bulk load"""
+    cur = conn.cursor()
+    for constraint in GOLD_FOREIGN_KEYS:
+        cur.execute(f"ALTER TABLE {schema}.fact_sales DROP CONSTRAINT IF EXISTS {constraint};")
+    for index in DEFERRED_GOLD_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {schema}.{index};")
+    conn.commit()
+    cur.close()
+    print("Gold indexes and foreign keys dropped")
+
+
+def create_gold_index(index_sql):
+    """Build one gold index on its own pooled connection"""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(index_sql)
+        conn.commit()
+        cur.close()
+
+
+def rebuild_gold_indexes(conn, parallel=True, schema=GOLD_SCHEMA):
+    """
+    Recreate the fact_sales secondary indexes and foreign keys, then ANALYZE
+    Index builds only take SHARE locks, so with parallel=True each one runs on
+    its own connection at the same time. Foreign keys are added NOT VALID and
+    validated afterwards, which checks existing rows without blocking readers.
+    """
+    index_statements = [GOLD_INDEXES[index].format(schema=schema) for index in DEFERRED_GOLD_INDEXES]
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(index_statements)) as executor:
+            list(executor.map(create_gold_index, index_statements))
+    else:
+        for index_sql in index_statements:
+            create_gold_index(index_sql)
+    
+    # Partitioned tables do not support NOT VALID foreign keys
+    not_valid = '' if is_partitioned(conn, f"{schema}.fact_sales") else ' NOT VALID'
+    cur = conn.cursor()
+    for constraint, definition in GOLD_FOREIGN_KEYS.items():
+        definition = definition.format(schema=schema)
+        cur.execute(f"ALTER TABLE {schema}.fact_sales DROP CONSTRAINT IF EXISTS {constraint};")
+        cur.execute(f"ALTER TABLE {schema}.fact_sales ADD CONSTRAINT {constraint} {definition}{not_valid};")
+        if not_valid:
+            cur.execute(f"ALTER TABLE {schema}.fact_sales VALIDATE CONSTRAINT {constraint};")
+    
+    cur.execute(f"ANALYZE {schema}.dim_customers;")
+    cur.execute(f"ANALYZE {schema}.dim_products;")
+    cur.execute(f"ANALYZE {schema}.fact_sales;")
+    conn.commit()
+    cur.close()
+    print("Gold indexes and foreign keys rebuilt")
+
+
+@contextmanager
+def deferred_gold_indexes(conn, parallel=True, schema=GOLD_SCHEMA):
+    """
+    Run a gold load without secondary indexes and foreign keys
+    They are rebuilt when the block exits, also when the load fails; the load's
+    open transaction is rolled back first so the rebuild is not blocked by it.
+    A rebuild failing after a failed load is reported and the load's error re-raised.
+    """
+    drop_gold_indexes(conn, schema)
+    try:
+        yield
+    except BaseException:
+        try:
+            conn.rollback()
+            rebuild_gold_indexes(conn, parallel, schema)
+        except Exception as e:
+            print(f"❌ Gold indexes not rebuilt after the failed load: {e}")
+        raise
+    conn.rollback()
+    rebuild_gold_indexes(conn, parallel, schema)
+
+
+def stamp_gold_load_version(conn, schema=GOLD_SCHEMA):
+    """
+    Record a new load version for a finished gold load and return it
+    The version lives in the gold schema itself, so a shadow load publishes it
+    together with the data at swap time. Dashboard caches are keyed on it.
+    """
+    version = uuid.uuid4().hex
+    cur = conn.cursor()
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.etl_load_version (
+            load_version TEXT NOT NULL,
+            loaded_at TIMESTAMPTZ DEFAULT now()
+        );
+    """)
+    cur.execute(f"DELETE FROM {schema}.etl_load_version;")
+    cur.execute(f"INSERT INTO {schema}.etl_load_version (load_version) VALUES (%s);", (version,))
+    conn.commit()
+    cur.close()
+    return version
+
+
+def get_gold_load_version(conn):
+    """Return the version of the live gold load (None if gold was never stamped)"""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT load_version FROM {GOLD_SCHEMA}.etl_load_version;")
+        row = cur.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        row = None
+    conn.rollback()
+    cur.close()
+    return row[0] if row else None
+
+
+def schema_exists(conn, schema):
+    """Check whether a schema exists"""
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", (schema,))
+    exists = cur.fetchone() is not None
+    cur.close()
+    return exists
+
+
+def create_gold_shadow_schema(conn, partitioned=False):
+    """
+    Create a shadow copy of the star schema to build the next gold version in
+    Tables start empty except dim_products, whose version history is carried over
+    """
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {GOLD_SHADOW_SCHEMA} CASCADE;")
+    conn.commit()
+    create_gold_tables(conn, GOLD_SHADOW_SCHEMA, partitioned)
+    
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{GOLD_SCHEMA}.dim_products",))
+    if cur.fetchone()[0]:
+        # The live table may predate the history columns copied below
+        migrate_gold_product_columns(cur)
+        columns = """product_key, product_id, product_number, product_name, category_id, category,
+                     subcategory, maintenance, cost, product_line, start_date, dwh_create_date,
+                     row_hash, valid_from, valid_to, is_current"""
+        cur.execute(f"""
+            INSERT INTO {GOLD_SHADOW_SCHEMA}.dim_products ({columns})
+            SELECT {columns} FROM {GOLD_SCHEMA}.dim_products
+        """)
+        cur.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{GOLD_SHADOW_SCHEMA}.dim_products', 'product_key'),
+                          COALESCE(MAX(product_key), 0) + 1, false)
+            FROM {GOLD_SHADOW_SCHEMA}.dim_products
+        """)
+        conn.commit()
+    cur.close()
+
+
+def swap_gold_schema(conn):
+    """
+    Publish the shadow schema as gold in one transaction
+    The live version is kept as gold_previous for rollback_gold_schema. Readers
+    see either the old or the new star schema, never a partially loaded one.
+    """
+    cur = conn.cursor()
+    if schema_exists(conn, GOLD_SCHEMA):
+        cur.execute(f"DROP SCHEMA IF EXISTS {GOLD_PREVIOUS_SCHEMA} CASCADE;")
+        cur.execute(f"ALTER SCHEMA {GOLD_SCHEMA} RENAME TO {GOLD_PREVIOUS_SCHEMA};")
+    cur.execute(f"ALTER SCHEMA {GOLD_SHADOW_SCHEMA} RENAME TO {GOLD_SCHEMA};")
+    conn.commit()
+    cur.close()
+    print(f"✓ Gold schema swapped (previous version kept as {GOLD_PREVIOUS_SCHEMA})")
+
+
+def rollback_gold_schema(conn):
+    """Restore the gold version kept by the last swap_gold_schema"""
+    if not schema_exists(conn, GOLD_PREVIOUS_SCHEMA):
+        print(f"❌ No previous gold version ({GOLD_PREVIOUS_SCHEMA}) to roll back to")
+        return False
+    
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {GOLD_SHADOW_SCHEMA} CASCADE;")
+    cur.execute(f"ALTER SCHEMA {GOLD_SCHEMA} RENAME TO {GOLD_SHADOW_SCHEMA};")
+    cur.execute(f"ALTER SCHEMA {GOLD_PREVIOUS_SCHEMA} RENAME TO {GOLD_SCHEMA};")
+    conn.commit()
+    cur.close()
+    print(f"✓ Gold schema rolled back (rejected version kept as {GOLD_SHADOW_SCHEMA})")
+    return True
@@ -1,8 +1,12 @@
 from pygrametl.datasources import SQLSource
-from pygrametl.tables import Dimension
+from pygrametl.tables import CachedDimension, Dimension
 
+from db import STREAM_ITERSIZE, GOLD_SCHEMA
+from metrics import current_stage
+from pipelined import run_pipelined
 
-def extract_dim_customers(conn):
+
+def extract_dim_customers(conn, streaming=False, itersize=STREAM_ITERSIZE):
     """
     Extract and join customer data from Silver layer
     Combines: crm_cust_info + erp_cust_az12 + erp_loc_a101
@@ -28,45 +32,112 @@ def extract_dim_customers(conn):
             ON ci.cst_key = la.cid
         ORDER BY ci.cst_id
     """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_dim_customers', fetchsize=itersize)
     return SQLSource(connection=conn, query=query)
 
 
-def load_dim_customers(conn_wrapper, source_conn):
-    """Load customers dimension into Gold layer"""
+CUSTOMER_ATTRIBUTES = ['customer_id', 'customer_number', 'first_name', 'last_name',
+                       'country', 'marital_status', 'gender', 'birthdate', 'create_date']
+
+
+def transform_dim_customer_row(row):
+    """Replace missing country and gender by 'n/a'"""
+    row['country'] = row['country'] if row['country'] else 'n/a'
+    row['gender'] = row['gender'] if row['gender'] else 'n/a'
+    return row
+
+
+def upsert_dim_customer(dim_customers, row):
+    """
+    Insert a new customer or update a changed one in place, keeping its customer_key
+    Returns 'new', 'updated' or 'unchanged'.
+    """
+    customer_key = dim_customers.lookup(row)
+    if customer_key is None:
+        dim_customers.insert(row)
+        return 'new'
+    existing = dim_customers.getbykey(customer_key)
+    if all(existing[att] == row[att] for att in CUSTOMER_ATTRIBUTES):
+        return 'unchanged'
+    row['customer_key'] = customer_key
+    dim_customers.update(row)
+    return 'updated'
+
+
+def load_dim_customers(conn_wrapper, source_conn, streaming=False, itersize=STREAM_ITERSIZE, upsert=False,
+                       pipelined=False):
+    """
+    Load customers dimension into Gold layer
+    With upsert=True existing customers keep their customer_key: changed ones
+    are updated in place and only new ones are inserted (no truncate needed).
+    pipelined=True overlaps reads, transforms and inserts (plain load only) and
+    extracts on a server-side cursor.
+    """
     print("  Extracting customer dimension from Silver...")
-    source = extract_dim_customers(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_dim_customers(source_conn, streaming or pipelined, itersize))
     
-    dim_customers = Dimension(
-        name='dim_customers',
-        key='customer_key',
-        attributes=['customer_id', 'customer_number', 'first_name', 'last_name',
-                   'country', 'marital_status', 'gender', 'birthdate', 'create_date'],
-        lookupatts=['customer_id'],
-        targetconnection=conn_wrapper
-    )
+    if upsert:
+        # Whole dimension cached up front, so lookups and comparisons stay in memory
+        dim_customers = CachedDimension(
+            name='dim_customers',
+            key='customer_key',
+            attributes=CUSTOMER_ATTRIBUTES,
+            lookupatts=['customer_id'],
+            size=0,
+            prefill=True,
+            cachefullrows=True,
+            targetconnection=conn_wrapper
+        )
+    else:
+        dim_customers = Dimension(
+            name='dim_customers',
+            key='customer_key',
+            attributes=CUSTOMER_ATTRIBUTES,
+            lookupatts=['customer_id'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
+    updated = 0
+    unchanged = 0
     print("  Loading dim_customers...")
-    for row in source:
-        row = dict(row)
-        row['country'] = row['country'] if row['country'] else 'n/a'
-        row['gender'] = row['gender'] if row['gender'] else 'n/a'
-        
-        dim_customers.insert(row)
-        count += 1
-        
-        if count % 5000 == 0:
-            print(f"    Loaded {count:,} customers...")
+    if pipelined and not upsert:
+        count = run_pipelined(source, transform_dim_customer_row, dim_customers.insert)
+    else:
+        for row in source:
+            row = stage.transform(transform_dim_customer_row, dict(row))
+            
+            if upsert:
+                action = upsert_dim_customer(dim_customers, row)
+                if action == 'updated':
+                    updated += 1
+                    continue
+                if action == 'unchanged':
+                    unchanged += 1
+                    continue
+            else:
+                dim_customers.insert(row)
+            count += 1
+            
+            if count % 5000 == 0:
+                print(f"    Loaded {count:,} customers...")
     
     conn_wrapper.commit()
-    print(f"  ✓ Loaded {count} rows into gold.dim_customers")
+    stage.rows_skipped = unchanged
+    if upsert:
+        print(f"  ✓ Upserted gold.dim_customers: {count} new, {updated} updated")
+    else:
+        print(f"  ✓ Loaded {count} rows into gold.dim_customers")
     return count
 
 
-def get_customer_key_lookup(conn):
+def get_customer_key_lookup(conn, schema=GOLD_SCHEMA):
     """Get customer_id to customer_key mapping for fact table loading"""
     cur = conn.cursor()
-    cur.execute("SELECT customer_id, customer_key FROM gold.dim_customers")
+    cur.execute(f"SELECT customer_id, customer_key FROM {schema}.dim_customers")
     lookup = {row[0]: row[1] for row in cur.fetchall()}
     cur.close()
     return lookup
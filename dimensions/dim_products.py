@@ -1,12 +1,22 @@
+import hashlib
+from datetime import date, timedelta
+
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension
 
+from db import STREAM_ITERSIZE, GOLD_SCHEMA
+from metrics import current_stage
+
+# Attributes whose change creates a new product version (SCD Type 2)
+TRACKED_ATTRIBUTES = ['product_id', 'product_name', 'category_id', 'category',
+                      'subcategory', 'maintenance', 'cost', 'product_line']
+
 
-def extract_dim_products(conn):
+def extract_dim_products(conn, streaming=False, itersize=STREAM_ITERSIZE):
     """
     Extract and join product data from Silver layer
     Combines: crm_prd_info + erp_px_cat_g1v2
-    Filters out historical data (only current products where prd_end_dt IS NULL)
+    Every product version is extracted, oldest first, for the Type 2 history
     """
     query = """
         SELECT
@@ -23,29 +33,102 @@ def extract_dim_products(conn):
         FROM silver.crm_prd_info pn
         LEFT JOIN silver.erp_px_cat_g1v2 pc
             ON pn.cat_id = pc.id
-        WHERE pn.prd_end_dt IS NULL
-        ORDER BY pn.prd_start_dt, pn.prd_key
+        ORDER BY pn.prd_key, pn.prd_start_dt
     """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_dim_products', fetchsize=itersize)
     return SQLSource(connection=conn, query=query)
 
 
-def load_dim_products(conn_wrapper, source_conn):
-    """Load products dimension into Gold layer"""
+def product_row_hash(row):
+    """MD5 of the tracked attributes of a product version"""
+    values = ['\\N' if row[att] is None else str(row[att]) for att in TRACKED_ATTRIBUTES]
+    return hashlib.md5('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def get_current_product_versions(conn, schema=GOLD_SCHEMA):
+    """Get product_number to (product_key, row_hash, start_date, valid_from) of the current versions"""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT product_number, product_key, row_hash, start_date, valid_from
+        FROM {schema}.dim_products
+        WHERE is_current
+    """)
+    versions = {row[0]: row[1:] for row in cur.fetchall()}
+    cur.close()
+    return versions
+
+
+def classify_product_version(row, version, today):
+    """
+    Decide what a source product version does to the dimension
+    version: the current (product_key, row_hash, start_date, valid_from) or None
+    Returns (action, valid_from) where action is
+      'new'        first version of the product, valid from its start date
+      'unchanged'  older source version or same row_hash (valid_from None)
+      'version'    close the current version the day before valid_from and insert
+      'update'     a change starting on (or before) the current version's own
+                   valid_from, e.g. a second in-place change the same day: the
+                   current version is updated in place
+    """
+    start_date = row['start_date']
+    if version is None:
+        return 'new', start_date
+    
+    _, row_hash, current_start, current_from = version
+    # Source start dates are compared with the current version's own
+    # start_date: its valid_from is today after an in-place change
+    if start_date is not None and current_start is not None and start_date < current_start:
+        # Older source version, already part of the history
+        return 'unchanged', None
+    if row_hash == row['row_hash']:
+        return 'unchanged', None
+    
+    # Changed: a newer source version starts on its own date, an in-place
+    # change of the current version starts today (as does a newer source
+    # version dated before the current version's valid_from)
+    valid_from = start_date
+    if start_date is None or current_start is None or start_date <= current_start \
+            or (current_from is not None and start_date <= current_from):
+        valid_from = today
+    if current_from is not None and valid_from <= current_from:
+        return 'update', current_from
+    return 'version', valid_from
+
+
+def load_dim_products(conn_wrapper, source_conn, target_conn, streaming=False, itersize=STREAM_ITERSIZE,
+                      schema=GOLD_SCHEMA):
+    """
+    Load products dimension into Gold layer as a Type 2 slowly changing dimension
+    Each product version is compared to the current one by the hash of its
+    tracked attributes: unchanged products are skipped, changed ones get their
+    current version closed (valid_to, is_current) and a new version inserted
+    (see classify_product_version)
+    """
+    print("  Reading current product versions...")
+    current = get_current_product_versions(target_conn, schema)
+    
     print("  Extracting product dimension from Silver...")
-    source = extract_dim_products(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_dim_products(source_conn, streaming, itersize))
     
     # Define the dimension table with surrogate key
     dim_products = Dimension(
         name='dim_products',
         key='product_key',
         attributes=['product_id', 'product_number', 'product_name', 'category_id',
-                   'category', 'subcategory', 'maintenance', 'cost', 'product_line', 
-                   'start_date'],
-        lookupatts=['product_number'],
+                   'category', 'subcategory', 'maintenance', 'cost', 'product_line',
+                   'start_date', 'row_hash', 'valid_from', 'valid_to', 'is_current'],
+        lookupatts=['product_number', 'valid_from'],
         targetconnection=conn_wrapper
     )
     
     count = 0
+    unchanged = 0
+    updated = 0
+    closed = []
+    today = date.today()
     print("  Loading dim_products...")
     for row in source:
         row = dict(row)
@@ -54,19 +137,70 @@ def load_dim_products(conn_wrapper, source_conn):
         row['subcategory'] = row['subcategory'] if row['subcategory'] else 'n/a'
         row['maintenance'] = row['maintenance'] if row['maintenance'] else 'n/a'
         row['cost'] = row['cost'] if row['cost'] is not None else 0
+        row['row_hash'] = product_row_hash(row)
         
-        dim_products.insert(row)
-        count += 1
+        version = current.get(row['product_number'])
+        action, valid_from = classify_product_version(row, version, today)
+        if action == 'unchanged':
+            unchanged += 1
+            continue
+        
+        row['valid_from'] = valid_from
+        row['valid_to'] = None
+        row['is_current'] = True
+        if action == 'update':
+            row['product_key'] = version[0]
+            dim_products.update(row)
+            updated += 1
+        else:
+            if action == 'version':
+                closed.append((valid_from - timedelta(days=1), version[0]))
+            row['product_key'] = dim_products.insert(row)
+            count += 1
+        current[row['product_number']] = (row['product_key'], row['row_hash'], row['start_date'], valid_from)
+    
+    if closed:
+        cur = target_conn.cursor()
+        cur.executemany(
+            f"UPDATE {schema}.dim_products SET valid_to = %s, is_current = FALSE WHERE product_key = %s",
+            closed
+        )
+        cur.close()
     
     conn_wrapper.commit()
-    print(f"  ✓ Loaded {count} rows into gold.dim_products")
+    stage.rows_skipped = unchanged
+    print(f"  ✓ Loaded {count} product versions into gold.dim_products "
+          f"({len(closed)} closed, {updated} updated in place, {unchanged} unchanged)")
     return count
 
 
-def get_product_key_lookup(conn):
-    """Get product_number to product_key mapping for fact table loading"""
+def get_product_version_lookup(conn, schema=GOLD_SCHEMA):
+    """Get product_number to [(valid_from, valid_to, product_key, is_current)] for fact table loading"""
     cur = conn.cursor()
-    cur.execute("SELECT product_number, product_key FROM gold.dim_products")
-    lookup = {row[0]: row[1] for row in cur.fetchall()}
+    cur.execute(f"""
+        SELECT product_number, valid_from, valid_to, product_key, is_current
+        FROM {schema}.dim_products
+        ORDER BY product_number, valid_from NULLS FIRST, product_key
+    """)
+    lookup = {}
+    for row in cur.fetchall():
+        lookup.setdefault(row[0], []).append(row[1:])
     cur.close()
     return lookup
+
+
+def resolve_product_key(versions, order_date):
+    """
+    Pick the product version valid on order_date
+    Orders outside every version's validity (or without a date) use the current version
+    """
+    if not versions:
+        return None
+    if order_date is not None:
+        for valid_from, valid_to, product_key, _ in versions:
+            if (valid_from is None or valid_from <= order_date) and (valid_to is None or order_date <= valid_to):
+                return product_key
+    for _, _, product_key, is_current in reversed(versions):
+        if is_current:
+            return product_key
+    return versions[-1][2]
@@ -1,13 +1,19 @@
+from datetime import timedelta
+
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import FactTable
 
 from dimensions.dim_customers import get_customer_key_lookup
-from dimensions.dim_products import get_product_key_lookup
+from dimensions.dim_products import get_product_version_lookup, resolve_product_key
+from db import STREAM_ITERSIZE, GOLD_SCHEMA, table_exists, is_partitioned, fact_partition_name
+from metrics import current_stage
+from pipelined import run_pipelined
 
 
-def extract_fact_sales(conn):
+def extract_fact_sales(conn, streaming=False, itersize=STREAM_ITERSIZE, window=None):
     """
     Extract sales data from Silver layer
+    window: optional {'low': date, 'high': date} order date range (inclusive)
     """
     query = """
         SELECT
@@ -22,22 +28,35 @@ def extract_fact_sales(conn):
             sls_price AS price
         FROM silver.crm_sales_details
     """
-    return SQLSource(connection=conn, query=query)
+    if window is not None:
+        query += "    WHERE sls_order_dt >= %(low)s AND sls_order_dt <= %(high)s\n"
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_fact_sales',
+                         fetchsize=itersize, parameters=window)
+    return SQLSource(connection=conn, query=query, parameters=window)
 
 
-def load_fact_sales(conn_wrapper, source_conn, target_conn):
-    """Load sales fact table into Gold layer with dimension key lookups"""
+def load_fact_sales(conn_wrapper, source_conn, target_conn, streaming=False, itersize=STREAM_ITERSIZE,
+                    schema=GOLD_SCHEMA, window=None, pipelined=False):
+    """
+    Load sales fact table into Gold layer with dimension key lookups
+    window: only load the sales of an order date range (see delete_fact_sales_window)
+    pipelined: overlap reads, key lookups and inserts, extracting on a
+    server-side cursor (see pipelined.py)
+    """
     print("  Building dimension key lookups...")
     
     # Get dimension key mappings
-    customer_lookup = get_customer_key_lookup(target_conn)
-    product_lookup = get_product_key_lookup(target_conn)
+    customer_lookup = get_customer_key_lookup(target_conn, schema)
+    product_lookup = get_product_version_lookup(target_conn, schema)
     
     print(f"    → Customer keys: {len(customer_lookup)}")
-    print(f"    → Product keys: {len(product_lookup)}")
+    print(f"    → Product keys: {sum(len(versions) for versions in product_lookup.values())}")
     
     print("  Extracting sales facts from Silver...")
-    source = extract_fact_sales(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_fact_sales(source_conn, streaming or pipelined, itersize, window))
     
     # Define the fact table
     fact_sales = FactTable(
@@ -53,39 +72,51 @@ def load_fact_sales(conn_wrapper, source_conn, target_conn):
     missing_customers = set()
     missing_products = set()
     
-    print("  Loading fact_sales...")
-    for row in source:
-        row = dict(row)
+    def resolve_keys(row):
+        """Replace the natural keys by surrogate keys (None if a dimension member is missing)"""
+        nonlocal skipped
         
         # Lookup surrogate keys
         customer_id = row.pop('customer_id')
         product_number = row.pop('product_number')
         
         customer_key = customer_lookup.get(customer_id)
-        product_key = product_lookup.get(product_number)
+        # Product version valid on the order date (SCD Type 2)
+        product_key = resolve_product_key(product_lookup.get(product_number), row['order_date'])
         
         # Track missing dimension members
         if customer_key is None:
             missing_customers.add(customer_id)
             skipped += 1
-            continue
+            return None
             
         if product_key is None:
             missing_products.add(product_number)
             skipped += 1
-            continue
+            return None
         
         # Add surrogate keys to row
         row['customer_key'] = customer_key
         row['product_key'] = product_key
-        
-        fact_sales.insert(row)
-        count += 1
-        
-        if count % 10000 == 0:
-            print(f"    Loaded {count:,} sales records...")
+        return row
+    
+    print("  Loading fact_sales...")
+    if pipelined:
+        count = run_pipelined((dict(row) for row in source), resolve_keys, fact_sales.insert)
+    else:
+        for row in source:
+            row = stage.transform(resolve_keys, dict(row))
+            if row is None:
+                continue
+            
+            fact_sales.insert(row)
+            count += 1
+            
+            if count % 10000 == 0:
+                print(f"    Loaded {count:,} sales records...")
     
     conn_wrapper.commit()
+    stage.rows_skipped = skipped
     
     print(f"  ✓ Loaded {count} rows into gold.fact_sales")
     
@@ -97,3 +128,218 @@ def load_fact_sales(conn_wrapper, source_conn, target_conn):
             print(f"    → {len(missing_products)} unknown product numbers")
     
     return count
+
+
+# Dimension members keyed like get_customer_key_lookup / resolve_product_key
+# (one surrogate key per fact row, so the joins never fan out): the product
+# version valid on the order date, else the current one; {schema} is the gold
+# schema being loaded
+FACT_SALES_JOIN = """
+    FROM silver.crm_sales_details s
+    LEFT JOIN (
+        SELECT DISTINCT ON (customer_id) customer_id, customer_key
+        FROM {schema}.dim_customers
+        ORDER BY customer_id, customer_key DESC
+    ) c ON c.customer_id = s.sls_cust_id
+    LEFT JOIN LATERAL (
+        SELECT d.product_key
+        FROM {schema}.dim_products d
+        WHERE d.product_number = s.sls_prd_key
+        ORDER BY
+            (s.sls_order_dt >= COALESCE(d.valid_from, '-infinity')
+             AND s.sls_order_dt <= COALESCE(d.valid_to, 'infinity')) IS TRUE DESC,
+            d.is_current DESC,
+            d.product_key DESC
+        LIMIT 1
+    ) p ON TRUE
+"""
+
+
+# Distinct customer IDs and product numbers of the silver sales the fact join
+# cannot resolve (a NULL ID counts as one). Same accounting as the row-wise
+# load: a row with an unknown customer is reported as a missing customer,
+# otherwise as a missing product. The product lookup of FACT_SALES_JOIN finds
+# a version whenever the product number exists, so existence is all it takes.
+MISSING_FACT_KEYS = """
+    SELECT
+        COUNT(DISTINCT sls_cust_id) FILTER (WHERE NOT has_customer)
+            + COALESCE(BOOL_OR(sls_cust_id IS NULL) FILTER (WHERE NOT has_customer), FALSE)::int,
+        COUNT(DISTINCT sls_prd_key) FILTER (WHERE has_customer)
+            + COALESCE(BOOL_OR(sls_prd_key IS NULL) FILTER (WHERE has_customer), FALSE)::int
+    FROM (
+        SELECT
+            s.sls_cust_id,
+            s.sls_prd_key,
+            COALESCE(s.sls_cust_id IN (SELECT customer_id FROM {schema}.dim_customers), FALSE) AS has_customer,
+            COALESCE(s.sls_prd_key IN (SELECT product_number FROM {schema}.dim_products), FALSE) AS has_product
+        FROM silver.crm_sales_details s
+        {where}
+    ) s
+    WHERE NOT (has_customer AND has_product)
+"""
+
+
+def get_order_month_chunks(conn):
+    """Return the [start, end) month ranges covering every silver order date"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT gs::date, (gs + INTERVAL '1 month')::date
+        FROM generate_series(
+            (SELECT DATE_TRUNC('month', MIN(sls_order_dt)) FROM silver.crm_sales_details),
+            (SELECT DATE_TRUNC('month', MAX(sls_order_dt)) FROM silver.crm_sales_details),
+            INTERVAL '1 month'
+        ) gs
+    """)
+    chunks = cur.fetchall()
+    cur.close()
+    return chunks
+
+
+def fact_sales_insert_sql(schema=GOLD_SCHEMA, target=None):
+    """INSERT ... SELECT loading resolved silver sales into fact_sales (or another target table)"""
+    target = target or f"{schema}.fact_sales"
+    return f"""
+        INSERT INTO {target} (
+            order_number, product_key, customer_key, order_date, shipping_date,
+            due_date, sales_amount, quantity, price
+        )
+        SELECT
+            s.sls_ord_num, p.product_key, c.customer_key, s.sls_order_dt, s.sls_ship_dt,
+            s.sls_due_dt, s.sls_sales, s.sls_quantity, s.sls_price
+        {FACT_SALES_JOIN.format(schema=schema)}
+        WHERE c.customer_key IS NOT NULL AND p.product_key IS NOT NULL
+    """
+
+
+def load_fact_sales_partition(target_conn, start, end, schema=GOLD_SCHEMA):
+    """
+    Load one order month of a partitioned fact_sales without touching the others
+    The month is loaded into a standalone table, the month's current partition
+    (if any) is detached and dropped, and the new table attached in its place.
+    Not committed; returns the number of rows loaded.
+    """
+    partition = fact_partition_name(start)
+    staging = f"{partition}_load"
+    
+    cur = target_conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {schema}.{staging}")
+    cur.execute(f"CREATE TABLE {schema}.{staging} (LIKE {schema}.fact_sales INCLUDING DEFAULTS)")
+    cur.execute(fact_sales_insert_sql(schema, f"{schema}.{staging}")
+                + " AND s.sls_order_dt >= %s AND s.sls_order_dt < %s", (start, end))
+    count = cur.rowcount
+    
+    # A CHECK constraint matching the bounds lets ATTACH PARTITION skip its validation scan
+    cur.execute(f"""
+        ALTER TABLE {schema}.{staging} ADD CONSTRAINT {staging}_bounds
+        CHECK (order_date IS NOT NULL AND order_date >= %s AND order_date < %s)
+    """, (start, end))
+    if table_exists(target_conn, f"{schema}.{partition}"):
+        cur.execute(f"ALTER TABLE {schema}.fact_sales DETACH PARTITION {schema}.{partition}")
+        cur.execute(f"DROP TABLE {schema}.{partition}")
+    cur.execute(f"ALTER TABLE {schema}.{staging} RENAME TO {partition}")
+    cur.execute(f"""
+        ALTER TABLE {schema}.fact_sales ATTACH PARTITION {schema}.{partition}
+        FOR VALUES FROM (%s) TO (%s)
+    """, (start, end))
+    cur.execute(f"ALTER TABLE {schema}.{partition} DROP CONSTRAINT {staging}_bounds")
+    cur.close()
+    return count
+
+
+def reload_fact_sales_month(target_conn, month, schema=GOLD_SCHEMA):
+    """
+    Reload the facts of one order month (the month of the date `month`) from Silver
+    A partitioned fact_sales gets the month's partition swapped for a freshly
+    loaded one (load_fact_sales_partition); otherwise the month's facts are
+    deleted and reinserted. Committed; returns the number of rows loaded.
+    """
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    
+    if is_partitioned(target_conn, f"{schema}.fact_sales"):
+        count = load_fact_sales_partition(target_conn, start, end, schema)
+    else:
+        delete_fact_sales_window(target_conn, {'low': start, 'high': end - timedelta(days=1)}, schema)
+        cur = target_conn.cursor()
+        cur.execute(fact_sales_insert_sql(schema) + " AND s.sls_order_dt >= %s AND s.sls_order_dt < %s",
+                    (start, end))
+        count = cur.rowcount
+        cur.close()
+    
+    target_conn.commit()
+    return count
+
+
+def delete_fact_sales_window(target_conn, window, schema=GOLD_SCHEMA):
+    """Delete the facts of an order date range before it is reloaded (not committed)"""
+    cur = target_conn.cursor()
+    cur.execute(f"""
+        DELETE FROM {schema}.fact_sales
+        WHERE order_date >= %(low)s AND order_date <= %(high)s
+    """, window)
+    count = cur.rowcount
+    cur.close()
+    return count
+
+
+def load_fact_sales_set_based(target_conn, chunked=False, schema=GOLD_SCHEMA, window=None):
+    """
+    Load sales fact table into Gold layer with one server-side INSERT ... SELECT
+    The dimension joins happen in the database; with chunked=True the insert is
+    split into one statement per order month (plus one for NULL order dates),
+    each committed on its own. A partitioned fact_sales is then loaded
+    partition-wise with load_fact_sales_partition.
+    window: only load the sales of an order date range (chunked is ignored)
+    """
+    cur = target_conn.cursor()
+    window_filter = "s.sls_order_dt >= %(low)s AND s.sls_order_dt <= %(high)s"
+    where = 'WHERE ' + window_filter if window is not None else ''
+    
+    insert_sql = fact_sales_insert_sql(schema)
+    partition_wise = chunked and is_partitioned(target_conn, f"{schema}.fact_sales")
+    
+    print("  Loading fact_sales...")
+    count = 0
+    if window is not None:
+        cur.execute(insert_sql + " AND " + window_filter, window)
+        count = cur.rowcount
+    elif chunked:
+        for start, end in get_order_month_chunks(target_conn):
+            if partition_wise:
+                count += load_fact_sales_partition(target_conn, start, end, schema)
+            else:
+                cur.execute(insert_sql + " AND s.sls_order_dt >= %s AND s.sls_order_dt < %s", (start, end))
+                count += cur.rowcount
+            target_conn.commit()
+            print(f"    Loaded {start:%Y-%m}: {count:,} sales records so far...")
+        cur.execute(insert_sql + " AND s.sls_order_dt IS NULL")
+        count += cur.rowcount
+    else:
+        cur.execute(insert_sql)
+        count = cur.rowcount
+    
+    target_conn.commit()
+    
+    # Rows the insert dropped, without running the fact join a second time: the
+    # silver rows not loaded, broken down by cheap key lookups only if any
+    cur.execute(f"SELECT COUNT(*) FROM silver.crm_sales_details s {where}", window)
+    skipped = cur.fetchone()[0] - count
+    missing_customers = missing_products = 0
+    if skipped > 0:
+        cur.execute(MISSING_FACT_KEYS.format(schema=schema, where=where), window)
+        missing_customers, missing_products = cur.fetchone()
+    cur.close()
+    stage = current_stage()
+    stage.rows_skipped = skipped
+    stage.rows_in = count + skipped
+    
+    print(f"  ✓ Loaded {count} rows into gold.fact_sales")
+    
+    if skipped > 0:
+        print(f"  ⚠ Skipped {skipped} rows due to missing dimension keys")
+        if missing_customers:
+            print(f"    → {missing_customers} unknown customer IDs")
+        if missing_products:
+            print(f"    → {missing_products} unknown product numbers")
+    
+    return count
@@ -0,0 +1,174 @@
+"""
+Pre-aggregated KPI tables built at the end of each Gold load
+
+The dashboards read these small summary tables instead of scanning and joining
+gold.fact_sales at render time. Additive measures are kept as sums and counts
+so any roll-up of agg_sales_cube stays exact (averages are sum / count);
+distinct counts cannot be rolled up and get their own tables.
+"""
+from db import GOLD_SCHEMA, table_exists
+
+
+# aggregate table -> SELECT building it from the star schema ({schema} is the gold schema)
+KPI_AGGREGATES = {
+    # month × category × country × gender × marital status × product line
+    'agg_sales_cube': """
+        SELECT
+            DATE_TRUNC('month', f.order_date)::date AS month,
+            p.category,
+            c.country,
+            c.gender,
+            c.marital_status,
+            p.product_line,
+            SUM(f.sales_amount)::bigint AS total_sales,
+            SUM(f.quantity)::bigint AS total_quantity,
+            COUNT(*) AS nb_transactions,
+            COUNT(f.sales_amount) AS nb_sales,
+            SUM(f.price)::bigint AS price_sum,
+            COUNT(f.price) AS price_count
+        FROM {schema}.fact_sales f
+        JOIN {schema}.dim_products p ON f.product_key = p.product_key
+        JOIN {schema}.dim_customers c ON f.customer_key = c.customer_key
+        WHERE {condition}
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """,
+    'agg_sales_monthly': """
+        SELECT
+            DATE_TRUNC('month', f.order_date) AS month,
+            SUM(f.sales_amount) AS total_sales,
+            COUNT(DISTINCT f.order_number) AS nb_orders
+        FROM {schema}.fact_sales f
+        WHERE f.order_date IS NOT NULL AND {condition}
+        GROUP BY DATE_TRUNC('month', f.order_date)
+    """,
+    'agg_sales_by_product': """
+        SELECT
+            p.product_name,
+            SUM(f.sales_amount) AS total_sales,
+            SUM(f.quantity) AS total_quantity
+        FROM {schema}.fact_sales f
+        JOIN {schema}.dim_products p ON f.product_key = p.product_key
+        WHERE {condition}
+        GROUP BY p.product_name
+    """,
+    'agg_sales_by_customer': """
+        SELECT
+            c.customer_key,
+            c.first_name || ' ' || c.last_name AS customer_name,
+            c.country,
+            c.gender,
+            c.marital_status,
+            SUM(f.sales_amount) AS total_spent,
+            COUNT(DISTINCT f.order_number) AS nb_orders
+        FROM {schema}.fact_sales f
+        JOIN {schema}.dim_customers c ON f.customer_key = c.customer_key
+        WHERE {condition}
+        GROUP BY c.customer_key, c.first_name, c.last_name, c.country, c.gender, c.marital_status
+    """,
+    # Built last, from the aggregates above rather than from fact_sales. An
+    # order belongs to one customer, so its orders and customers are counted
+    # from agg_sales_by_customer.
+    'agg_sales_summary': """
+        SELECT
+            (SELECT SUM(total_sales) FROM {schema}.agg_sales_cube)::bigint AS total_revenue,
+            (SELECT SUM(nb_orders) FROM {schema}.agg_sales_by_customer)::bigint AS total_orders,
+            (SELECT COUNT(*) FROM {schema}.agg_sales_by_customer) AS total_customers,
+            (SELECT SUM(total_sales)::numeric / NULLIF(SUM(nb_sales), 0)
+             FROM {schema}.agg_sales_cube) AS avg_order_value,
+            (SELECT SUM(total_quantity) FROM {schema}.agg_sales_cube)::bigint AS total_units
+        WHERE {condition}
+    """,
+}
+
+# aggregate table -> (rows of it to replace, facts to rebuild them from) on a
+# window refresh; both read the affected keys collected in pg_temp.kpi_refresh_keys
+KPI_REFRESH_SCOPES = {
+    'agg_sales_cube': (
+        "month IN (SELECT month FROM pg_temp.kpi_refresh_keys)",
+        "DATE_TRUNC('month', f.order_date)::date IN (SELECT month FROM pg_temp.kpi_refresh_keys)",
+    ),
+    'agg_sales_monthly': (
+        "month IN (SELECT month FROM pg_temp.kpi_refresh_keys)",
+        "DATE_TRUNC('month', f.order_date)::date IN (SELECT month FROM pg_temp.kpi_refresh_keys)",
+    ),
+    'agg_sales_by_product': (
+        "product_name IN (SELECT p.product_name FROM {schema}.dim_products p "
+        "JOIN pg_temp.kpi_refresh_keys k ON p.product_key = k.product_key)",
+        "p.product_name IN (SELECT p.product_name FROM {schema}.dim_products p "
+        "JOIN pg_temp.kpi_refresh_keys k ON p.product_key = k.product_key)",
+    ),
+    'agg_sales_by_customer': (
+        "customer_key IN (SELECT customer_key FROM pg_temp.kpi_refresh_keys)",
+        "c.customer_key IN (SELECT customer_key FROM pg_temp.kpi_refresh_keys)",
+    ),
+    'agg_sales_summary': ("TRUE", "TRUE"),
+}
+
+# Customers whose attributes no longer match agg_sales_by_customer: updated in
+# place by the upsert, so their facts of every month are regrouped
+CHANGED_CUSTOMERS = """
+    SELECT a.customer_key
+    FROM {schema}.agg_sales_by_customer a
+    JOIN {schema}.dim_customers c ON a.customer_key = c.customer_key
+    WHERE (a.customer_name, a.country, a.gender, a.marital_status)
+          IS DISTINCT FROM (c.first_name || ' ' || c.last_name, c.country, c.gender, c.marital_status)
+"""
+
+
+def record_kpi_refresh_keys(conn, window, schema=GOLD_SCHEMA,
+                            condition="f.order_date >= %(low)s AND f.order_date <= %(high)s"):
+    """Add the order months, products and customers of the facts matching condition to pg_temp.kpi_refresh_keys"""
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS kpi_refresh_keys (month DATE, product_key INT, customer_key INT)
+    """)
+    cur.execute(f"""
+        INSERT INTO pg_temp.kpi_refresh_keys
+        SELECT DISTINCT DATE_TRUNC('month', f.order_date)::date, f.product_key, f.customer_key
+        FROM {schema}.fact_sales f
+        WHERE {condition}
+    """, window)
+    cur.close()
+
+
+def refresh_kpi_aggregates(conn, schema=GOLD_SCHEMA, window=None):
+    """
+    Rebuild every KPI aggregate table from the loaded star schema and return their row counts
+    With window={'low': date, 'high': date} (a window refresh) only the rows
+    the refresh can change are replaced: the months, products and customers
+    of the window's facts, before (record_kpi_refresh_keys, called ahead of
+    their delete) and after their reload, plus every month and product of the
+    customers updated in place. Facts keep the product version they were
+    loaded with, so new product versions only touch the window's rows.
+    """
+    cur = conn.cursor()
+    results = {}
+
+    if window is not None and all(table_exists(conn, f"{schema}.{table}") for table in KPI_AGGREGATES):
+        record_kpi_refresh_keys(conn, window, schema)
+        changed = CHANGED_CUSTOMERS.format(schema=schema)
+        record_kpi_refresh_keys(conn, window, schema, f"f.customer_key IN ({changed})")
+        
+        for table, query in KPI_AGGREGATES.items():
+            rows, facts = (scope.format(schema=schema) for scope in KPI_REFRESH_SCOPES[table])
+            cur.execute(f"DELETE FROM {schema}.{table} WHERE {rows};")
+            cur.execute(f"INSERT INTO {schema}.{table} {query.format(schema=schema, condition=facts)}")
+            results[table] = cur.rowcount
+            print(f"  ✓ Refreshed {schema}.{table} ({results[table]} rows)")
+        cur.execute("DROP TABLE pg_temp.kpi_refresh_keys;")
+        
+        conn.commit()
+        cur.close()
+        return results
+
+    for table, query in KPI_AGGREGATES.items():
+        cur.execute(f"DROP TABLE IF EXISTS {schema}.{table};")
+        cur.execute(f"CREATE TABLE {schema}.{table} AS {query.format(schema=schema, condition='TRUE')}")
+        results[table] = cur.rowcount
+        cur.execute(f"ANALYZE {schema}.{table};")
+        print(f"  ✓ Built {schema}.{table} ({results[table]} rows)")
+
+    cur.execute("DROP TABLE IF EXISTS pg_temp.kpi_refresh_keys;")
+    conn.commit()
+    cur.close()
+    return results
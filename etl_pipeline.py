@@ -1,13 +1,41 @@
+import argparse
+import inspect
+import os
+import sys
 import time
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
 from pygrametl import ConnectionWrapper
 
 from db import (
-    get_connection, 
+    checkout_connection,
+    release_connection,
+    pooled_connection,
+    STREAM_ITERSIZE,
+    GOLD_SCHEMA,
+    GOLD_SHADOW_SCHEMA,
     create_silver_tables, 
     truncate_silver_tables,
     create_gold_tables,
-    truncate_gold_tables
+    truncate_gold_tables,
+    deferred_gold_indexes,
+    create_gold_shadow_schema,
+    swap_gold_schema,
+    rollback_gold_schema,
+    stamp_gold_load_version,
+    is_partitioned,
+    create_fact_partitions
+)
+
+from incremental import (
+    INCREMENTAL_TABLES,
+    get_watermark,
+    get_high_water_mark,
+    read_high_water_marks,
+    save_watermark,
+    create_staging_table,
+    merge_staging_table
 )
 
 from sources.customers import load_customers
@@ -16,64 +44,384 @@ from sources.sales import load_sales
 from sources.erp_customer import load_erp_customers
 from sources.erp_location import load_erp_locations
 from sources.erp_category import load_erp_categories
+from sources.pushdown import load_pushdown, check_pushdown_parity
 
 from dimensions.dim_customers import load_dim_customers
 from dimensions.dim_products import load_dim_products
-from dimensions.fact_sales import load_fact_sales
+from dimensions.fact_sales import (
+    load_fact_sales,
+    load_fact_sales_set_based,
+    get_order_month_chunks,
+    delete_fact_sales_window,
+    reload_fact_sales_month
+)
+from dimensions.kpi_aggregates import refresh_kpi_aggregates, record_kpi_refresh_keys
+from metrics import RunMetrics, measure_stage
+from profiling import PROFILE_ENV
+
+
+SILVER_LOADERS = [
+    ('crm_customers', 'crm_cust_info', 'CRM Customer data', load_customers),
+    ('crm_products', 'crm_prd_info', 'CRM Product data', load_products),
+    ('crm_sales', 'crm_sales_details', 'CRM Sales data', load_sales),
+    ('erp_customers', 'erp_cust_az12', 'ERP Customer demographics', load_erp_customers),
+    ('erp_locations', 'erp_loc_a101', 'ERP Location data', load_erp_locations),
+    ('erp_categories', 'erp_px_cat_g1v2', 'ERP Product categories', load_erp_categories),
+]
 
+SILVER_WORKERS = min(len(SILVER_LOADERS), os.cpu_count() or 1)
+# Worker processes of the partitioned crm_sales_details load
+SALES_PARTITIONS = os.cpu_count() or 1
 
-def run_silver_etl(conn_wrapper, source_conn):
-    """Run Silver layer ETL (Bronze → Silver)"""
+
+def loader_options(load_function, load_options):
+    """Keep the options a loader accepts (e.g. batch only applies to load_sales)"""
+    accepted = inspect.signature(load_function).parameters
+    return {name: value for name, value in load_options.items() if name in accepted}
+
+
+def run_silver_etl(conn_wrapper, source_conn, metrics=None, sales_partitions=1, **load_options):
+    """
+    Run Silver layer ETL (Bronze → Silver)
+    load_options are passed to every loader that accepts them, e.g. bulk=True streams
+    rows with COPY instead of row-by-row INSERTs, streaming=True extracts on
+    server-side cursors and batch=True transforms sales in vectorized chunks;
+    sales_partitions > 1 loads crm_sales_details on that many worker processes
+    (see run_sales_partitioned); each loader is recorded as a stage of `metrics`
+    (a RunMetrics). The workers commit their own slices, so the tables loaded
+    before them are committed first: a later failure then leaves Silver
+    partly reloaded instead of rolled back, and needs a rerun.
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
     print("\n" + "="*60)
     print("   SILVER LAYER ETL (Bronze → Silver)")
     print("="*60)
     
     results = {}
     
-    print("\n[Silver 1/6] Loading CRM Customer data...")
-    results['crm_customers'] = load_customers(conn_wrapper, source_conn)
+    for i, (key, table, description, load_function) in enumerate(SILVER_LOADERS, start=1):
+        print(f"\n[Silver {i}/{len(SILVER_LOADERS)}] Loading {description}...")
+        if load_function is load_sales and sales_partitions > 1:
+            conn_wrapper.commit()
+            results[key] = run_sales_partitioned(sales_partitions, metrics, **load_options)
+            continue
+        with metrics.stage(f"silver.{table}") as stage:
+            results[key] = load_function(conn_wrapper, source_conn,
+                                         **loader_options(load_function, load_options))
+            stage.rows_out = results[key]
     
-    print("\n[Silver 2/6] Loading CRM Product data...")
-    results['crm_products'] = load_products(conn_wrapper, source_conn)
+    return results
+
+
+def run_silver_etl_incremental(conn_wrapper, source_conn, target_conn, metrics=None, **load_options):
+    """
+    Run an incremental Silver refresh (Bronze → Silver)
+    Only bronze rows above each table's stored high-water mark are extracted;
+    they are staged and upserted into silver on the natural key instead of
+    truncating and reloading the table
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
+    print("\n" + "="*60)
+    print("   SILVER LAYER ETL (Bronze → Silver) - incremental")
+    print("="*60)
     
-    print("\n[Silver 3/6] Loading CRM Sales data...")
-    results['crm_sales'] = load_sales(conn_wrapper, source_conn)
+    results = {}
     
-    print("\n[Silver 4/6] Loading ERP Customer demographics...")
-    results['erp_customers'] = load_erp_customers(conn_wrapper, source_conn)
+    for i, (key, table, description, load_function) in enumerate(SILVER_LOADERS, start=1):
+        print(f"\n[Silver {i}/{len(SILVER_LOADERS)}] Refreshing {description}...")
+        _, column = INCREMENTAL_TABLES[table]
+        
+        if column is None:
+            # No change marker in bronze: small reference table, reloaded in full
+            cur = target_conn.cursor()
+            cur.execute(f"TRUNCATE TABLE silver.{table};")
+            cur.close()
+            with metrics.stage(f"silver.{table}") as stage:
+                results[key] = load_function(conn_wrapper, source_conn,
+                                             **loader_options(load_function, load_options))
+                stage.rows_out = results[key]
+            continue
+        
+        low = get_watermark(target_conn, table)
+        high = get_high_water_mark(source_conn, table, column)
+        window = {'low': low, 'high': high} if low is not None else None
+        print(f"  Watermark {column}: {low} → {high}")
+        
+        with metrics.stage(f"silver.{table}") as stage:
+            create_staging_table(target_conn, table)
+            load_function(conn_wrapper, source_conn, window=window,
+                          **loader_options(load_function, load_options))
+            replaced, inserted = merge_staging_table(target_conn, table)
+            save_watermark(target_conn, table, high)
+            target_conn.commit()
+            stage.rows_out = inserted
+        
+        print(f"  ✓ Upserted {inserted} rows into silver.{table} ({replaced} replaced)")
+        results[key] = inserted
     
-    print("\n[Silver 5/6] Loading ERP Location data...")
-    results['erp_locations'] = load_erp_locations(conn_wrapper, source_conn)
+    return results
+
+
+def run_silver_etl_pushdown(target_conn, metrics=None):
+    """
+    Run Silver layer ETL (Bronze → Silver) as set-based SQL
+    Every table is loaded by one INSERT ... SELECT inside the database
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
+    print("\n" + "="*60)
+    print("   SILVER LAYER ETL (Bronze → Silver) - SQL pushdown")
+    print("="*60)
     
-    print("\n[Silver 6/6] Loading ERP Product categories...")
-    results['erp_categories'] = load_erp_categories(conn_wrapper, source_conn)
+    results = {}
+    
+    for i, (key, table, description, _) in enumerate(SILVER_LOADERS, start=1):
+        print(f"\n[Silver {i}/{len(SILVER_LOADERS)}] Loading {description}...")
+        with metrics.stage(f"silver.{table}") as stage:
+            results[key] = load_pushdown(target_conn, table)
+            target_conn.commit()
+            stage.rows_out = results[key]
+        print(f"  ✓ Loaded {results[key]} records into silver.{table}")
     
     return results
 
 
-def run_gold_etl(conn_wrapper, source_conn, target_conn):
-    """Run Gold layer ETL (Silver → Gold Star Schema)"""
+def run_pushdown_parity_check():
+    """Check that the SQL pushdown engine produces the same silver rows as the Python loaders"""
+    print("\n" + "="*60)
+    print("   SILVER PARITY CHECK (Python vs SQL pushdown)")
+    print("="*60)
+    
+    with pooled_connection() as source_conn, pooled_connection() as target_conn:
+        results = check_pushdown_parity(
+            source_conn, target_conn,
+            [(table, load_function) for _, table, _, load_function in SILVER_LOADERS]
+        )
+    
+    for table, (python_only, sql_only) in results.items():
+        status = "✓" if python_only == 0 and sql_only == 0 else "❌"
+        print(f"  {status} {table}: {python_only} rows only in Python output, {sql_only} only in SQL output")
+    
+    return results
+
+
+def run_silver_loader(load_function, load_options, stage_name, run_id=None):
+    """
+    Run a single silver loader on its own source and target connections
+    Returns its row count and its stage metrics (as_dict), measured in the worker
+    """
+    with pooled_connection() as source_conn, pooled_connection() as target_conn:
+        target_conn.cursor().execute("SET search_path = 'silver'")
+        conn_wrapper = ConnectionWrapper(target_conn)
+        with measure_stage(stage_name, run_id) as stage:
+            count = load_function(conn_wrapper, source_conn, **loader_options(load_function, load_options))
+            conn_wrapper.commit()
+            stage.rows_out = count
+        return count, stage.as_dict()
+
+
+def sales_partition_tasks(partitions, load_options):
+    """(load_options, stage name) of every slice of a partitioned crm_sales_details load"""
+    return [
+        ({**load_options, 'partition': (index, partitions)}, f"silver.crm_sales_details_p{index}")
+        for index in range(partitions)
+    ]
+
+
+def run_sales_partitioned(partitions=SALES_PARTITIONS, metrics=None, **load_options):
+    """
+    Load silver.crm_sales_details on `partitions` worker processes
+    Each worker extracts, transforms and loads one hash slice of the bronze
+    orders (load_sales(partition=...)) on its own source and target connections
+    and commits it; the slices are disjoint, so the workers never touch each
+    other's rows. Returns the total row count; raises if a slice failed.
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
+    print(f"  Loading crm_sales_details on {partitions} worker processes...")
+    
+    with metrics.stage('silver.crm_sales_details') as stage:
+        count = 0
+        failed = []
+        with ProcessPoolExecutor(max_workers=partitions) as executor:
+            futures = {
+                executor.submit(run_silver_loader, load_sales, options, stage_name, metrics.run_id): stage_name
+                for options, stage_name in sales_partition_tasks(partitions, load_options)
+            }
+            for future in as_completed(futures):
+                try:
+                    partition_count, partition_stage = future.result()
+                    count += partition_count
+                    metrics.add(partition_stage)
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f"  ❌ {futures[future]}: {e}")
+        
+        if failed:
+            raise RuntimeError(f"Sales partitions failed: {', '.join(sorted(failed))}")
+        stage.rows_out = count
+    
+    print(f"  ✓ Loaded {count} sales records into silver.crm_sales_details ({partitions} partitions)")
+    return count
+
+
+def run_silver_etl_parallel(workers=SILVER_WORKERS, metrics=None, sales_partitions=1, **load_options):
+    """
+    Run the six Silver loaders concurrently (Bronze → Silver)
+    Each loader runs in its own worker process with its own connections, since
+    none of them reads another's output; with sales_partitions > 1 the slices
+    of crm_sales_details are submitted as separate tasks of the same pool. A
+    failed loader's exception is stored in the results dict instead of its row count.
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
+    print("\n" + "="*60)
+    print(f"   SILVER LAYER ETL (Bronze → Silver) - {workers} workers")
+    print("="*60)
+    
+    results = {}
+    
+    tasks = []
+    for key, table, description, load_function in SILVER_LOADERS:
+        if load_function is load_sales and sales_partitions > 1:
+            tasks += [(key, f"{description} ({stage_name})", load_function, options, stage_name)
+                      for options, stage_name in sales_partition_tasks(sales_partitions, load_options)]
+        else:
+            tasks.append((key, description, load_function, load_options, f"silver.{table}"))
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_silver_loader, load_function, options,
+                            stage_name, metrics.run_id): (key, description)
+            for key, description, load_function, options, stage_name in tasks
+        }
+        for future in as_completed(futures):
+            key, description = futures[future]
+            if isinstance(results.get(key), Exception):
+                continue
+            try:
+                count, stage = future.result()
+                results[key] = results.get(key, 0) + count
+                metrics.add(stage)
+                print(f"\n[Silver] ✓ {description}: {count:,} rows")
+            except Exception as e:
+                results[key] = e
+                print(f"\n[Silver] ❌ {description}: {e}")
+    
+    return {key: results[key] for key, _, _, _ in SILVER_LOADERS}
+
+
+def run_gold_etl(conn_wrapper, source_conn, target_conn, streaming=False, itersize=STREAM_ITERSIZE,
+                 set_based_fact=False, chunked_fact=False, schema=GOLD_SCHEMA, window=None, metrics=None,
+                 pipelined=False):
+    """
+    Run Gold layer ETL (Silver → Gold Star Schema)
+    With set_based_fact=True fact_sales is loaded by one server-side statement
+    (or one per order month with chunked_fact=True) instead of row by row;
+    schema is the gold schema being loaded (the live one or the shadow copy).
+    window={'low': date, 'high': date} refreshes gold in place: dimensions are
+    upserted and only the facts of that order date range are replaced.
+    pipelined=True overlaps reads, transforms and inserts of the row-wise loads
+    (their extracts then always stream, as with streaming=True).
+    The load finishes by rebuilding the KPI aggregate tables read by the dashboards
+    (on a window refresh only their rows the window affects).
+    Each step is recorded as a stage of `metrics` (a RunMetrics).
+    """
+    metrics = metrics if metrics is not None else RunMetrics()
     print("\n" + "="*60)
     print("   GOLD LAYER ETL (Silver → Gold Star Schema)")
     print("="*60)
     
     results = {}
     
-    print("\n[Gold 1/3] Loading dim_customers...")
-    results['dim_customers'] = load_dim_customers(conn_wrapper, source_conn)
+    print("\n[Gold 1/4] Loading dim_customers...")
+    with metrics.stage('gold.dim_customers') as stage:
+        results['dim_customers'] = load_dim_customers(conn_wrapper, source_conn, streaming, itersize,
+                                                      upsert=window is not None, pipelined=pipelined)
+        stage.rows_out = results['dim_customers']
+    
+    print("\n[Gold 2/4] Loading dim_products...")
+    with metrics.stage('gold.dim_products') as stage:
+        results['dim_products'] = load_dim_products(conn_wrapper, source_conn, target_conn, streaming,
+                                                    itersize, schema)
+        stage.rows_out = results['dim_products']
     
-    print("\n[Gold 2/3] Loading dim_products...")
-    results['dim_products'] = load_dim_products(conn_wrapper, source_conn)
+    print("\n[Gold 3/4] Loading fact_sales...")
+    with metrics.stage('gold.fact_sales') as stage:
+        # A chunked set-based full load stages each month straight into a new
+        # partition (load_fact_sales_partition); the other loads insert through
+        # fact_sales and need the month partitions to exist
+        partition_wise = set_based_fact and chunked_fact and window is None
+        if not partition_wise and is_partitioned(target_conn, f"{schema}.fact_sales"):
+            created = create_fact_partitions(target_conn, get_order_month_chunks(target_conn), schema)
+            print(f"  Created {created} monthly fact_sales partitions")
+        if window is not None:
+            record_kpi_refresh_keys(target_conn, window, schema)
+            deleted = delete_fact_sales_window(target_conn, window, schema)
+            print(f"  Deleted {deleted} facts ordered {window['low']} → {window['high']}")
+        if set_based_fact:
+            results['fact_sales'] = load_fact_sales_set_based(target_conn, chunked_fact, schema, window)
+        else:
+            results['fact_sales'] = load_fact_sales(conn_wrapper, source_conn, target_conn, streaming,
+                                                    itersize, schema, window, pipelined)
+        stage.rows_out = results['fact_sales']
     
-    print("\n[Gold 3/3] Loading fact_sales...")
-    results['fact_sales'] = load_fact_sales(conn_wrapper, source_conn, target_conn)
+    print("\n[Gold 4/4] Refreshing KPI aggregate tables...")
+    with metrics.stage('gold.kpi_aggregates') as stage:
+        aggregates = refresh_kpi_aggregates(target_conn, schema, window)
+        stage.rows_out = sum(aggregates.values())
+    results.update(aggregates)
     
     return results
 
 
-def run_full_etl():
-    """Execute the complete ETL pipeline from Bronze to Silver to Gold"""
+def prepare_gold_schema(target_conn, shadow=False, partitioned_fact=False):
+    """
+    Create the gold tables the Gold ETL loads into and point search_path at them
+    With shadow=True a fresh shadow schema is built while the live gold schema
+    keeps serving readers; otherwise the live tables are truncated.
+    partitioned_fact=True creates fact_sales partitioned by order month.
+    Returns the schema name.
+    """
+    if shadow:
+        print("\n[Setup] Creating shadow Gold schema (Star Schema)...")
+        create_gold_shadow_schema(target_conn, partitioned_fact)
+        schema = GOLD_SHADOW_SCHEMA
+    else:
+        print("\n[Setup] Creating Gold tables (Star Schema)...")
+        create_gold_tables(target_conn, partitioned=partitioned_fact)
+        
+        print("\n[Setup] Truncating Gold tables...")
+        truncate_gold_tables(target_conn)
+        schema = GOLD_SCHEMA
+    
+    target_conn.cursor().execute(f"SET search_path = '{schema}'")
+    return schema
+
+
+def run_full_etl(parallel=False, workers=SILVER_WORKERS, streaming=False, itersize=STREAM_ITERSIZE,
+                 incremental=False, pushdown=False, set_based_fact=False, chunked_fact=False,
+                 defer_indexes=False, shadow=False, partitioned_fact=False, sales_partitions=1,
+                 **load_options):
+    """
+    Execute the complete ETL pipeline from Bronze to Silver to Gold
+    With parallel=True the Silver loaders run concurrently on `workers` processes;
+    streaming=True extracts every layer on server-side cursors;
+    incremental=True upserts only new bronze rows into Silver instead of
+    truncating and reloading it (runs the loaders sequentially);
+    pushdown=True runs the Silver transforms as set-based SQL in the database;
+    set_based_fact/chunked_fact select the server-side fact_sales load;
+    defer_indexes=True drops gold indexes and foreign keys during the gold load
+    and rebuilds them in parallel afterwards;
+    shadow=True builds Gold in a shadow schema and swaps it in atomically, so
+    dashboards keep reading the previous version until the load has finished;
+    partitioned_fact=True range-partitions fact_sales by order month (with
+    chunked_fact=True each month is loaded into its own table and attached);
+    pipelined=True overlaps reads, transforms and inserts in the row-wise loaders
+    (implies streaming extracts for them);
+    sales_partitions > 1 splits the crm_sales_details load across that many
+    worker processes (full reloads only; incremental refreshes stay serial)
+    """
     start_time = time.time()
+    metrics = RunMetrics()
+    pipelined = load_options.get('pipelined', False)
     
     print("\n" + "="*60)
     print("   DATA WAREHOUSE ETL PIPELINE")
@@ -81,10 +429,10 @@ def run_full_etl():
     print(f"   Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
-    # Get database connections
+    # Get database connections (checked out once and reused by Silver and Gold)
     print("\n[Setup] Connecting to database...")
-    source_conn = get_connection()
-    target_conn = get_connection()
+    source_conn = checkout_connection()
+    target_conn = checkout_connection()
     
     silver_results = {}
     gold_results = {}
@@ -96,32 +444,59 @@ def run_full_etl():
         print("\n[Setup] Creating Silver tables...")
         create_silver_tables(target_conn)
         
-        print("\n[Setup] Truncating Silver tables...")
-        truncate_silver_tables(target_conn)
+        if incremental:
+            target_conn.cursor().execute("SET search_path = 'silver'")
+            conn_wrapper = ConnectionWrapper(target_conn)
+            
+            silver_results = run_silver_etl_incremental(conn_wrapper, source_conn, target_conn, metrics,
+                                                        streaming=streaming, itersize=itersize,
+                                                        **load_options)
+        else:
+            # Read before the reload so rows arriving meanwhile are picked up
+            # by the next incremental run
+            high_water_marks = read_high_water_marks(source_conn)
+            
+            print("\n[Setup] Truncating Silver tables...")
+            truncate_silver_tables(target_conn)
+            
+            if pushdown:
+                silver_results = run_silver_etl_pushdown(target_conn, metrics)
+            elif parallel:
+                silver_results = run_silver_etl_parallel(workers, metrics, sales_partitions,
+                                                         streaming=streaming, itersize=itersize,
+                                                         **load_options)
+                failed = [table for table, result in silver_results.items() if isinstance(result, Exception)]
+                if failed:
+                    raise RuntimeError(f"Silver loaders failed: {', '.join(failed)}")
+            else:
+                target_conn.cursor().execute("SET search_path = 'silver'")
+                conn_wrapper = ConnectionWrapper(target_conn)
+                
+                silver_results = run_silver_etl(conn_wrapper, source_conn, metrics, sales_partitions,
+                                                streaming=streaming, itersize=itersize, **load_options)
+                
+                conn_wrapper.commit()
+            
+            for table, value in high_water_marks.items():
+                save_watermark(target_conn, table, value)
+            target_conn.commit()
         
-        target_conn.cursor().execute("SET search_path = 'silver'")
+        schema = prepare_gold_schema(target_conn, shadow, partitioned_fact)
         conn_wrapper = ConnectionWrapper(target_conn)
         
-        silver_results = run_silver_etl(conn_wrapper, source_conn)
-        
-        conn_wrapper.commit()
-        conn_wrapper.close()
-
-        target_conn = get_connection()
+        with deferred_gold_indexes(target_conn, schema=schema) if defer_indexes else nullcontext():
+            gold_results = run_gold_etl(conn_wrapper, source_conn, target_conn, streaming, itersize,
+                                        set_based_fact, chunked_fact, schema, metrics=metrics,
+                                        pipelined=pipelined)
+            
+            conn_wrapper.commit()
         
-        print("\n[Setup] Creating Gold tables (Star Schema)...")
-        create_gold_tables(target_conn)
+        stamp_gold_load_version(target_conn, schema)
         
-        print("\n[Setup] Truncating Gold tables...")
-        truncate_gold_tables(target_conn)
-        
-        target_conn.cursor().execute("SET search_path = 'gold'")
-        conn_wrapper = ConnectionWrapper(target_conn)
+        if shadow:
+            swap_gold_schema(target_conn)
         
-        gold_results = run_gold_etl(conn_wrapper, source_conn, target_conn)
-        
-        conn_wrapper.commit()
-        conn_wrapper.close()
+        metrics.publish(target_conn)
         
     except Exception as e:
         print(f"\n❌ Error during ETL: {e}")
@@ -129,8 +504,8 @@ def run_full_etl():
         traceback.print_exc()
         raise
     finally:
-        source_conn.close()
-        target_conn.close()
+        release_connection(source_conn)
+        release_connection(target_conn)
     
 
     elapsed_time = time.time() - start_time
@@ -149,39 +524,45 @@ def run_full_etl():
     for table, count in gold_results.items():
         print(f"  {table}: {count:,} rows")
     
+    metrics.print_summary()
     print()
 
 
-def run_gold_only():
+def run_gold_only(streaming=False, itersize=STREAM_ITERSIZE, set_based_fact=False, chunked_fact=False,
+                  defer_indexes=False, shadow=False, partitioned_fact=False, pipelined=False):
     """Run only the Gold layer ETL (assumes Silver is already loaded)"""
     start_time = time.time()
+    metrics = RunMetrics()
     
     print("\n" + "="*60)
     print("   GOLD LAYER ETL ONLY (Star Schema)")
     print(f"   Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
-    source_conn = get_connection()
-    target_conn = get_connection()
+    source_conn = checkout_connection()
+    target_conn = checkout_connection()
     
     try:
-        print("\n[Setup] Creating Gold tables (Star Schema)...")
-        create_gold_tables(target_conn)
+        schema = prepare_gold_schema(target_conn, shadow, partitioned_fact)
+        conn_wrapper = ConnectionWrapper(target_conn)
         
-        print("\n[Setup] Truncating Gold tables...")
-        truncate_gold_tables(target_conn)
+        with deferred_gold_indexes(target_conn, schema=schema) if defer_indexes else nullcontext():
+            gold_results = run_gold_etl(conn_wrapper, source_conn, target_conn, streaming, itersize,
+                                        set_based_fact, chunked_fact, schema, metrics=metrics,
+                                        pipelined=pipelined)
+            
+            conn_wrapper.commit()
         
-        target_conn.cursor().execute("SET search_path = 'gold'")
-        conn_wrapper = ConnectionWrapper(target_conn)
+        stamp_gold_load_version(target_conn, schema)
         
-        gold_results = run_gold_etl(conn_wrapper, source_conn, target_conn)
+        if shadow:
+            swap_gold_schema(target_conn)
         
-        conn_wrapper.commit()
-        conn_wrapper.close()
+        metrics.publish(target_conn)
         
     finally:
-        source_conn.close()
-        target_conn.close()
+        release_connection(source_conn)
+        release_connection(target_conn)
     
     elapsed_time = time.time() - start_time
     print("\n" + "="*60)
@@ -193,19 +574,119 @@ def run_gold_only():
     print("-" * 40)
     for table, count in gold_results.items():
         print(f"  {table}: {count:,} rows")
+    
+    metrics.print_summary()
+    print()
+
+
+def run_gold_refresh(low, high, streaming=False, itersize=STREAM_ITERSIZE, set_based_fact=False,
+                     pipelined=False):
+    """
+    Refresh Gold for the orders placed between low and high (inclusive dates)
+    Nothing is truncated: customers are upserted, products get their new
+    versions, the window's facts are deleted and reloaded from Silver, and the
+    KPI aggregate rows they affect are rebuilt. The delete and reload commit together.
+    """
+    start_time = time.time()
+    metrics = RunMetrics()
+    window = {'low': low, 'high': high}
+    
+    print("\n" + "="*60)
+    print(f"   GOLD REFRESH {low} → {high}")
+    print(f"   Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60)
+    
+    source_conn = checkout_connection()
+    target_conn = checkout_connection()
+    
+    try:
+        print("\n[Setup] Creating Gold tables (Star Schema)...")
+        create_gold_tables(target_conn)
+        target_conn.cursor().execute(f"SET search_path = '{GOLD_SCHEMA}'")
+        conn_wrapper = ConnectionWrapper(target_conn)
+        
+        gold_results = run_gold_etl(conn_wrapper, source_conn, target_conn, streaming, itersize,
+                                    set_based_fact, window=window, metrics=metrics, pipelined=pipelined)
+        conn_wrapper.commit()
+        
+        stamp_gold_load_version(target_conn)
+        metrics.publish(target_conn)
+        
+    finally:
+        release_connection(source_conn)
+        release_connection(target_conn)
+    
+    elapsed_time = time.time() - start_time
+    print("\n" + "="*60)
+    print("   GOLD REFRESH COMPLETED!")
+    print(f"   Total time: {elapsed_time:.2f} seconds")
+    print("="*60)
+    
+    print("\n⭐ GOLD LAYER SUMMARY")
+    print("-" * 40)
+    for table, count in gold_results.items():
+        print(f"  {table}: {count:,} rows")
+    
+    metrics.print_summary()
+    print()
+
+
+def run_fact_month_reload(month):
+    """
+    Reload the Gold facts of one order month from Silver, leaving the other months alone
+    On a partitioned fact_sales only that month's partition is rebuilt and
+    swapped in; the KPI aggregate rows of the month are refreshed after it.
+    """
+    start_time = time.time()
+    metrics = RunMetrics()
+    low = month.replace(day=1)
+    window = {'low': low, 'high': (low + timedelta(days=32)).replace(day=1) - timedelta(days=1)}
+    
+    print("\n" + "="*60)
+    print(f"   GOLD FACT RELOAD {month:%Y-%m}")
+    print(f"   Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60)
+    
+    with pooled_connection() as target_conn:
+        with metrics.stage('gold.fact_sales') as stage:
+            record_kpi_refresh_keys(target_conn, window)
+            stage.rows_out = reload_fact_sales_month(target_conn, month)
+            print(f"  ✓ Reloaded {stage.rows_out:,} facts ordered in {month:%Y-%m}")
+        
+        with metrics.stage('gold.kpi_aggregates') as stage:
+            stage.rows_out = sum(refresh_kpi_aggregates(target_conn, GOLD_SCHEMA, window).values())
+        
+        stamp_gold_load_version(target_conn)
+        metrics.publish(target_conn)
+    
+    elapsed_time = time.time() - start_time
+    print("\n" + "="*60)
+    print("   GOLD FACT RELOAD COMPLETED!")
+    print(f"   Total time: {elapsed_time:.2f} seconds")
+    print("="*60)
+    
+    metrics.print_summary()
     print()
 
 
-def run_single_etl(table_name: str):
-    """Run ETL for a single table"""
+
+def rollback_gold():
+    """Restore the Gold version replaced by the last shadow load"""
+    with pooled_connection() as conn:
+        return rollback_gold_schema(conn)
+
+
+def run_single_etl(table_name: str, sales_partitions=1, **load_options):
+    """Run ETL for a single table (crm_sales_details on sales_partitions processes)"""
     print(f"\n Running ETL for: {table_name}")
     
-    source_conn = get_connection()
-    target_conn = get_connection()
-    target_conn.cursor().execute("SET search_path = 'silver'")
-    conn_wrapper = ConnectionWrapper(target_conn)
+    source_conn = checkout_connection()
+    target_conn = checkout_connection()
     
     try:
+        target_conn.cursor().execute("SET search_path = 'silver'")
+        conn_wrapper = ConnectionWrapper(target_conn)
+        
         etl_functions = {
             'crm_cust_info': load_customers,
             'crm_prd_info': load_products,
@@ -224,16 +705,104 @@ def run_single_etl(table_name: str):
         cur.execute(f"TRUNCATE TABLE silver.{table_name};")
         target_conn.commit()
         
-        etl_functions[table_name](conn_wrapper, source_conn)
-        
-        conn_wrapper.commit()
-        conn_wrapper.close()
+        load_function = etl_functions[table_name]
+        if load_function is load_sales and sales_partitions > 1:
+            run_sales_partitioned(sales_partitions, **load_options)
+        else:
+            with measure_stage(f"silver.{table_name}"):
+                load_function(conn_wrapper, source_conn, **loader_options(load_function, load_options))
+                
+                conn_wrapper.commit()
         print(f"✓ ETL completed for {table_name}")
         
     finally:
-        source_conn.close()
-        target_conn.close()
+        release_connection(source_conn)
+        release_connection(target_conn)
+
+
+def parse_month(value):
+    """YYYY-MM command line value to the date of the month's first day"""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def main(argv=None):
+    """Command line entry point; without arguments runs the full pipeline"""
+    parser = argparse.ArgumentParser(description="Bronze → Silver → Gold ETL pipeline")
+    parser.add_argument('--gold-only', action='store_true', help="only run the Gold layer")
+    parser.add_argument('--table', help="only reload one silver table")
+    parser.add_argument('--parallel', action='store_true')
+    parser.add_argument('--workers', type=int, default=SILVER_WORKERS)
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--itersize', type=int, default=STREAM_ITERSIZE)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--pushdown', action='store_true')
+    parser.add_argument('--bulk', action='store_true')
+    parser.add_argument('--batch', action='store_true')
+    parser.add_argument('--set-based-fact', action='store_true')
+    parser.add_argument('--chunked-fact', action='store_true')
+    parser.add_argument('--defer-indexes', action='store_true')
+    parser.add_argument('--shadow', action='store_true')
+    parser.add_argument('--partitioned-fact', action='store_true')
+    parser.add_argument('--pipelined', action='store_true',
+                        help="overlap reads, transforms and inserts of the row-wise loaders "
+                             "(extracts on server-side cursors, as with --streaming)")
+    parser.add_argument('--sales-partitions', type=int, default=1, metavar='N',
+                        help="load crm_sales_details on N worker processes, e.g. one per core")
+    parser.add_argument('--profile', nargs='+', metavar='STAGE',
+                        help="profile stages with cProfile and tracemalloc, e.g. crm_sales_details "
+                             f"gold.fact_sales or all (same as {PROFILE_ENV}=...)")
+    parser.add_argument('--rollback', action='store_true',
+                        help="restore the Gold version replaced by the last --shadow load")
+    parser.add_argument('--check-pushdown', action='store_true',
+                        help="compare the SQL pushdown silver rows with the Python loaders' (exits 1 on a mismatch)")
+    parser.add_argument('--reload-month', type=parse_month, metavar='YYYY-MM',
+                        help="reload the Gold facts of one order month (one partition if partitioned)")
+    parser.add_argument('--refresh-from', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                        help="refresh Gold in place for the orders placed from this date (with --refresh-to)")
+    parser.add_argument('--refresh-to', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                        help="last order date of the Gold refresh (inclusive)")
+    args = parser.parse_args(argv)
+    
+    if (args.refresh_from is None) != (args.refresh_to is None):
+        parser.error("--refresh-from and --refresh-to go together")
+    
+    if args.profile:
+        # Through the environment so that worker processes profile their stages too
+        os.environ[PROFILE_ENV] = ','.join(args.profile)
+    
+    load_options = {'bulk': args.bulk, 'batch': args.batch, 'pipelined': args.pipelined}
+    gold_options = {
+        'streaming': args.streaming,
+        'itersize': args.itersize,
+        'set_based_fact': args.set_based_fact,
+        'chunked_fact': args.chunked_fact,
+        'defer_indexes': args.defer_indexes,
+        'shadow': args.shadow,
+        'partitioned_fact': args.partitioned_fact,
+    }
+    
+    if args.rollback:
+        if not rollback_gold():
+            sys.exit(1)
+    elif args.check_pushdown:
+        results = run_pushdown_parity_check()
+        if any(python_only or sql_only for python_only, sql_only in results.values()):
+            sys.exit(1)
+    elif args.reload_month is not None:
+        run_fact_month_reload(args.reload_month)
+    elif args.refresh_from is not None:
+        run_gold_refresh(args.refresh_from, args.refresh_to, streaming=args.streaming, itersize=args.itersize,
+                         set_based_fact=args.set_based_fact, pipelined=args.pipelined)
+    elif args.table:
+        run_single_etl(args.table, args.sales_partitions, streaming=args.streaming, itersize=args.itersize,
+                       **load_options)
+    elif args.gold_only:
+        run_gold_only(pipelined=args.pipelined, **gold_options)
+    else:
+        run_full_etl(parallel=args.parallel, workers=args.workers, incremental=args.incremental,
+                     pushdown=args.pushdown, sales_partitions=args.sales_partitions, **gold_options,
+                     **load_options)
 
 
 if __name__ == "__main__":
-    run_full_etl()
+    main()
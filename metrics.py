@@ -0,0 +1,348 @@
+"""
+Per-stage performance metrics of an ETL run
+
+Every loader call of a run is measured as a stage (e.g. silver.crm_sales_details,
+gold.fact_sales): wall and CPU time, rows in/out/skipped, rows per second and
+peak RSS. Loaders split their own time into extract, transform and load through
+current_stage(): rows pulled from the wrapped source count as extract time,
+wrapped transform calls as transform time, and the rest of the stage (inserts,
+COPY flushes, commits) as load time. Outside a measured stage current_stage()
+returns a no-op stage, so the loaders run unchanged.
+
+At the end of a run the stages are written as a JSON report, as a Prometheus
+text-format file (for node_exporter's textfile collector) and into
+silver.etl_stage_metrics to track throughput across runs.
+"""
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from profiling import profile_stage
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_DIR = os.environ.get('ETL_METRICS_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics'))
+PROMETHEUS_FILE = 'etl_metrics.prom'
+
+METRICS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS silver.etl_stage_metrics (
+        run_id TEXT,
+        stage TEXT,
+        status TEXT,
+        started_at TIMESTAMPTZ,
+        wall_seconds DOUBLE PRECISION,
+        cpu_seconds DOUBLE PRECISION,
+        extract_seconds DOUBLE PRECISION,
+        transform_seconds DOUBLE PRECISION,
+        load_seconds DOUBLE PRECISION,
+        rows_in BIGINT,
+        rows_out BIGINT,
+        rows_skipped BIGINT,
+        rows_per_second DOUBLE PRECISION,
+        peak_rss_bytes BIGINT,
+        PRIMARY KEY (run_id, stage)
+    );
+"""
+
+# report field -> (Prometheus metric, help text)
+PROMETHEUS_METRICS = {
+    'cpu_seconds': ('etl_stage_cpu_seconds', 'CPU time of the ETL stage'),
+    'rows_in': ('etl_stage_rows_in', 'Rows read by the ETL stage'),
+    'rows_out': ('etl_stage_rows_out', 'Rows written by the ETL stage'),
+    'rows_skipped': ('etl_stage_rows_skipped', 'Rows read but not written by the ETL stage'),
+    'rows_per_second': ('etl_stage_rows_per_second', 'Rows written per second of wall time'),
+    'peak_rss_bytes': ('etl_stage_peak_rss_bytes', 'Peak resident set size during the ETL stage'),
+}
+
+_current = None
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter so the next reading covers one stage (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def read_peak_rss():
+    """Peak resident set size of this process in bytes (None if unknown)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # Process lifetime peak; kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageMetrics(object):
+    """Counters and timings of one stage; built by measure_stage()"""
+
+    def __init__(self, name):
+        self.name = name
+        self.status = 'running'
+        self.started_at = None
+        self.rows_in = 0
+        self.rows_out = 0
+        # None: derived as rows_in - rows_out
+        self.rows_skipped = None
+        self.extract_seconds = 0.0
+        self.transform_seconds = 0.0
+        # None: derived as the wall time left after extract and transform
+        self.load_seconds = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = None
+        self._wall_start = None
+        self._cpu_start = None
+
+    def start(self):
+        reset_peak_rss()
+        self.started_at = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def stop(self, status='ok'):
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        self.peak_rss_bytes = read_peak_rss()
+        self.status = status
+
+    def extract(self, source):
+        """Iterate over source, counting rows in and the time spent fetching them"""
+        rows = iter(source)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            try:
+                row = next(rows)
+            except StopIteration:
+                self.extract_seconds += clock() - started
+                return
+            self.extract_seconds += clock() - started
+            self.rows_in += 1
+            yield row
+
+    def transform(self, function, row):
+        """Call a row transform, counting its time as transform time"""
+        started = time.perf_counter()
+        result = function(row)
+        self.transform_seconds += time.perf_counter() - started
+        return result
+
+    def transform_batches(self, batches):
+        """
+        Iterate over transformed batches (e.g. iter_sales_batches), counting the
+        time spent producing them as transform time minus the extract time of
+        the rows they pulled
+        """
+        batches = iter(batches)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            extract_before = self.extract_seconds
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            self.transform_seconds += clock() - started - (self.extract_seconds - extract_before)
+            yield batch
+
+    def add_load_time(self, seconds):
+        """
+        Record load time measured by the loader itself, e.g. by a pipelined
+        writer thread whose inserts overlap the extract and transform
+        """
+        self.load_seconds = (self.load_seconds or 0.0) + seconds
+
+    def as_dict(self):
+        """Report entry of the stage"""
+        rows_skipped = self.rows_skipped
+        if rows_skipped is None:
+            rows_skipped = max(self.rows_in - self.rows_out, 0)
+        load_seconds = self.load_seconds
+        if load_seconds is None:
+            load_seconds = max(self.wall_seconds - self.extract_seconds - self.transform_seconds, 0)
+        return {
+            'stage': self.name,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'extract_seconds': round(self.extract_seconds, 6),
+            'transform_seconds': round(self.transform_seconds, 6),
+            'load_seconds': round(load_seconds, 6),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_skipped': rows_skipped,
+            'rows_per_second': round(self.rows_out / self.wall_seconds, 1) if self.wall_seconds else 0.0,
+            'peak_rss_bytes': self.peak_rss_bytes,
+        }
+
+
+class NullStage(object):
+    """Stand-in returned by current_stage() outside a measured stage"""
+    rows_in = rows_out = rows_skipped = None
+
+    def __setattr__(self, name, value):
+        pass  # nothing is recorded outside a stage
+
+    def extract(self, source):
+        return source
+
+    def transform(self, function, row):
+        return function(row)
+
+    def transform_batches(self, batches):
+        return batches
+
+    def add_load_time(self, seconds):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+def current_stage():
+    """The stage being measured in this process, or NULL_STAGE"""
+    return _current if _current is not None else NULL_STAGE
+
+
+@contextmanager
+def measure_stage(name, run_id=None):
+    """
+    Measure the enclosed code as one stage; loaders reach it through current_stage()
+    A stage selected by ETL_PROFILE is also profiled (see profiling.py)
+    """
+    global _current
+    stage = StageMetrics(name)
+    previous = _current
+    _current = stage
+    stage.start()
+    try:
+        with profile_stage(name, run_id):
+            yield stage
+    except BaseException:
+        stage.stop('failed')
+        raise
+    else:
+        stage.stop()
+    finally:
+        _current = previous
+
+
+class RunMetrics(object):
+    """The measured stages of one ETL run"""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a stage of this run (see measure_stage)"""
+        try:
+            with measure_stage(name, self.run_id) as stage:
+                yield stage
+        finally:
+            self.stages.append(stage.as_dict())
+
+    def add(self, stage):
+        """Record a stage measured elsewhere, e.g. the as_dict() returned by a worker process"""
+        self.stages.append(stage)
+
+    def report(self):
+        """JSON-serialisable run report"""
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'stages': self.stages,
+        }
+
+    def write_json(self, directory=METRICS_DIR):
+        """Write the run report to <directory>/etl_run_<run_id>.json and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"etl_run_{self.run_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+    def prometheus_text(self):
+        """The stages in Prometheus text exposition format"""
+        lines = [
+            '# HELP etl_run_info Identifier of the last ETL run',
+            '# TYPE etl_run_info gauge',
+            f'etl_run_info{{run_id="{self.run_id}"}} 1',
+            '# HELP etl_stage_seconds Wall time of the ETL stage by phase',
+            '# TYPE etl_stage_seconds gauge',
+        ]
+        for stage in self.stages:
+            for phase in ('extract', 'transform', 'load', 'wall'):
+                lines.append(f'etl_stage_seconds{{stage="{stage["stage"]}",phase="{phase}"}} '
+                             f'{stage[phase + "_seconds"]}')
+        for field, (metric, help_text) in PROMETHEUS_METRICS.items():
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            for stage in self.stages:
+                if stage[field] is not None:
+                    lines.append(f'{metric}{{stage="{stage["stage"]}"}} {stage[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, directory=METRICS_DIR):
+        """Write <directory>/etl_metrics.prom (replaced atomically) and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, PROMETHEUS_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)  # the collector never reads a partial file
+        return path
+
+    def save(self, conn):
+        """Insert the stages into silver.etl_stage_metrics and commit"""
+        cur = conn.cursor()
+        cur.execute(METRICS_TABLE_DDL)
+        columns = ['stage', 'status', 'started_at', 'wall_seconds', 'cpu_seconds', 'extract_seconds',
+                   'transform_seconds', 'load_seconds', 'rows_in', 'rows_out', 'rows_skipped',
+                   'rows_per_second', 'peak_rss_bytes']
+        cur.executemany(
+            f"INSERT INTO silver.etl_stage_metrics (run_id, {', '.join(columns)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(columns))}) "
+            "ON CONFLICT (run_id, stage) DO NOTHING",
+            [[self.run_id] + [stage[column] for column in columns] for stage in self.stages]
+        )
+        conn.commit()
+        cur.close()
+
+    def publish(self, conn, directory=METRICS_DIR):
+        """Write the JSON report and Prometheus file and store the stages in the database"""
+        json_path = self.write_json(directory)
+        prometheus_path = self.write_prometheus(directory)
+        self.save(conn)
+        print(f"\n📈 Stage metrics of run {self.run_id}: {json_path}, {prometheus_path}, "
+              "silver.etl_stage_metrics")
+
+    def print_summary(self):
+        """Print one line per stage"""
+        print("\n📈 STAGE METRICS")
+        print("-" * 40)
+        for stage in self.stages:
+            print(f"  {stage['stage']}: {stage['wall_seconds']:.2f}s "
+                  f"(extract {stage['extract_seconds']:.2f}s, transform {stage['transform_seconds']:.2f}s, "
+                  f"load {stage['load_seconds']:.2f}s), {stage['rows_out']:,} rows out, "
+                  f"{stage['rows_per_second']:,.0f} rows/s")
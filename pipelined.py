@@ -0,0 +1,123 @@
+"""
+Pipelined extract → transform → load for the row-wise loaders
+
+A reader thread pulls batches of rows from the source connection, the calling
+thread transforms them and a writer thread inserts them through the target
+table, so database reads, Python transforms and database writes overlap. The
+stages are connected by bounded queues: a stage that runs ahead blocks once
+`queuesize` batches are waiting, which keeps memory bounded and lets the
+throughput settle on the slowest stage instead of the sum of the three.
+
+The source must fetch its rows as they are consumed: a client-side cursor
+reads the whole result set in execute(), before the first batch, so nothing
+would overlap. Loaders called with pipelined=True therefore always extract on
+a named server-side cursor, as with streaming=True.
+
+The source and target connections are each used by one thread only; the
+caller commits (ConnectionWrapper.commit) once run_pipelined has returned.
+"""
+import queue
+import threading
+import time
+from itertools import islice
+
+from metrics import current_stage
+
+PIPELINE_BATCH_SIZE = 1000
+# Batches buffered between two stages
+PIPELINE_QUEUE_SIZE = 8
+# Seconds between checks for a failed stage while blocked on a queue
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+def put(q, item, failed):
+    """Put an item, giving up (False) once another stage has failed"""
+    while not failed.is_set():
+        try:
+            q.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get(q, failed):
+    """Get an item, or _DONE once another stage has failed"""
+    while not failed.is_set():
+        try:
+            return q.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipelined(source, transform, insert, batchsize=PIPELINE_BATCH_SIZE, queuesize=PIPELINE_QUEUE_SIZE):
+    """
+    Stream source rows through transform(row) into insert(row) on three stages
+    transform may return None to drop a row (transform=None keeps rows as they are).
+    The first exception raised by any stage is re-raised here.
+    Returns the number of rows inserted.
+    """
+    stage = current_stage()
+    read_queue = queue.Queue(maxsize=queuesize)
+    write_queue = queue.Queue(maxsize=queuesize)
+    failed = threading.Event()
+    errors = []
+    inserted = [0]
+    
+    def read():
+        try:
+            rows = iter(source)
+            while True:
+                batch = list(islice(rows, batchsize))
+                if not batch or not put(read_queue, batch, failed):
+                    break
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            put(read_queue, _DONE, failed)
+    
+    def write():
+        try:
+            while True:
+                batch = get(write_queue, failed)
+                if batch is _DONE:
+                    break
+                started = time.perf_counter()
+                for row in batch:
+                    insert(row)
+                stage.add_load_time(time.perf_counter() - started)
+                inserted[0] += len(batch)
+        except BaseException as e:
+            errors.append(e)
+            failed.set()
+    
+    reader = threading.Thread(target=read, name='pipeline-reader', daemon=True)
+    writer = threading.Thread(target=write, name='pipeline-writer', daemon=True)
+    reader.start()
+    writer.start()
+    
+    try:
+        while True:
+            batch = get(read_queue, failed)
+            if batch is _DONE:
+                break
+            if transform is not None:
+                batch = [stage.transform(transform, row) for row in batch]
+                batch = [row for row in batch if row is not None]
+            if not put(write_queue, batch, failed):
+                break
+    except BaseException as e:
+        errors.append(e)
+        failed.set()
+    finally:
+        put(write_queue, _DONE, failed)
+        reader.join()
+        writer.join()
+    
+    if errors:
+        raise errors[0]
+    return inserted[0]
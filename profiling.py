@@ -0,0 +1,103 @@
+"""
+Opt-in cProfile/tracemalloc profiling of ETL stages
+
+Profiling is selected per stage with the ETL_PROFILE environment variable (or
+etl_pipeline's --profile flag, which sets it for the worker processes too): a
+comma-separated list of stage names such as silver.crm_sales_details, of bare
+table names such as fact_sales, or 'all'. A table name also selects the
+worker stages of its partitioned load (silver.crm_sales_details_p0, ...). A selected stage writes two files to
+ETL_PROFILE_DIR, named after the run id and the stage:
+
+    <run_id>_<stage>.pstats       cProfile statistics (python -m pstats, snakeviz)
+    <run_id>_<stage>_alloc.txt    peak traced memory and top allocation sites
+
+Stages that are not selected run without a profiler attached.
+"""
+import cProfile
+import os
+import re
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+PROFILE_ENV = 'ETL_PROFILE'
+PROFILE_DIR = os.environ.get('ETL_PROFILE_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+# Allocation sites listed in the _alloc.txt report
+TOP_ALLOCATIONS = 25
+# Frames kept per traced allocation
+TRACEMALLOC_FRAMES = 5
+# Suffix of the worker stages of a partitioned load, e.g. crm_sales_details_p3
+PARTITION_SUFFIX = re.compile(r'_p\d+$')
+
+
+def profiled_stages():
+    """Stage selectors of ETL_PROFILE (empty set when profiling is off)"""
+    value = os.environ.get(PROFILE_ENV, '')
+    return {selector.strip() for selector in value.split(',') if selector.strip()}
+
+
+def is_profiled(stage_name, selectors=None):
+    """
+    Whether a stage is selected by its full name, its table name or 'all'
+    (a partition stage is also selected by the names of its table)
+    """
+    selectors = profiled_stages() if selectors is None else selectors
+    if not selectors:
+        return False
+    names = {stage_name, PARTITION_SUFFIX.sub('', stage_name)}
+    return 'all' in selectors or any(name in selectors or name.split('.')[-1] in selectors for name in names)
+
+
+def profile_path(run_id, stage_name, suffix, directory=PROFILE_DIR):
+    """File of a stage's profile, e.g. profiles/20250101T020000-ab12cd34_silver.crm_sales_details.pstats"""
+    return os.path.join(directory, f"{run_id}_{stage_name}{suffix}")
+
+
+def write_allocation_report(snapshot, peak, path, limit=TOP_ALLOCATIONS):
+    """Write the peak traced memory and the top allocation sites still alive at the end of the stage"""
+    stats = snapshot.statistics('lineno')
+    with open(path, 'w') as f:
+        f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n")
+        f.write(f"Traced memory at end of stage: {sum(stat.size for stat in stats) / 1024 / 1024:.1f} MiB\n\n")
+        f.write(f"Top {limit} allocation sites (size, count, average):\n")
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            f.write(f"  {stat.size / 1024:10.1f} KiB {stat.count:9,} blocks "
+                    f"{stat.size / max(stat.count, 1):8.0f} B  {frame.filename}:{frame.lineno}\n")
+
+
+@contextmanager
+def profile(stage_name, run_id, directory=PROFILE_DIR):
+    """Run the enclosed code under cProfile and tracemalloc and write the stage's reports"""
+    os.makedirs(directory, exist_ok=True)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+        ])
+        if started_tracing:
+            tracemalloc.stop()
+        
+        stats_path = profile_path(run_id, stage_name, '.pstats', directory)
+        alloc_path = profile_path(run_id, stage_name, '_alloc.txt', directory)
+        profiler.dump_stats(stats_path)
+        write_allocation_report(snapshot, peak, alloc_path)
+        print(f"  🔍 Profiled {stage_name}: {stats_path}, {alloc_path}")
+
+
+def profile_stage(stage_name, run_id=None):
+    """profile() if ETL_PROFILE selects the stage, otherwise a no-op context"""
+    if not is_profiled(stage_name):
+        return nullcontext()
+    return profile(stage_name, run_id or f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}")
@@ -3,6 +3,12 @@ from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension, FactTable
 from datetime import datetime
 
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
+from incremental import window_condition
+
 
 def transform_marital_status(value):
     """Transform marital status codes to descriptive values"""
@@ -35,8 +41,11 @@ def clean_name(value):
     return str(value).strip()
 
 
-def extract_customers(conn):
-    """Extract customers from bronze layer with deduplication"""
+def extract_customers(conn, streaming=False, itersize=STREAM_ITERSIZE, window=None):
+    """
+    Extract customers from bronze layer with deduplication
+    window: optional {'low': ..., 'high': ...} watermark range for incremental refresh
+    """
     query = """
         SELECT 
             cst_id,
@@ -54,7 +63,15 @@ def extract_customers(conn):
         ) t
         WHERE flag_last = 1
     """
-    return SQLSource(connection=conn, query=query)
+    if window is not None:
+        # Incremental refresh: only customers whose latest record is inside the window
+        # (or has no valid create date, see incremental.py)
+        query += f"    AND {window_condition('cst_create_date')}\n"
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_customers',
+                         fetchsize=itersize, parameters=window)
+    return SQLSource(connection=conn, query=query, parameters=window)
 
 
 def transform_customer_row(row):
@@ -66,25 +83,39 @@ def transform_customer_row(row):
     return row
 
 
-def load_customers(conn_wrapper, source_conn):
+def load_customers(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+                   streaming=False, itersize=STREAM_ITERSIZE, window=None, pipelined=False):
     print("  Extracting customers from bronze...")
-    source = extract_customers(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_customers(source_conn, streaming or pipelined, itersize, window))
     
-    customer_table = Dimension(
-        name='crm_cust_info',
-        key='cst_id',
-        attributes=['cst_key', 'cst_firstname', 'cst_lastname', 
-                   'cst_marital_status', 'cst_gndr', 'cst_create_date'],
-        lookupatts=['cst_id'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        customer_table = CopyTable(
+            name='crm_cust_info',
+            attributes=['cst_id', 'cst_key', 'cst_firstname', 'cst_lastname',
+                       'cst_marital_status', 'cst_gndr', 'cst_create_date'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        customer_table = Dimension(
+            name='crm_cust_info',
+            key='cst_id',
+            attributes=['cst_key', 'cst_firstname', 'cst_lastname', 
+                       'cst_marital_status', 'cst_gndr', 'cst_create_date'],
+            lookupatts=['cst_id'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Transforming and loading customers...")
-    for row in source:
-        row = transform_customer_row(row)
-        customer_table.insert(row)
-        count += 1
+    if pipelined:
+        count = run_pipelined(source, transform_customer_row, customer_table.insert)
+    else:
+        for row in source:
+            row = stage.transform(transform_customer_row, row)
+            customer_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} customers into silver.crm_cust_info")
@@ -2,36 +2,57 @@ import pygrametl
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension
 
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
 
-def extract_erp_categories(conn):
+
+def extract_erp_categories(conn, streaming=False, itersize=STREAM_ITERSIZE):
     """Extract ERP product categories from bronze layer"""
     query = """
         SELECT id, cat, subcat, maintenance
         FROM bronze.erp_px_cat_g1v2
     """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_erp_categories', fetchsize=itersize)
     return SQLSource(connection=conn, query=query)
 
 
-def load_erp_categories(conn_wrapper, source_conn):
+def load_erp_categories(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+                        streaming=False, itersize=STREAM_ITERSIZE, pipelined=False):
     """Load ERP product categories into silver layer"""
     print("  Extracting ERP product categories from bronze...")
-    source = extract_erp_categories(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_erp_categories(source_conn, streaming or pipelined, itersize))
     
     # Define target table - simple passthrough, no transformations needed
-    erp_cat_table = Dimension(
-        name='erp_px_cat_g1v2',
-        key='id',
-        attributes=['cat', 'subcat', 'maintenance'],
-        lookupatts=['id'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        erp_cat_table = CopyTable(
+            name='erp_px_cat_g1v2',
+            attributes=['id', 'cat', 'subcat', 'maintenance'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        erp_cat_table = Dimension(
+            name='erp_px_cat_g1v2',
+            key='id',
+            attributes=['cat', 'subcat', 'maintenance'],
+            lookupatts=['id'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Loading ERP product categories...")
-    for row in source:
-        row = dict(row)
-        erp_cat_table.insert(row)
-        count += 1
+    if pipelined:
+        count = run_pipelined(source, None, erp_cat_table.insert)
+    else:
+        for row in source:
+            row = dict(row)
+            erp_cat_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} records into silver.erp_px_cat_g1v2")
@@ -3,6 +3,11 @@ from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension
 from datetime import date
 
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
+
 
 def clean_cid(value):
     """Remove 'NAS' prefix from customer ID"""
@@ -35,12 +40,15 @@ def transform_gender(value):
     return 'n/a'
 
 
-def extract_erp_customers(conn):
+def extract_erp_customers(conn, streaming=False, itersize=STREAM_ITERSIZE):
     """Extract ERP customer demographics from bronze layer"""
     query = """
         SELECT cid, bdate, gen
         FROM bronze.erp_cust_az12
     """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_erp_customers', fetchsize=itersize)
     return SQLSource(connection=conn, query=query)
 
 
@@ -52,27 +60,40 @@ def transform_erp_customer_row(row):
     return row
 
 
-def load_erp_customers(conn_wrapper, source_conn):
+def load_erp_customers(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+                       streaming=False, itersize=STREAM_ITERSIZE, pipelined=False):
     """Load ERP customer demographics into silver layer"""
     print("  Extracting ERP customer demographics from bronze...")
-    source = extract_erp_customers(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_erp_customers(source_conn, streaming or pipelined, itersize))
     
     # Define target table
-    erp_cust_table = Dimension(
-        name='erp_cust_az12',
-        key='cid',
-        attributes=['bdate', 'gen'],
-        lookupatts=['cid'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        erp_cust_table = CopyTable(
+            name='erp_cust_az12',
+            attributes=['cid', 'bdate', 'gen'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        erp_cust_table = Dimension(
+            name='erp_cust_az12',
+            key='cid',
+            attributes=['bdate', 'gen'],
+            lookupatts=['cid'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Transforming and loading ERP customer demographics...")
-    for row in source:
-        row = dict(row)
-        row = transform_erp_customer_row(row)
-        erp_cust_table.insert(row)
-        count += 1
+    if pipelined:
+        count = run_pipelined(source, transform_erp_customer_row, erp_cust_table.insert)
+    else:
+        for row in source:
+            row = dict(row)
+            row = stage.transform(transform_erp_customer_row, row)
+            erp_cust_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} records into silver.erp_cust_az12")
@@ -2,6 +2,11 @@ import pygrametl
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension
 
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
+
 
 def clean_cid(value):
     """Remove dashes from customer ID"""
@@ -27,12 +32,15 @@ def transform_country(value):
     return country_map.get(value, value)
 
 
-def extract_erp_locations(conn):
+def extract_erp_locations(conn, streaming=False, itersize=STREAM_ITERSIZE):
     """Extract ERP locations from bronze layer"""
     query = """
         SELECT cid, cntry
         FROM bronze.erp_loc_a101
     """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_erp_locations', fetchsize=itersize)
     return SQLSource(connection=conn, query=query)
 
 
@@ -43,27 +51,40 @@ def transform_erp_location_row(row):
     return row
 
 
-def load_erp_locations(conn_wrapper, source_conn):
+def load_erp_locations(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+                       streaming=False, itersize=STREAM_ITERSIZE, pipelined=False):
     """Load ERP locations into silver layer"""
     print("  Extracting ERP locations from bronze...")
-    source = extract_erp_locations(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_erp_locations(source_conn, streaming or pipelined, itersize))
     
     # Define target table
-    erp_loc_table = Dimension(
-        name='erp_loc_a101',
-        key='cid',
-        attributes=['cntry'],
-        lookupatts=['cid'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        erp_loc_table = CopyTable(
+            name='erp_loc_a101',
+            attributes=['cid', 'cntry'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        erp_loc_table = Dimension(
+            name='erp_loc_a101',
+            key='cid',
+            attributes=['cntry'],
+            lookupatts=['cid'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Transforming and loading ERP locations...")
-    for row in source:
-        row = dict(row)
-        row = transform_erp_location_row(row)
-        erp_loc_table.insert(row)
-        count += 1
+    if pipelined:
+        count = run_pipelined(source, transform_erp_location_row, erp_loc_table.insert)
+    else:
+        for row in source:
+            row = dict(row)
+            row = stage.transform(transform_erp_location_row, row)
+            erp_loc_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} records into silver.erp_loc_a101")
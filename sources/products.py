@@ -2,6 +2,12 @@ import pygrametl
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import Dimension
 
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
+from incremental import window_condition
+
 
 def transform_product_line(value):
     """Transform product line codes to descriptive values"""
@@ -33,8 +39,11 @@ def extract_prd_key(prd_key):
     return prd_key[6:] if len(prd_key) > 6 else prd_key
 
 
-def extract_products(conn):
-    """Extract products from bronze layer with end date calculation"""
+def extract_products(conn, streaming=False, itersize=STREAM_ITERSIZE, window=None):
+    """
+    Extract products from bronze layer with end date calculation
+    window: optional {'low': ..., 'high': ...} watermark range for incremental refresh
+    """
     query = """
         SELECT 
             prd_id,
@@ -49,7 +58,20 @@ def extract_products(conn):
             ) AS prd_end_dt
         FROM bronze.crm_prd_info
     """
-    return SQLSource(connection=conn, query=query)
+    if window is not None:
+        # Incremental refresh: every version of a product with a new version in the
+        # window is re-extracted, so that the previous version's prd_end_dt is updated
+        query += f"""
+        WHERE prd_key IN (
+            SELECT prd_key FROM bronze.crm_prd_info
+            WHERE {window_condition('prd_start_dt')}
+        )
+    """
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_products',
+                         fetchsize=itersize, parameters=window)
+    return SQLSource(connection=conn, query=query, parameters=window)
 
 
 def transform_product_row(row):
@@ -72,28 +94,42 @@ def transform_product_row(row):
     return row
 
 
-def load_products(conn_wrapper, source_conn):
+def load_products(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+                  streaming=False, itersize=STREAM_ITERSIZE, window=None, pipelined=False):
     """Load products into silver layer"""
     print("  Extracting products from bronze...")
-    source = extract_products(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_products(source_conn, streaming or pipelined, itersize, window))
     
     # Define target table
-    product_table = Dimension(
-        name='crm_prd_info',
-        key='prd_id',
-        attributes=['cat_id', 'prd_key', 'prd_nm', 'prd_cost', 
-                   'prd_line', 'prd_start_dt', 'prd_end_dt'],
-        lookupatts=['prd_id'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        product_table = CopyTable(
+            name='crm_prd_info',
+            attributes=['prd_id', 'cat_id', 'prd_key', 'prd_nm', 'prd_cost',
+                       'prd_line', 'prd_start_dt', 'prd_end_dt'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        product_table = Dimension(
+            name='crm_prd_info',
+            key='prd_id',
+            attributes=['cat_id', 'prd_key', 'prd_nm', 'prd_cost', 
+                       'prd_line', 'prd_start_dt', 'prd_end_dt'],
+            lookupatts=['prd_id'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Transforming and loading products...")
-    for row in source:
-        row = dict(row)  # Convert to mutable dict
-        row = transform_product_row(row)
-        product_table.insert(row)
-        count += 1
+    if pipelined:
+        count = run_pipelined(source, transform_product_row, product_table.insert)
+    else:
+        for row in source:
+            row = dict(row)  # Convert to mutable dict
+            row = stage.transform(transform_product_row, row)
+            product_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} products into silver.crm_prd_info")
@@ -0,0 +1,234 @@
+"""
+Set-based (SQL pushdown) execution of the Bronze → Silver transforms
+
+Each silver table gets an INSERT ... SELECT that applies the same cleaning
+rules as the Python transform functions inside PostgreSQL, so no row is
+shipped to the client. check_pushdown_parity compares both engines.
+"""
+from pygrametl import ConnectionWrapper
+
+from incremental import create_staging_table
+
+# Python's str.strip() whitespace (ASCII subset); the vertical tab is spelled \013
+# because E'' strings have no \v escape (it would stand for a plain 'v')
+WHITESPACE = r"E' \t\n\r\f\013'"
+
+
+def sql_trim(column):
+    """SQL equivalent of str(value).strip()"""
+    return f"BTRIM({column}, {WHITESPACE})"
+
+
+def sql_parse_date_int(column):
+    """
+    SQL equivalent of parse_date_int: YYYYMMDD integer to DATE, NULL if invalid
+    Nested CASEs make sure make_date only sees a valid year/month/day
+    """
+    year = f"({column} / 10000)"
+    month = f"({column} / 100 % 100)"
+    day = f"({column} % 100)"
+    return f"""CASE
+                WHEN {column} BETWEEN 10000000 AND 99999999
+                     AND {month} BETWEEN 1 AND 12 AND {day} BETWEEN 1 AND 31
+                THEN CASE
+                    WHEN {day} <= EXTRACT(DAY FROM make_date({year}, {month}, 1)
+                                          + INTERVAL '1 month' - INTERVAL '1 day')
+                    THEN make_date({year}, {month}, {day})
+                END
+            END"""
+
+
+# silver table -> (target columns, SELECT producing them from bronze)
+PUSHDOWN_QUERIES = {
+    'crm_cust_info': (
+        ['cst_id', 'cst_key', 'cst_firstname', 'cst_lastname',
+         'cst_marital_status', 'cst_gndr', 'cst_create_date'],
+        f"""
+        SELECT
+            cst_id,
+            cst_key,
+            {sql_trim('cst_firstname')},
+            {sql_trim('cst_lastname')},
+            CASE UPPER({sql_trim('cst_marital_status')})
+                WHEN 'M' THEN 'Married'
+                WHEN 'S' THEN 'Single'
+                ELSE 'n/a'
+            END,
+            CASE UPPER({sql_trim('cst_gndr')})
+                WHEN 'F' THEN 'Female'
+                WHEN 'M' THEN 'Male'
+                ELSE 'n/a'
+            END,
+            cst_create_date
+        FROM (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY cst_id ORDER BY cst_create_date DESC) AS flag_last
+            FROM bronze.crm_cust_info
+            WHERE cst_id IS NOT NULL
+        ) t
+        WHERE flag_last = 1
+        """
+    ),
+    'crm_prd_info': (
+        ['prd_id', 'cat_id', 'prd_key', 'prd_nm', 'prd_cost',
+         'prd_line', 'prd_start_dt', 'prd_end_dt'],
+        f"""
+        SELECT
+            prd_id,
+            CASE WHEN LENGTH(prd_key) >= 5 THEN REPLACE(LEFT(prd_key, 5), '-', '_') ELSE prd_key END,
+            CASE WHEN LENGTH(prd_key) > 6 THEN SUBSTRING(prd_key FROM 7) ELSE prd_key END,
+            prd_nm,
+            COALESCE(prd_cost, 0),
+            CASE UPPER({sql_trim('prd_line')})
+                WHEN 'M' THEN 'Mountain'
+                WHEN 'R' THEN 'Road'
+                WHEN 'S' THEN 'Other Sales'
+                WHEN 'T' THEN 'Touring'
+                ELSE 'n/a'
+            END,
+            prd_start_dt,
+            CAST(
+                LEAD(prd_start_dt) OVER (PARTITION BY prd_key ORDER BY prd_start_dt) - 1
+                AS DATE
+            )
+        FROM bronze.crm_prd_info
+        """
+    ),
+    'crm_sales_details': (
+        ['sls_ord_num', 'sls_prd_key', 'sls_cust_id', 'sls_order_dt', 'sls_ship_dt',
+         'sls_due_dt', 'sls_sales', 'sls_quantity', 'sls_price'],
+        f"""
+        SELECT
+            sls_ord_num,
+            sls_prd_key,
+            sls_cust_id,
+            {sql_parse_date_int('sls_order_dt')},
+            {sql_parse_date_int('sls_ship_dt')},
+            {sql_parse_date_int('sls_due_dt')},
+            sls_sales,
+            sls_quantity,
+            CASE
+                WHEN sls_price IS NULL OR sls_price <= 0 THEN
+                    CASE WHEN COALESCE(sls_quantity, 0) != 0
+                        THEN sls_sales::numeric / sls_quantity
+                        ELSE 0
+                    END
+                ELSE sls_price
+            END
+        FROM (
+            SELECT
+                sls_ord_num, sls_prd_key, sls_cust_id,
+                sls_order_dt, sls_ship_dt, sls_due_dt,
+                CASE
+                    WHEN sls_sales IS NULL OR sls_sales <= 0 OR sls_sales != expected_sales
+                    THEN expected_sales
+                    ELSE sls_sales
+                END AS sls_sales,
+                sls_quantity,
+                sls_price
+            FROM (
+                SELECT *,
+                    COALESCE(sls_quantity, 0) * ABS(COALESCE(sls_price, 0)) AS expected_sales
+                FROM bronze.crm_sales_details
+            ) b
+        ) t
+        """
+    ),
+    'erp_cust_az12': (
+        ['cid', 'bdate', 'gen'],
+        f"""
+        SELECT
+            CASE WHEN cid LIKE 'NAS%' THEN SUBSTRING(cid FROM 4) ELSE cid END,
+            CASE WHEN bdate > CURRENT_DATE THEN NULL ELSE bdate END,
+            CASE
+                WHEN UPPER({sql_trim('gen')}) IN ('F', 'FEMALE') THEN 'Female'
+                WHEN UPPER({sql_trim('gen')}) IN ('M', 'MALE') THEN 'Male'
+                ELSE 'n/a'
+            END
+        FROM bronze.erp_cust_az12
+        """
+    ),
+    'erp_loc_a101': (
+        ['cid', 'cntry'],
+        f"""
+        SELECT
+            REPLACE(cid, '-', ''),
+            CASE
+                WHEN cntry IS NULL OR {sql_trim('cntry')} = '' THEN 'n/a'
+                WHEN {sql_trim('cntry')} = 'DE' THEN 'Germany'
+                WHEN {sql_trim('cntry')} IN ('US', 'USA') THEN 'United States'
+                ELSE {sql_trim('cntry')}
+            END
+        FROM bronze.erp_loc_a101
+        """
+    ),
+    'erp_px_cat_g1v2': (
+        ['id', 'cat', 'subcat', 'maintenance'],
+        """
+        SELECT id, cat, subcat, maintenance
+        FROM bronze.erp_px_cat_g1v2
+        """
+    ),
+}
+
+
+def pushdown_statement(table, target=None):
+    """Build the INSERT ... SELECT loading a silver table (or another target)"""
+    columns, query = PUSHDOWN_QUERIES[table]
+    target = target or f"silver.{table}"
+    return f"INSERT INTO {target} ({', '.join(columns)}){query}"
+
+
+def load_pushdown(conn, table, target=None):
+    """Run the set-based transform of one silver table inside the database (not committed)"""
+    cur = conn.cursor()
+    cur.execute(pushdown_statement(table, target))
+    count = cur.rowcount
+    cur.close()
+    return count
+
+
+def check_pushdown_parity(source_conn, target_conn, silver_loaders):
+    """
+    Compare the SQL engine with the Python loaders without touching silver
+    Both engines load into temporary tables; returns
+    {table: (rows only in the Python output, rows only in the SQL output)}.
+    silver_loaders is a list of (table, load_function) pairs.
+    """
+    results = {}
+    cur = target_conn.cursor()
+    cur.execute("SET search_path = 'silver'")
+    conn_wrapper = ConnectionWrapper(target_conn)
+
+    for table, load_function in silver_loaders:
+        columns = ', '.join(PUSHDOWN_QUERIES[table][0])
+
+        # Python engine: pg_temp.<table> shadows silver.<table> for the loader
+        create_staging_table(target_conn, table)
+        load_function(conn_wrapper, source_conn)
+
+        cur.execute(f"DROP TABLE IF EXISTS pg_temp.{table}_pushdown")
+        cur.execute(f"CREATE TEMP TABLE {table}_pushdown (LIKE silver.{table} INCLUDING DEFAULTS)")
+        load_pushdown(target_conn, table, target=f"pg_temp.{table}_pushdown")
+
+        cur.execute(f"""
+            SELECT
+                (SELECT COUNT(*) FROM (
+                    SELECT {columns} FROM pg_temp.{table}
+                    EXCEPT ALL
+                    SELECT {columns} FROM pg_temp.{table}_pushdown
+                ) python_only),
+                (SELECT COUNT(*) FROM (
+                    SELECT {columns} FROM pg_temp.{table}_pushdown
+                    EXCEPT ALL
+                    SELECT {columns} FROM pg_temp.{table}
+                ) sql_only)
+        """)
+        results[table] = cur.fetchone()
+
+        cur.execute(f"DROP TABLE pg_temp.{table}")
+        cur.execute(f"DROP TABLE pg_temp.{table}_pushdown")
+        target_conn.commit()
+
+    cur.close()
+    return results
@@ -2,6 +2,27 @@ import pygrametl
 from pygrametl.datasources import SQLSource
 from pygrametl.tables import FactTable
 from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from bulk_load import CopyTable, BULK_BUFFER_SIZE
+from db import STREAM_ITERSIZE
+from metrics import current_stage
+from pipelined import run_pipelined
+from incremental import window_condition
+
+# Rows transformed per vectorized chunk by load_sales(batch=True)
+TRANSFORM_BATCH_SIZE = 10000
+# Slice of the orders extracted by extract_sales(partition=(index, count)): the
+# order number's hash (masked to non-negative) modulo count, so the slices are
+# disjoint, cover every row (NULL order numbers hash as '') and keep the lines
+# of one order together
+SALES_PARTITION_FILTER = "(hashtext(COALESCE(sls_ord_num, '')) & 2147483647) %% %(partitions)s = %(partition)s"
+
+SALES_COLUMNS = ['sls_ord_num', 'sls_prd_key', 'sls_cust_id', 'sls_order_dt', 'sls_ship_dt',
+                 'sls_due_dt', 'sls_sales', 'sls_quantity', 'sls_price']
 
 
 def parse_date_int(value):
@@ -44,8 +65,13 @@ def calculate_price(row):
     return sls_price
 
 
-def extract_sales(conn):
-    """Extract sales from bronze layer"""
+def extract_sales(conn, streaming=False, itersize=STREAM_ITERSIZE, window=None, partition=None):
+    """
+    Extract sales from bronze layer
+    window: optional {'low': ..., 'high': ...} watermark range for incremental refresh
+    partition: optional (index, count) to extract one of `count` disjoint slices
+    of the orders (see SALES_PARTITION_FILTER)
+    """
     query = """
         SELECT 
             sls_ord_num,
@@ -59,7 +85,24 @@ def extract_sales(conn):
             sls_price
         FROM bronze.crm_sales_details
     """
-    return SQLSource(connection=conn, query=query)
+    conditions = []
+    parameters = {}
+    if window is not None:
+        # Incremental refresh: only orders placed inside the window (or without a
+        # valid order date, see incremental.py)
+        conditions.append(window_condition('sls_order_dt'))
+        parameters.update(window)
+    if partition is not None:
+        conditions.append(SALES_PARTITION_FILTER)
+        parameters['partition'], parameters['partitions'] = partition
+    if conditions:
+        query += f"    WHERE {' AND '.join(conditions)}\n"
+    parameters = parameters or None
+    if streaming:
+        # Named server-side cursor: rows are fetched `itersize` at a time
+        return SQLSource(connection=conn, query=query, cursorarg='extract_sales',
+                         fetchsize=itersize, parameters=parameters)
+    return SQLSource(connection=conn, query=query, parameters=parameters)
 
 
 def transform_sales_row(row):
@@ -76,27 +119,136 @@ def transform_sales_row(row):
     return row
 
 
-def load_sales(conn_wrapper, source_conn):
-    """Load sales into silver layer"""
+def parse_date_int_array(values):
+    """
+    Vectorized parse_date_int: YYYYMMDD integers to date objects (None if invalid)
+    Only positive 8-digit values naming a real calendar date are kept, which is
+    exactly what strptime('%Y%m%d') accepts for an 8-character integer string.
+    """
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    valid = (numbers >= 10000000) & (numbers <= 99999999)
+    numbers = np.where(valid, numbers, 19700101).astype('int64')
+    
+    year = numbers // 10000
+    month = numbers // 100 % 100
+    day = numbers % 100
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    
+    months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + (np.clip(day, 1, 31) - 1).astype('timedelta64[D]')
+    # Day overflow (e.g. 20240231) rolls into the next month
+    valid &= dates.astype('datetime64[M]') == months
+    
+    result = np.full(len(numbers), None, dtype=object)
+    result[valid] = dates[valid].astype(object)
+    return result
+
+
+def calculate_sales_array(sales, quantity, price):
+    """Vectorized calculate_sales over numeric arrays (NaN for NULL)"""
+    quantity = np.nan_to_num(quantity)
+    expected_sales = quantity * np.abs(np.nan_to_num(price))
+    invalid = np.isnan(sales) | (sales <= 0) | (sales != expected_sales)
+    return np.where(invalid, expected_sales, sales)
+
+
+def calculate_price_array(price, sales, quantity):
+    """
+    Vectorized calculate_price over numeric arrays (NaN for NULL)
+    Returns an object array: original prices stay ints, derived ones are floats
+    as with sls_sales / sls_quantity in the row-wise function
+    """
+    quantity = np.nan_to_num(quantity)
+    invalid = np.isnan(price) | (price <= 0)
+    derived = invalid & (quantity != 0)
+    
+    result = np.empty(len(price), dtype=object)
+    result[~invalid] = price[~invalid].astype('int64').tolist()
+    result[derived] = (np.nan_to_num(sales[derived]) / quantity[derived]).tolist()
+    result[invalid & (quantity == 0)] = 0
+    return result
+
+
+def transform_sales_batch(df):
+    """
+    Apply the sales transformations to a chunk of rows with vectorized operations
+    df holds the extract_sales columns (object dtype); the returned DataFrame's
+    records are identical to applying transform_sales_row to each row
+    """
+    df = df.copy()
+    
+    df['sls_order_dt'] = parse_date_int_array(df['sls_order_dt'])
+    df['sls_ship_dt'] = parse_date_int_array(df['sls_ship_dt'])
+    df['sls_due_dt'] = parse_date_int_array(df['sls_due_dt'])
+    
+    sales = pd.to_numeric(df['sls_sales']).to_numpy(dtype='float64')
+    quantity = pd.to_numeric(df['sls_quantity']).to_numpy(dtype='float64')
+    price = pd.to_numeric(df['sls_price']).to_numpy(dtype='float64')
+    
+    sales = calculate_sales_array(sales, quantity, price)
+    df['sls_sales'] = np.array(sales.astype('int64').tolist(), dtype=object)
+    df['sls_price'] = calculate_price_array(price, sales, quantity)
+    
+    return df
+
+
+def iter_sales_batches(source, batchsize=TRANSFORM_BATCH_SIZE):
+    """Group extracted rows into transformed DataFrame chunks of `batchsize` rows"""
+    rows = iter(source)
+    while True:
+        chunk = list(islice(rows, batchsize))
+        if not chunk:
+            break
+        yield transform_sales_batch(pd.DataFrame(chunk, columns=SALES_COLUMNS, dtype=object))
+
+
+def load_sales(conn_wrapper, source_conn, bulk=False, buffersize=BULK_BUFFER_SIZE,
+               streaming=False, itersize=STREAM_ITERSIZE, window=None,
+               batch=False, batchsize=TRANSFORM_BATCH_SIZE, pipelined=False, partition=None):
+    """
+    Load sales into silver layer
+    With batch=True rows are transformed in vectorized chunks of `batchsize`;
+    with pipelined=True reads from a server-side cursor, row transforms and
+    inserts overlap on three threads (see pipelined.py); partition=(index, count) loads one slice of the
+    orders, so that `count` processes can load the table together
+    """
     print("  Extracting sales from bronze...")
-    source = extract_sales(source_conn)
+    stage = current_stage()
+    source = stage.extract(extract_sales(source_conn, streaming or pipelined, itersize, window, partition))
     
     # Define target table
-    sales_table = FactTable(
-        name='crm_sales_details',
-        keyrefs=['sls_cust_id'],
-        measures=['sls_ord_num', 'sls_prd_key', 'sls_order_dt', 'sls_ship_dt',
-                 'sls_due_dt', 'sls_sales', 'sls_quantity', 'sls_price'],
-        targetconnection=conn_wrapper
-    )
+    if bulk:
+        sales_table = CopyTable(
+            name='crm_sales_details',
+            attributes=['sls_ord_num', 'sls_prd_key', 'sls_cust_id', 'sls_order_dt',
+                       'sls_ship_dt', 'sls_due_dt', 'sls_sales', 'sls_quantity', 'sls_price'],
+            targetconnection=conn_wrapper,
+            buffersize=buffersize
+        )
+    else:
+        sales_table = FactTable(
+            name='crm_sales_details',
+            keyrefs=['sls_cust_id'],
+            measures=['sls_ord_num', 'sls_prd_key', 'sls_order_dt', 'sls_ship_dt',
+                     'sls_due_dt', 'sls_sales', 'sls_quantity', 'sls_price'],
+            targetconnection=conn_wrapper
+        )
     
     count = 0
     print("  Transforming and loading sales...")
-    for row in source:
-        row = dict(row)  # Convert to mutable dict
-        row = transform_sales_row(row)
-        sales_table.insert(row)
-        count += 1
+    if batch:
+        for chunk in stage.transform_batches(iter_sales_batches(source, batchsize)):
+            for row in chunk.to_dict('records'):
+                sales_table.insert(row)
+                count += 1
+    elif pipelined:
+        count = run_pipelined(source, transform_sales_row, sales_table.insert)
+    else:
+        for row in source:
+            row = dict(row)  # Convert to mutable dict
+            row = stage.transform(transform_sales_row, row)
+            sales_table.insert(row)
+            count += 1
     
     conn_wrapper.commit()
     print(f"  ✓ Loaded {count} sales records into silver.crm_sales_details")
@@ -0,0 +1,59 @@
+"""
+COPY path of the bulk writer, checked without a database: the rows a
+CopyTable streams are captured by a stand-in cursor
+"""
+import csv
+import io
+
+import pygrametl
+
+import sys
+sys.path.append('.')
+from bulk_load import CopyTable, format_copy_value
+from sources.sales import calculate_price
+
+
+class CapturingCursor(object):
+    def __init__(self, copied):
+        self.copied = copied
+
+    def copy_expert(self, sql, buffer):
+        self.copied.append((sql, buffer.read()))
+
+    def close(self):
+        pass
+
+
+class CapturingConnection(object):
+    def __init__(self):
+        self.copied = []
+
+    def cursor(self):
+        return CapturingCursor(self.copied)
+
+
+def copy_rows(rows, attributes):
+    """Stream rows through a CopyTable and return the CSV records it sent to COPY"""
+    connection = CapturingConnection()
+    table = CopyTable('crm_sales_details', attributes, connection)
+    try:
+        for row in rows:
+            table.insert(row)
+        table.flush()
+    finally:
+        pygrametl._alltables.remove(table)
+    return [record for _, data in connection.copied for record in csv.reader(io.StringIO(data))]
+
+
+def test_derived_price_is_rounded_like_an_insert():
+    price = calculate_price({'sls_price': None, 'sls_sales': 25, 'sls_quantity': 2})
+    assert price == 12.5
+    assert copy_rows([{'sls_price': price}], ['sls_price']) == [['13']]
+
+
+def test_format_copy_value():
+    assert format_copy_value(None) == ''
+    assert format_copy_value(10.0) == '"10"'
+    assert format_copy_value(2.5) == '"3"'
+    assert format_copy_value(-2.5) == '"-3"'
+    assert format_copy_value('say "hi"') == '"say ""hi"""'
@@ -0,0 +1,100 @@
+"""
+Type 2 decisions of the products dimension and the product version lookup of
+the fact load
+"""
+from datetime import date
+
+import sys
+sys.path.append('.')
+from dimensions.dim_products import classify_product_version, product_row_hash, resolve_product_key
+
+TODAY = date(2026, 10, 17)
+
+
+def product(start_date=date(2013, 7, 1), **changes):
+    row = {
+        'product_id': 210, 'product_number': 'FR-R92B-58', 'product_name': 'HL Road Frame - Black- 58',
+        'category_id': 'CO_RF', 'category': 'Components', 'subcategory': 'Road Frames',
+        'maintenance': 'Yes', 'cost': 0, 'product_line': 'Road', 'start_date': start_date,
+    }
+    row.update(changes)
+    row['row_hash'] = product_row_hash(row)
+    return row
+
+
+def current(row, valid_from=None, product_key=1):
+    """Current version tuple as read by get_current_product_versions"""
+    return (product_key, row['row_hash'], row['start_date'], valid_from or row['start_date'])
+
+
+def test_row_hash_tracks_attributes_only():
+    assert product()['row_hash'] == product(start_date=date(2014, 1, 1))['row_hash']
+    assert product()['row_hash'] != product(cost=12)['row_hash']
+    assert product(cost=None)['row_hash'] != product(cost=0)['row_hash']
+
+
+def test_first_version_is_new_from_its_start_date():
+    assert classify_product_version(product(), None, TODAY) == ('new', date(2013, 7, 1))
+
+
+def test_same_hash_is_unchanged():
+    row = product()
+    assert classify_product_version(product(), current(row), TODAY) == ('unchanged', None)
+
+
+def test_older_source_version_is_unchanged():
+    newer = product(start_date=date(2014, 1, 1), cost=20)
+    assert classify_product_version(product(), current(newer), TODAY) == ('unchanged', None)
+
+
+def test_newer_source_version_starts_on_its_own_date():
+    older = product()
+    assert classify_product_version(product(start_date=date(2014, 1, 1), cost=20), current(older), TODAY) \
+        == ('version', date(2014, 1, 1))
+
+
+def test_in_place_change_starts_today():
+    assert classify_product_version(product(cost=20), current(product()), TODAY) == ('version', TODAY)
+
+
+def test_later_in_place_change_is_still_detected():
+    # After an in-place change the current version is valid from the day of the change
+    edited = current(product(cost=20), valid_from=date(2026, 9, 1))
+    assert classify_product_version(product(cost=30), edited, TODAY) == ('version', TODAY)
+
+
+def test_second_change_on_the_same_day_updates_in_place():
+    edited_today = current(product(cost=20), valid_from=TODAY)
+    assert classify_product_version(product(cost=30), edited_today, TODAY) == ('update', TODAY)
+
+
+def test_newer_version_dated_before_the_current_valid_from_starts_today():
+    edited = current(product(cost=20), valid_from=date(2026, 9, 1))
+    assert classify_product_version(product(start_date=date(2020, 1, 1), cost=30), edited, TODAY) \
+        == ('version', TODAY)
+
+
+VERSIONS = [
+    (date(2011, 7, 1), date(2011, 12, 28), 10, False),
+    (date(2011, 12, 29), date(2012, 12, 27), 11, False),
+    (date(2012, 12, 28), None, 12, True),
+]
+
+
+def test_resolve_product_key_picks_the_version_valid_on_the_order_date():
+    assert resolve_product_key(VERSIONS, date(2011, 7, 1)) == 10
+    assert resolve_product_key(VERSIONS, date(2011, 12, 28)) == 10
+    assert resolve_product_key(VERSIONS, date(2011, 12, 29)) == 11
+    assert resolve_product_key(VERSIONS, date(2025, 1, 1)) == 12
+
+
+def test_resolve_product_key_falls_back_to_the_current_version():
+    assert resolve_product_key(VERSIONS, date(2010, 1, 1)) == 12
+    assert resolve_product_key(VERSIONS, None) == 12
+    closed = [(date(2011, 7, 1), date(2011, 12, 28), 10, False)]
+    assert resolve_product_key(closed, date(2020, 1, 1)) == 10
+
+
+def test_resolve_product_key_without_versions():
+    assert resolve_product_key(None, date(2011, 7, 1)) is None
+    assert resolve_product_key([], date(2011, 7, 1)) is None
@@ -0,0 +1,73 @@
+"""
+Set-based fact_sales load, checked without a database: statements go to a
+stand-in connection answering with scripted rows
+"""
+from datetime import date
+
+import sys
+sys.path.append('.')
+from dimensions.fact_sales import load_fact_sales_set_based
+from metrics import measure_stage
+
+
+class ScriptedCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((' '.join(sql.split()), params))
+        self.rowcount = self.connection.rowcount
+
+    def fetchone(self):
+        return self.connection.answers.pop(0)
+
+    def close(self):
+        pass
+
+
+class ScriptedConnection(object):
+    def __init__(self, rowcount, answers):
+        self.statements = []
+        self.rowcount = rowcount
+        self.answers = list(answers)
+
+    def cursor(self):
+        return ScriptedCursor(self)
+
+    def commit(self):
+        pass
+
+
+def fact_joins(connection):
+    return [sql for sql, _ in connection.statements if 'LEFT JOIN LATERAL' in sql]
+
+
+def test_skipped_rows_come_from_the_silver_count_not_a_second_join():
+    # 10 silver sales, 7 inserted: 1 unknown customer ID and 2 unknown products
+    connection = ScriptedConnection(rowcount=7, answers=[(10,), (1, 2)])
+    with measure_stage('gold.fact_sales') as stage:
+        assert load_fact_sales_set_based(connection, schema='gold') == 7
+
+    assert len(fact_joins(connection)) == 1
+    assert fact_joins(connection)[0].startswith('INSERT INTO gold.fact_sales ')
+    count, missing = [sql for sql, _ in connection.statements[1:]]
+    assert count == 'SELECT COUNT(*) FROM silver.crm_sales_details s'
+    assert 'IN (SELECT customer_id FROM gold.dim_customers)' in missing
+    assert 'IN (SELECT product_number FROM gold.dim_products)' in missing
+    assert (stage.rows_in, stage.rows_skipped) == (10, 3)
+    assert connection.answers == []
+
+
+def test_no_key_breakdown_when_every_row_is_loaded():
+    window = {'low': date(2013, 3, 1), 'high': date(2013, 3, 31)}
+    connection = ScriptedConnection(rowcount=10, answers=[(10,)])
+    with measure_stage('gold.fact_sales') as stage:
+        assert load_fact_sales_set_based(connection, schema='gold', window=window) == 10
+
+    assert len(fact_joins(connection)) == 1
+    [insert, count] = connection.statements
+    assert insert[0].endswith('AND s.sls_order_dt >= %(low)s AND s.sls_order_dt <= %(high)s')
+    assert count == ('SELECT COUNT(*) FROM silver.crm_sales_details s '
+                     'WHERE s.sls_order_dt >= %(low)s AND s.sls_order_dt <= %(high)s', window)
+    assert stage.rows_skipped == 0
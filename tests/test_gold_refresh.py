@@ -0,0 +1,174 @@
+"""
+Order-date window refresh of Gold, checked without a database: statements
+go to a recording stand-in connection and dimensions are kept in memory
+"""
+import re
+from datetime import date
+
+import sys
+sys.path.append('.')
+from dimensions.dim_customers import CUSTOMER_ATTRIBUTES, upsert_dim_customer
+from dimensions.fact_sales import delete_fact_sales_window, reload_fact_sales_month
+from dimensions.kpi_aggregates import KPI_AGGREGATES, refresh_kpi_aggregates
+
+
+WINDOW = {'low': date(2013, 3, 1), 'high': date(2013, 3, 31)}
+
+
+class RecordingCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((' '.join(sql.split()), params))
+        self.rowcount = self.connection.rowcount
+
+    def fetchone(self):
+        return (self.connection.answer,)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection(object):
+    def __init__(self, rowcount=0, answer=True):
+        self.statements = []
+        self.rowcount = rowcount
+        self.answer = answer
+        self.commits = 0
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class MemoryDimension(object):
+    """The lookup / getbykey / insert / update calls of a pygrametl dimension, on a dict"""
+    def __init__(self, rows=()):
+        self.rows = {key: dict(row) for key, row in enumerate(rows, 1)}
+
+    def lookup(self, row):
+        for key, existing in self.rows.items():
+            if existing['customer_id'] == row['customer_id']:
+                return key
+        return None
+
+    def getbykey(self, key):
+        return dict(self.rows[key], customer_key=key)
+
+    def insert(self, row):
+        key = len(self.rows) + 1
+        self.rows[key] = {att: row[att] for att in CUSTOMER_ATTRIBUTES}
+        return key
+
+    def update(self, row):
+        self.rows[row['customer_key']].update({att: row[att] for att in CUSTOMER_ATTRIBUTES})
+
+
+def customer(customer_id, **changes):
+    row = {att: f"{att}-{customer_id}" for att in CUSTOMER_ATTRIBUTES}
+    row['customer_id'] = customer_id
+    row.update(changes)
+    return row
+
+
+def test_delete_fact_sales_window_deletes_the_inclusive_range_without_committing():
+    connection = RecordingConnection(rowcount=42)
+    assert delete_fact_sales_window(connection, WINDOW, 'gold_shadow') == 42
+
+    [(sql, params)] = connection.statements
+    assert sql == ("DELETE FROM gold_shadow.fact_sales "
+                   "WHERE order_date >= %(low)s AND order_date <= %(high)s")
+    assert params is WINDOW
+    assert connection.commits == 0
+
+
+def test_upsert_dim_customer_inserts_new_customers():
+    dim_customers = MemoryDimension([customer(1)])
+    assert upsert_dim_customer(dim_customers, customer(2)) == 'new'
+    assert dim_customers.rows[2] == customer(2)
+
+
+def test_upsert_dim_customer_updates_changed_customers_in_place():
+    dim_customers = MemoryDimension([customer(1), customer(2)])
+    row = customer(2, country='France')
+    assert upsert_dim_customer(dim_customers, row) == 'updated'
+    assert row['customer_key'] == 2
+    assert dim_customers.rows[2]['country'] == 'France'
+    assert len(dim_customers.rows) == 2
+
+
+def test_upsert_dim_customer_leaves_unchanged_customers_alone():
+    dim_customers = MemoryDimension([customer(1)])
+    dim_customers.update = None
+    dim_customers.insert = None
+    row = customer(1)
+    assert upsert_dim_customer(dim_customers, row) == 'unchanged'
+    assert 'customer_key' not in row
+
+
+def test_window_refresh_replaces_only_the_affected_aggregate_rows():
+    connection = RecordingConnection(rowcount=3)
+    results = refresh_kpi_aggregates(connection, 'gold', WINDOW)
+    sqls = [sql for sql, _ in connection.statements]
+
+    assert results == {table: 3 for table in KPI_AGGREGATES}
+    assert not any(sql.startswith(('DROP TABLE IF EXISTS gold.', 'CREATE TABLE')) for sql in sqls)
+    for table in KPI_AGGREGATES:
+        [delete] = [sql for sql in sqls if sql.startswith(f"DELETE FROM gold.{table} ")]
+        [insert] = [sql for sql in sqls if sql.startswith(f"INSERT INTO gold.{table} ")]
+        assert sqls.index(delete) < sqls.index(insert)
+        if table != 'agg_sales_summary':
+            assert 'kpi_refresh_keys' in delete and 'kpi_refresh_keys' in insert
+
+    # The window's keys and those of the customers updated in place are recorded first
+    recorded = [(sql, params) for sql, params in connection.statements
+                if sql.startswith('INSERT INTO pg_temp.kpi_refresh_keys')]
+    assert len(recorded) == 2
+    assert recorded[0][0].endswith("WHERE f.order_date >= %(low)s AND f.order_date <= %(high)s")
+    assert re.search(r"WHERE f\.customer_key IN \( SELECT a\.customer_key FROM gold\.agg_sales_by_customer",
+                     recorded[1][0])
+    assert sqls[-1] == 'DROP TABLE pg_temp.kpi_refresh_keys;'
+    assert connection.commits == 1
+
+
+def test_full_refresh_rebuilds_every_aggregate():
+    connection = RecordingConnection(rowcount=3)
+    refresh_kpi_aggregates(connection, 'gold')
+    sqls = [sql for sql, _ in connection.statements]
+
+    created = [sql.split()[2] for sql in sqls if sql.startswith('CREATE TABLE')]
+    assert created == [f"gold.{table}" for table in KPI_AGGREGATES]
+    assert not any('kpi_refresh_keys' in sql for sql in sqls if sql.startswith('CREATE TABLE'))
+
+
+def test_reload_fact_sales_month_swaps_in_a_new_partition():
+    connection = RecordingConnection(rowcount=5)
+    assert reload_fact_sales_month(connection, date(2013, 12, 17), 'gold') == 5
+    sqls = [sql for sql, _ in connection.statements]
+    bounds = (date(2013, 12, 1), date(2014, 1, 1))
+
+    [insert] = [(sql, params) for sql, params in connection.statements if sql.startswith('INSERT')]
+    assert insert[0].startswith('INSERT INTO gold.fact_sales_p201312_load ')
+    assert insert[1] == bounds
+    assert 'ALTER TABLE gold.fact_sales DETACH PARTITION gold.fact_sales_p201312' in sqls
+    [attach] = [(sql, params) for sql, params in connection.statements if 'ATTACH PARTITION' in sql]
+    assert attach == ('ALTER TABLE gold.fact_sales ATTACH PARTITION gold.fact_sales_p201312 '
+                      'FOR VALUES FROM (%s) TO (%s)', bounds)
+    assert not any(sql.startswith('DELETE') for sql in sqls)
+    assert connection.commits == 1
+
+
+def test_reload_fact_sales_month_replaces_the_month_of_a_plain_fact_table():
+    connection = RecordingConnection(rowcount=5, answer=False)
+    assert reload_fact_sales_month(connection, date(2014, 2, 1), 'gold') == 5
+
+    [delete, insert] = [(sql, params) for sql, params in connection.statements
+                        if sql.startswith(('DELETE', 'INSERT'))]
+    assert delete[1] == {'low': date(2014, 2, 1), 'high': date(2014, 2, 28)}
+    assert insert[0].startswith('INSERT INTO gold.fact_sales ')
+    assert insert[1] == (date(2014, 2, 1), date(2014, 3, 1))
+    assert connection.commits == 1
@@ -0,0 +1,45 @@
+"""
+Shadow gold schema setup, checked without a database: statements go to a
+recording stand-in connection
+"""
+import sys
+sys.path.append('.')
+from db import GOLD_PRODUCT_VERSION_COLUMNS, create_gold_shadow_schema
+
+
+class RecordingCursor(object):
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql, params=None):
+        self.statements.append(' '.join(sql.split()))
+
+    def fetchone(self):
+        return (True,)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection(object):
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return RecordingCursor(self.statements)
+
+    def commit(self):
+        pass
+
+
+def test_live_dim_products_is_migrated_before_its_history_is_copied():
+    connection = RecordingConnection()
+    create_gold_shadow_schema(connection)
+    statements = connection.statements
+
+    [copy] = [index for index, sql in enumerate(statements)
+              if sql.startswith('INSERT INTO gold_shadow.dim_products')]
+    for column in GOLD_PRODUCT_VERSION_COLUMNS:
+        migration = f"ALTER TABLE gold.dim_products ADD COLUMN IF NOT EXISTS {column} "
+        assert any(sql.startswith(migration) for sql in statements[:copy]), column
+        assert column in statements[copy]
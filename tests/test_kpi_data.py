@@ -0,0 +1,202 @@
+"""
+chart_data checked against the per-chart queries it replaced: synthetic KPI
+aggregate tables are answered once as the KPI_QUERY result set and once per
+chart as the old queries did (ORDER BY, LIMIT and COALESCE included), and
+every chart must get the same frame
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sys
+sys.path.append('.')
+from dashboards.kpi_data import KPI_COLUMNS, KPI_GROUPINGS, chart_data, load_kpi_data
+
+CATEGORIES = ['Bikes', 'Components', 'Clothing', 'Accessories', None]
+COUNTRIES = ['France', 'Germany', 'United States', 'Canada', 'Australia', 'United Kingdom',
+             'Spain', 'Italy', 'n/a', None]
+GENDERS = ['Female', 'Male', 'n/a']
+MARITAL_STATUSES = ['Married', 'Single', None]
+PRODUCT_LINES = ['Mountain', 'Road', 'Touring', 'Other Sales', None]
+
+
+def synthetic_tables(seed=11):
+    """The KPI aggregate tables (dimensions/kpi_aggregates.py) of a made-up load"""
+    rng = random.Random(seed)
+    months = pd.date_range('2012-01-01', periods=18, freq='MS', tz='UTC')
+    cube = pd.DataFrame([
+        {
+            'month': rng.choice(list(months)), 'category': category, 'country': rng.choice(COUNTRIES),
+            'gender': rng.choice(GENDERS), 'marital_status': rng.choice(MARITAL_STATUSES),
+            'product_line': rng.choice(PRODUCT_LINES),
+            'total_sales': rng.randrange(1, 10**7), 'total_quantity': rng.randrange(1, 500),
+            'nb_transactions': rng.randrange(1, 300), 'nb_sales': rng.randrange(0, 300),
+            'price_sum': rng.randrange(0, 10**6), 'price_count': rng.randrange(0, 300),
+        }
+        for category in CATEGORIES for _ in range(40)
+    ])
+    monthly = pd.DataFrame({'month': months, 'total_sales': rng.sample(range(10**6, 10**7), len(months)),
+                            'nb_orders': [rng.randrange(1, 900) for _ in months]}).sample(frac=1, random_state=1)
+    by_product = pd.DataFrame({
+        'product_name': [f"Product {i}" for i in range(30)],
+        'total_sales': rng.sample(range(10**3, 10**7), 30),
+        'total_quantity': [rng.randrange(1, 500) for _ in range(30)],
+    })
+    by_customer = pd.DataFrame({
+        'customer_key': range(1, 61),
+        'customer_name': [f"Customer {i}" for i in range(60)],
+        'country': [rng.choice(COUNTRIES) for _ in range(60)],
+        'gender': [rng.choice(GENDERS) for _ in range(60)],
+        'marital_status': [rng.choice(MARITAL_STATUSES) for _ in range(60)],
+        'total_spent': rng.sample(range(10**3, 10**7), 60),
+        'nb_orders': [rng.randrange(1, 40) for _ in range(60)],
+    })
+    summary = pd.DataFrame([{
+        'total_revenue': int(cube['total_sales'].sum()),
+        'total_orders': int(by_customer['nb_orders'].sum()),
+        'total_customers': len(by_customer),
+        'avg_order_value': cube['total_sales'].sum() / cube['nb_sales'].sum(),
+        'total_units': int(cube['total_quantity'].sum()),
+    }])
+    return {'agg_sales_cube': cube, 'agg_sales_monthly': monthly, 'agg_sales_by_product': by_product,
+            'agg_sales_by_customer': by_customer, 'agg_sales_summary': summary}
+
+
+def ratio(numerator, denominator):
+    """SUM(...)::numeric / NULLIF(SUM(...), 0)"""
+    return numerator / denominator.replace(0, np.nan)
+
+
+def cube_rollup(cube, column):
+    groups = cube.groupby(column, dropna=False)
+    sums = groups[['total_sales', 'total_quantity', 'nb_transactions', 'nb_sales',
+                   'price_sum', 'price_count']].sum().reset_index()
+    sums['avg_sales'] = ratio(sums['total_sales'], sums['nb_sales'])
+    sums['avg_price'] = ratio(sums['price_sum'], sums['price_count'])
+    return sums
+
+
+def kpi_query_result(tables):
+    """What KPI_QUERY returns for these tables: one block of rows per grouping, in no particular order"""
+    cube, customers = tables['agg_sales_cube'], tables['agg_sales_by_customer']
+    gender = customers.groupby('gender', dropna=False).agg(
+        total_sales=('total_spent', 'sum'), nb_orders=('nb_orders', 'sum'),
+        nb_customers=('customer_key', 'size')).reset_index()
+    blocks = {
+        'category': cube_rollup(cube, 'category'),
+        'country': cube_rollup(cube, 'country'),
+        'month': tables['agg_sales_monthly'],
+        'gender': gender,
+        'marital_status': cube_rollup(cube, 'marital_status'),
+        'product_line': cube_rollup(cube, 'product_line'),
+        'product': tables['agg_sales_by_product'],
+        'customer': customers[['customer_key', 'customer_name', 'country', 'total_spent', 'nb_orders']].rename(
+            columns={'total_spent': 'total_sales'}),
+        'global': tables['agg_sales_summary'].rename(columns={
+            'total_revenue': 'total_sales', 'total_units': 'total_quantity', 'total_orders': 'nb_orders',
+            'total_customers': 'nb_customers', 'avg_order_value': 'avg_sales'}),
+    }
+    assert set(blocks) == set(KPI_GROUPINGS)
+    frames = []
+    for name, block in blocks.items():
+        block = block.reindex(columns=list(KPI_COLUMNS))
+        block.insert(0, 'grouping_name', name)
+        frames.append(block)
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=3).reset_index(drop=True)
+
+
+def old_chart_queries(tables):
+    """The result of each chart's former query, ORDER BY / LIMIT / COALESCE applied"""
+    cube, customers = tables['agg_sales_cube'], tables['agg_sales_by_customer']
+    monthly = tables['agg_sales_monthly'].sort_values('month')
+
+    def by(column, label=None):
+        rollup = cube_rollup(cube, column).sort_values('total_sales', ascending=False)
+        if label is not None:
+            rollup[column] = rollup[column].fillna(label)
+        return rollup
+
+    def sales(column, n, label=None):
+        return by(column, label).head(n).rename(columns={'total_sales': 'sales'})[[column, 'sales']]
+
+    gender = customers.groupby('gender', dropna=False).agg(
+        total_sales=('total_spent', 'sum'), nb_customers=('customer_key', 'size')).reset_index()
+    summary = tables['agg_sales_summary'].iloc[0]
+    return {
+        'kpi_sales_by_category': by('category', 'Non catégorisé')[
+            ['category', 'total_sales', 'total_quantity', 'nb_transactions']],
+        'kpi_sales_by_country': by('country', 'Inconnu').head(8)[['country', 'total_sales']],
+        'kpi_sales_over_time': monthly[['month', 'total_sales', 'nb_orders']],
+        'kpi_top_products': tables['agg_sales_by_product'].sort_values('total_sales', ascending=False).head(10)[
+            ['product_name', 'total_sales', 'total_quantity']],
+        'kpi_top_customers': customers.sort_values('total_spent', ascending=False).head(10)[
+            ['customer_name', 'country', 'total_spent', 'nb_orders']],
+        'kpi_sales_by_gender': gender.sort_values('total_sales', ascending=False)[
+            ['gender', 'total_sales', 'nb_customers']],
+        'kpi_sales_by_product_line': by('product_line')[
+            ['product_line', 'total_sales', 'total_quantity', 'avg_price']],
+        'kpi_sales_by_marital_status': cube_rollup(cube, 'marital_status').rename(
+            columns={'avg_sales': 'avg_order_value'})[
+            ['marital_status', 'total_sales', 'avg_order_value', 'nb_transactions']],
+        'kpi_dashboard_summary': {
+            'global': summary[['total_revenue', 'total_orders', 'total_customers', 'avg_order_value',
+                               'total_units']],
+            'top_category': sales('category', 1),
+            'top_country': sales('country', 1),
+            'categories': sales('category', 5, 'N/A'),
+            'countries': sales('country', 5, 'N/A'),
+            'months': monthly.rename(columns={'total_sales': 'sales'})[['month', 'sales']],
+        },
+    }
+
+
+def assert_same_frame(actual, expected, sort_by=None):
+    if sort_by is not None:
+        # The old query had no ORDER BY
+        actual = actual.sort_values(sort_by, na_position='first')
+        expected = expected.sort_values(sort_by, na_position='first')
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+@pytest.fixture(scope='module')
+def charts():
+    tables = synthetic_tables()
+    result = kpi_query_result(tables)
+    return chart_data(load_kpi_data(lambda query: result)), old_chart_queries(tables)
+
+
+@pytest.mark.parametrize('chart', [
+    'kpi_sales_by_category', 'kpi_sales_by_country', 'kpi_sales_over_time', 'kpi_top_products',
+    'kpi_top_customers', 'kpi_sales_by_gender', 'kpi_sales_by_product_line',
+])
+def test_chart_frames_match_the_old_queries(charts, chart):
+    actual, expected = charts
+    assert_same_frame(actual[chart], expected[chart])
+
+
+def test_marital_status_frame_matches_the_old_query(charts):
+    actual, expected = charts
+    assert_same_frame(actual['kpi_sales_by_marital_status'], expected['kpi_sales_by_marital_status'],
+                      sort_by='total_sales')
+
+
+@pytest.mark.parametrize('part', ['top_category', 'top_country', 'categories', 'countries', 'months'])
+def test_summary_frames_match_the_old_queries(charts, part):
+    actual, expected = charts
+    assert_same_frame(actual['kpi_dashboard_summary'][part], expected['kpi_dashboard_summary'][part])
+
+
+def test_summary_totals_match_the_old_query(charts):
+    actual, expected = charts
+    pd.testing.assert_series_equal(actual['kpi_dashboard_summary']['global'].astype(float),
+                                   expected['kpi_dashboard_summary']['global'].astype(float),
+                                   check_names=False)
+
+
+def test_every_chart_gets_data(charts):
+    actual, expected = charts
+    assert actual.keys() == expected.keys()
+    assert actual['kpi_dashboard_summary'].keys() == expected['kpi_dashboard_summary'].keys()
@@ -0,0 +1,129 @@
+"""
+run_pipelined on in-memory sources: rows, order, dropped rows, errors of
+each stage and backpressure of the bounded queues
+"""
+import itertools
+import threading
+import time
+
+import pytest
+
+import sys
+sys.path.append('.')
+from pipelined import run_pipelined
+
+# A pipeline still running after this many seconds is taken as hung
+TIMEOUT = 10
+
+
+def run(*args, **kwargs):
+    """run_pipelined in a thread, failing the test instead of hanging it"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = run_pipelined(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), "run_pipelined hung"
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def rows(count):
+    return ({'id': i} for i in range(count))
+
+
+def endless_rows():
+    return ({'id': i} for i in itertools.count())
+
+
+@pytest.mark.parametrize('count, batchsize, queuesize', [
+    (0, 10, 2), (1, 10, 2), (100, 7, 2), (1000, 1000, 8), (250, 1, 1),
+])
+def test_every_row_is_inserted_in_order(count, batchsize, queuesize):
+    inserted = []
+    assert run(rows(count), None, inserted.append, batchsize, queuesize) == count
+    assert [row['id'] for row in inserted] == list(range(count))
+
+
+def test_transformed_rows_are_inserted():
+    inserted = []
+
+    def double(row):
+        row['double'] = row['id'] * 2
+        return row
+
+    assert run(rows(50), double, inserted.append, batchsize=6) == 50
+    assert [row['double'] for row in inserted] == [i * 2 for i in range(50)]
+
+
+def test_rows_the_transform_drops_are_not_inserted_or_counted():
+    inserted = []
+
+    def keep_even(row):
+        return row if row['id'] % 2 == 0 else None
+
+    assert run(rows(101), keep_even, inserted.append, batchsize=4) == 51
+    assert [row['id'] for row in inserted] == list(range(0, 101, 2))
+
+    assert run(rows(20), lambda row: None, inserted.append, batchsize=4) == 0
+
+
+class StageError(Exception):
+    pass
+
+
+def failing_source():
+    yield from rows(25)
+    raise StageError('read')
+
+
+def fail_at(row_id, message):
+    def stage(row):
+        if row['id'] == row_id:
+            raise StageError(message)
+        return row
+    return stage
+
+
+def test_reader_error_is_raised():
+    inserted = []
+    with pytest.raises(StageError, match='read'):
+        run(failing_source(), None, inserted.append, batchsize=10, queuesize=1)
+    assert len(inserted) <= 25
+
+
+def test_transform_error_is_raised_with_an_endless_source():
+    with pytest.raises(StageError, match='transform'):
+        run(endless_rows(), fail_at(30, 'transform'), lambda row: None, batchsize=4, queuesize=2)
+
+
+def test_writer_error_is_raised_with_an_endless_source():
+    with pytest.raises(StageError, match='write'):
+        run(endless_rows(), None, fail_at(30, 'write'), batchsize=4, queuesize=2)
+
+
+def test_slow_writer_holds_back_the_reader():
+    produced = [0]
+    inserted = []
+    leads = []
+
+    def source():
+        for row in rows(60):
+            leads.append(produced[0] - len(inserted))
+            produced[0] += 1
+            yield row
+
+    def slow_insert(row):
+        time.sleep(0.002)
+        inserted.append(row)
+
+    assert run(source(), None, slow_insert, batchsize=1, queuesize=1) == 60
+    # At most one batch in each queue, one in each stage and the one being read
+    assert max(leads) <= 5
@@ -0,0 +1,497 @@
+"""
+Parity of the SQL pushdown rules with the Python transforms, checked without
+a database: the generated SQL is parsed and evaluated row by row with
+PostgreSQL semantics (NULL propagation, three-valued logic, integer division
+truncating toward zero, numeric division, month arithmetic on dates) for the
+subset of SQL the pushdown queries use.
+
+Only ASCII whitespace is trimmed by the SQL side (see WHITESPACE), so the
+values below stick to it.
+"""
+import calendar
+import itertools
+import re
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+import sys
+sys.path.append('.')
+from sources.pushdown import PUSHDOWN_QUERIES, sql_parse_date_int, sql_trim
+from sources.customers import transform_customer_row
+from sources.products import transform_product_row
+from sources.sales import parse_date_int, transform_sales_row
+from sources.erp_customer import transform_erp_customer_row
+from sources.erp_location import transform_erp_location_row
+
+
+TOKEN = re.compile(r"""
+    \s+
+    | (?P<string>E'(?:[^'\\]|\\.)*'|'(?:[^']|'')*')
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<name>[A-Za-z_][A-Za-z_0-9]*(?:\.[A-Za-z_][A-Za-z_0-9]*)?)
+    | (?P<op>::|<=|>=|!=|<>|[(),+\-*/%=<>])
+""", re.VERBOSE)
+
+# Backslash escapes of E'...' strings (any other escaped character stands for itself)
+ESCAPES = {'b': '\b', 't': '\t', 'n': '\n', 'r': '\r', 'f': '\f'}
+KEYWORDS = {'AND', 'OR', 'NOT', 'IS', 'NULL', 'BETWEEN', 'IN', 'LIKE', 'CASE', 'WHEN', 'THEN', 'ELSE',
+            'END', 'AS', 'FROM', 'SELECT', 'WHERE', 'OVER', 'TRUE', 'FALSE', 'INTERVAL'}
+
+
+class Window(object):
+    """A window function value: not computable from one row"""
+
+
+def unescape(match):
+    escaped = match.group(1)
+    if escaped[0] in '01234567':
+        return chr(int(escaped, 8))
+    return ESCAPES.get(escaped, escaped)
+
+
+def tokenize(sql):
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN.match(sql, position)
+        assert match, f"cannot tokenize {sql[position:position + 20]!r}"
+        position = match.end()
+        if match.group('string'):
+            text = match.group('string')
+            if text.startswith('E'):
+                value = re.sub(r"\\([0-7]{1,3}|.)", unescape, text[2:-1])
+            else:
+                value = text[1:-1].replace("''", "'")
+            tokens.append(('string', value))
+        elif match.group('number'):
+            text = match.group('number')
+            tokens.append(('number', Decimal(text) if '.' in text else int(text)))
+        elif match.group('name'):
+            name = match.group('name')
+            tokens.append(('keyword', name.upper()) if name.upper() in KEYWORDS else ('name', name))
+        elif match.group('op'):
+            tokens.append(('op', match.group('op')))
+    tokens.append(('end', None))
+    return tokens
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def divide(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    return Decimal(a) / Decimal(b)
+
+
+def modulo(a, b):
+    return a - b * divide(a, b)
+
+
+def add(a, b):
+    if isinstance(b, tuple):
+        unit, amount = b
+        return add_months(a, amount) if unit == 'month' else a + timedelta(days=amount)
+    return a + b
+
+
+def subtract(a, b):
+    if isinstance(b, tuple):
+        unit, amount = b
+        return add(a, (unit, -amount))
+    return a - b
+
+
+def like(value, pattern):
+    regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+    return re.fullmatch(regex, value, re.DOTALL) is not None
+
+
+def strict(function):
+    """A SQL function or operator returning NULL when any argument is NULL"""
+    def call(*args):
+        if any(arg is Window for arg in args):
+            return Window
+        return None if any(arg is None for arg in args) else function(*args)
+    return call
+
+
+OPERATORS = {
+    '+': strict(add), '-': strict(subtract), '*': strict(lambda a, b: a * b),
+    '/': strict(divide), '%': strict(modulo),
+    '=': strict(lambda a, b: a == b), '!=': strict(lambda a, b: a != b), '<>': strict(lambda a, b: a != b),
+    '<': strict(lambda a, b: a < b), '<=': strict(lambda a, b: a <= b),
+    '>': strict(lambda a, b: a > b), '>=': strict(lambda a, b: a >= b),
+    'LIKE': strict(like),
+}
+
+FUNCTIONS = {
+    'BTRIM': strict(lambda value, characters: value.strip(characters)),
+    'UPPER': strict(str.upper),
+    'LENGTH': strict(len),
+    'LEFT': strict(lambda value, n: value[:n]),
+    'REPLACE': strict(lambda value, old, new: value.replace(old, new)),
+    'ABS': strict(abs),
+    'MAKE_DATE': strict(date),
+    'COALESCE': lambda *args: next((arg for arg in args if arg is not None), None),
+}
+
+CASTS = {'NUMERIC': strict(Decimal), 'DATE': lambda value: value}
+
+
+def sql_and(a, b):
+    if a is False or b is False:
+        return False
+    return None if a is None or b is None else True
+
+
+def sql_or(a, b):
+    if a is True or b is True:
+        return True
+    return None if a is None or b is None else False
+
+
+def sql_in(value, candidates):
+    if value is None:
+        return None
+    if value in [candidate for candidate in candidates if candidate is not None]:
+        return True
+    return None if None in candidates else False
+
+
+class Parser(object):
+    """Recursive descent parser turning SQL into functions of a row (dict)"""
+    def __init__(self, sql):
+        self.tokens = tokenize(sql)
+        self.position = 0
+
+    def peek(self, offset=0):
+        return self.tokens[self.position + offset]
+
+    def accept(self, *token):
+        if self.peek()[:len(token)] == token:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, *token):
+        assert self.accept(*token), f"expected {token}, got {self.peek()}"
+
+    def done(self):
+        self.expect('end')
+
+    def expression(self):
+        return self.disjunction()
+
+    def disjunction(self):
+        node = self.conjunction()
+        while self.accept('keyword', 'OR'):
+            left, right = node, self.conjunction()
+            node = lambda row, left=left, right=right: sql_or(left(row), right(row))
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept('keyword', 'AND'):
+            left, right = node, self.negation()
+            node = lambda row, left=left, right=right: sql_and(left(row), right(row))
+        return node
+
+    def negation(self):
+        if self.accept('keyword', 'NOT'):
+            operand = self.negation()
+            return lambda row: None if operand(row) is None else not operand(row)
+        return self.comparison()
+
+    def comparison(self):
+        node = self.additive()
+        if self.accept('keyword', 'IS'):
+            negated = self.accept('keyword', 'NOT')
+            self.expect('keyword', 'NULL')
+            return lambda row: (node(row) is None) != negated
+        if self.accept('keyword', 'BETWEEN'):
+            low = self.additive()
+            self.expect('keyword', 'AND')
+            high = self.additive()
+            return lambda row: sql_and(OPERATORS['>='](node(row), low(row)), OPERATORS['<='](node(row), high(row)))
+        if self.accept('keyword', 'IN'):
+            self.expect('op', '(')
+            candidates = self.arguments()
+            return lambda row: sql_in(node(row), [candidate(row) for candidate in candidates])
+        if self.accept('keyword', 'LIKE'):
+            pattern = self.additive()
+            return lambda row: OPERATORS['LIKE'](node(row), pattern(row))
+        kind, value = self.peek()
+        if kind == 'op' and value in ('=', '!=', '<>', '<', '<=', '>', '>='):
+            self.position += 1
+            right = self.additive()
+            return lambda row: OPERATORS[value](node(row), right(row))
+        return node
+
+    def binary(self, operand, operators):
+        node = operand()
+        while self.peek()[0] == 'op' and self.peek()[1] in operators:
+            operator = self.peek()[1]
+            self.position += 1
+            left, right = node, operand()
+            node = lambda row, left=left, right=right, operator=operator: OPERATORS[operator](left(row), right(row))
+        return node
+
+    def additive(self):
+        return self.binary(self.multiplicative, ('+', '-'))
+
+    def multiplicative(self):
+        return self.binary(self.unary, ('*', '/', '%'))
+
+    def unary(self):
+        if self.accept('op', '-'):
+            operand = self.unary()
+            return lambda row: None if operand(row) is None else -operand(row)
+        node = self.primary()
+        while self.accept('op', '::'):
+            cast = CASTS[self.peek()[1].upper()]
+            self.position += 1
+            node = lambda row, node=node, cast=cast: cast(node(row))
+        return node
+
+    def arguments(self):
+        arguments = []
+        if not self.accept('op', ')'):
+            arguments.append(self.expression())
+            while self.accept('op', ','):
+                arguments.append(self.expression())
+            self.expect('op', ')')
+        return arguments
+
+    def case(self):
+        subject = None if self.peek() == ('keyword', 'WHEN') else self.expression()
+        branches = []
+        while self.accept('keyword', 'WHEN'):
+            condition = self.expression()
+            self.expect('keyword', 'THEN')
+            branches.append((condition, self.expression()))
+        default = self.expression() if self.accept('keyword', 'ELSE') else (lambda row: None)
+        self.expect('keyword', 'END')
+
+        def evaluate(row):
+            value = subject(row) if subject else None
+            for condition, result in branches:
+                matched = OPERATORS['='](value, condition(row)) if subject else condition(row)
+                if matched is True:
+                    return result(row)
+            return default(row)
+        return evaluate
+
+    def function(self, name):
+        if name == 'EXTRACT':
+            field = self.peek()[1].upper()
+            self.position += 1
+            self.expect('keyword', 'FROM')
+            operand = self.expression()
+            self.expect('op', ')')
+            assert field == 'DAY'
+            return lambda row: strict(lambda value: value.day)(operand(row))
+        if name == 'SUBSTRING':
+            value = self.expression()
+            self.expect('keyword', 'FROM')
+            start = self.expression()
+            self.expect('op', ')')
+            return lambda row: strict(lambda v, s: v[s - 1:])(value(row), start(row))
+        if name == 'CAST':
+            value = self.expression()
+            self.expect('keyword', 'AS')
+            cast = CASTS[self.peek()[1].upper()]
+            self.position += 1
+            self.expect('op', ')')
+            return lambda row: cast(value(row))
+        arguments = self.arguments()
+        if self.accept('keyword', 'OVER'):
+            self.skip_parentheses()
+            return lambda row: Window
+        function = FUNCTIONS[name]
+        return lambda row: function(*[argument(row) for argument in arguments])
+
+    def skip_parentheses(self):
+        self.expect('op', '(')
+        depth = 1
+        while depth:
+            kind, value = self.peek()
+            depth += (value == '(') - (value == ')') if kind == 'op' else 0
+            self.position += 1
+
+    def primary(self):
+        kind, value = self.peek()
+        self.position += 1
+        if kind in ('string', 'number'):
+            return lambda row: value
+        if kind == 'op' and value == '(':
+            node = self.expression()
+            self.expect('op', ')')
+            return node
+        if kind == 'keyword':
+            if value == 'NULL':
+                return lambda row: None
+            if value in ('TRUE', 'FALSE'):
+                return lambda row: value == 'TRUE'
+            if value == 'CASE':
+                return self.case()
+            if value == 'INTERVAL':
+                kind, text = self.peek()
+                self.position += 1
+                amount, unit = text.split()
+                return lambda row: (unit.rstrip('s'), int(amount))
+        if kind == 'name':
+            if value.upper() == 'CURRENT_DATE':
+                return lambda row: date.today()
+            if self.accept('op', '('):
+                return self.function(value.upper())
+            return lambda row: row[value]
+        raise AssertionError(f"unexpected token {kind} {value!r}")
+
+    def select(self):
+        """SELECT items FROM (subquery) alias | table [WHERE ...] -> function of a bronze row"""
+        self.expect('keyword', 'SELECT')
+        items = []
+        while True:
+            if self.accept('op', '*'):
+                items.append(('*', None))
+            else:
+                start = self.peek()
+                node = self.expression()
+                if self.accept('keyword', 'AS'):
+                    name = self.peek()[1]
+                    self.position += 1
+                else:
+                    name = start[1] if start[0] == 'name' else None
+                items.append((name, node))
+            if not self.accept('op', ','):
+                break
+        self.expect('keyword', 'FROM')
+        if self.accept('op', '('):
+            source = self.select()
+            self.expect('op', ')')
+            self.position += 1
+        else:
+            self.position += 1
+            source = None
+        # Row filters (deduplication, NOT NULL ids) are applied by the Python extracts too
+        if self.accept('keyword', 'WHERE'):
+            self.expression()
+
+        def evaluate(row):
+            row = source(row)[1] if source else row
+            named, values = {}, []
+            for name, node in items:
+                if name == '*':
+                    named.update(row)
+                    continue
+                value = node(row)
+                values.append(value)
+                if name:
+                    named[name] = value
+            return values, named
+        return evaluate
+
+
+def evaluate_expression(sql, row):
+    parser = Parser(sql)
+    node = parser.expression()
+    parser.done()
+    return node(row)
+
+
+def run_pushdown(table, row):
+    """Silver row (column -> value) the pushdown query of table produces from one bronze row"""
+    columns, query = PUSHDOWN_QUERIES[table]
+    parser = Parser(query)
+    select = parser.select()
+    parser.done()
+    return dict(zip(columns, select(row)[0]))
+
+
+def as_inserted(value):
+    """The value an INTEGER column stores (numeric rounds half away from zero)"""
+    if isinstance(value, (float, Decimal)):
+        return int(Decimal(str(value)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    return value
+
+
+STRINGS = [None, '', ' ', 'v', 'Yaroslav', 'm', ' M ', '\tS\n', 's', 'f', 'F\r', ' male', 'FEMALE ', 'Female', 'x',
+           'r', 'T\t', 'DE', ' DE', 'de', 'US', 'USA ', 'France', '\v\fUS\f']
+
+# Year 9999 stops at November: the evaluator's dates cannot step into year 10000
+DATE_INTS = [None, 0, 20101229, 20240229, 20230229, 20240231, 20240431, 20231301, 20230100, 20230001,
+             20231232, 10000101, 99991130, 2010122, -2010122, -20101229, 123456789, 100000000]
+
+
+def test_sql_trim_matches_strip():
+    for value in STRINGS:
+        expected = None if value is None else value.strip()
+        assert evaluate_expression(sql_trim('v'), {'v': value}) == expected, repr(value)
+
+
+@pytest.mark.parametrize('value', DATE_INTS + [
+    year * 10000 + month * 100 + day
+    for year in (1900, 2000, 2023, 2024) for month in range(0, 14) for day in range(0, 33)
+])
+def test_sql_parse_date_int_matches_parse_date_int(value):
+    assert evaluate_expression(sql_parse_date_int('v'), {'v': value}) == parse_date_int(value)
+
+
+def test_customer_rules_match_transform_customer_row():
+    for first, status, gender in itertools.product(STRINGS, STRINGS, STRINGS):
+        row = {'cst_id': 1, 'cst_key': 'AW1', 'cst_firstname': first, 'cst_lastname': gender,
+               'cst_marital_status': status, 'cst_gndr': gender, 'cst_create_date': date(2020, 1, 1)}
+        expected = transform_customer_row(dict(row))
+        assert run_pushdown('crm_cust_info', row) == {
+            column: expected[column] for column in PUSHDOWN_QUERIES['crm_cust_info'][0]
+        }, row
+
+
+def test_product_rules_match_transform_product_row():
+    keys = [None, '', 'AB', 'CO-RF', 'CO-RF-', 'CO-RF-F', 'CO-RF-FR-R92B-58', 'ABCDEFGH']
+    for key, cost, line in itertools.product(keys, [None, 0, 12], STRINGS):
+        row = {'prd_id': 1, 'prd_key': key, 'prd_nm': 'Bike', 'prd_cost': cost, 'prd_line': line,
+               'prd_start_dt': date(2020, 1, 1)}
+        python_row = {column: value for column, value in row.items() if column != 'prd_key'}
+        expected = transform_product_row(dict(python_row, original_prd_key=key))
+        actual = run_pushdown('crm_prd_info', row)
+        # prd_end_dt comes from LEAD over the product's versions, as in extract_products
+        assert actual.pop('prd_end_dt') is Window
+        assert actual == {column: expected[column] for column in actual}, row
+
+
+def test_sales_rules_match_transform_sales_row():
+    amounts = [None, 0, -10, 10, 25, 7]
+    quantities = [None, 0, -2, 1, 2, 3]
+    for (sales, quantity, price), day in zip(itertools.product(amounts, quantities, amounts),
+                                             itertools.cycle(DATE_INTS)):
+        row = {'sls_ord_num': 'SO1', 'sls_prd_key': 'BK-1', 'sls_cust_id': 1, 'sls_order_dt': day,
+               'sls_ship_dt': 20240229, 'sls_due_dt': 20240231,
+               'sls_sales': sales, 'sls_quantity': quantity, 'sls_price': price}
+        expected = transform_sales_row(dict(row))
+        actual = run_pushdown('crm_sales_details', row)
+        assert {column: as_inserted(value) for column, value in actual.items()} == {
+            column: as_inserted(expected[column]) for column in actual
+        }, row
+
+
+def test_erp_customer_rules_match_transform_erp_customer_row():
+    today = date.today()
+    ids = [None, '', 'NAS', 'NASAW00011000', 'AW00011000', 'nasAW1', ' NASAW1']
+    birthdates = [None, date(1970, 1, 1), today, today + timedelta(days=1)]
+    for cid, bdate, gen in itertools.product(ids, birthdates, STRINGS):
+        row = {'cid': cid, 'bdate': bdate, 'gen': gen}
+        assert run_pushdown('erp_cust_az12', row) == transform_erp_customer_row(dict(row)), row
+
+
+def test_erp_location_rules_match_transform_erp_location_row():
+    for cid, country in itertools.product([None, '', 'AW-00011000', 'AW00011000', '--'], STRINGS):
+        row = {'cid': cid, 'cntry': country}
+        assert run_pushdown('erp_loc_a101', row) == transform_erp_location_row(dict(row)), row
@@ -0,0 +1,151 @@
+"""
+DataFrameCache tiers and invalidation, with a counting stand-in for the
+database query and a temporary cache directory
+"""
+import hashlib
+import os
+
+import pandas as pd
+import pytest
+
+import sys
+sys.path.append('.')
+from dashboards.query_cache import DataFrameCache
+
+
+class Queries(object):
+    """run_query stand-in: one small DataFrame per query, calls counted"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, query):
+        self.calls.append(query)
+        return pd.DataFrame({'query': [query] * 10, 'value': range(10)})
+
+
+class Versions(object):
+    """version_loader stand-in whose version the test changes, reads counted"""
+    def __init__(self, version=1):
+        self.version = version
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.version
+
+
+def cache_key(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def frame_size():
+    return int(Queries()('A').memory_usage(deep=True).sum())
+
+
+@pytest.fixture
+def queries():
+    return Queries()
+
+
+@pytest.fixture
+def versions():
+    return Versions()
+
+
+@pytest.fixture
+def cache(tmp_path, versions):
+    return DataFrameCache(versions, cache_dir=str(tmp_path))
+
+
+def memory_queries(cache):
+    return [df['query'][0] for df, _ in cache.memory.values()]
+
+
+def test_hits_return_copies(cache, queries):
+    first = cache.get_dataframe('A', queries)
+    first.loc[0, 'value'] = -1
+    assert cache.get_dataframe('A', queries)['value'][0] == 0
+    assert queries.calls == ['A']
+
+
+def test_memory_tier_evicts_the_least_recently_used(tmp_path, versions, queries):
+    cache = DataFrameCache(versions, cache_dir=str(tmp_path), memory_bytes=2 * frame_size())
+    cache.get_dataframe('A', queries)
+    cache.get_dataframe('B', queries)
+    cache.get_dataframe('A', queries)
+    cache.get_dataframe('C', queries)
+    assert memory_queries(cache) == ['A', 'C']
+    assert cache.memory_used == 2 * frame_size()
+
+    cache.get_dataframe('B', queries)
+    assert memory_queries(cache) == ['C', 'B']
+    # B came back from the disk tier, not from the database
+    assert queries.calls == ['A', 'B', 'C']
+
+
+def test_frames_over_the_memory_budget_are_not_kept(tmp_path, versions, queries):
+    cache = DataFrameCache(versions, cache_dir=str(tmp_path), memory_bytes=frame_size() - 1)
+    cache.get_dataframe('A', queries)
+    assert cache.memory_used == 0 and not cache.memory
+
+
+def test_disk_tier_serves_a_memory_miss(cache, queries, tmp_path, versions):
+    cache.get_dataframe('A', queries)
+    cache.clear_memory()
+    assert cache.get_dataframe('A', queries).equals(Queries()('A'))
+    assert queries.calls == ['A']
+
+    # Another process with the same cache directory
+    other = DataFrameCache(versions, cache_dir=str(tmp_path))
+    other.get_dataframe('A', queries)
+    assert queries.calls == ['A']
+
+
+def test_disk_tier_evicts_the_least_recently_used(tmp_path, versions, queries):
+    cache = DataFrameCache(versions, cache_dir=str(tmp_path), memory_bytes=0)
+    for query in ('A', 'B'):
+        cache.get_dataframe(query, queries)
+    files = {query: cache.disk_path(1, cache_key(query)) for query in 'AB'}
+    os.utime(files['A'], (1000, 1000))
+    os.utime(files['B'], (2000, 2000))
+    cache.disk_bytes = os.path.getsize(files['A']) + os.path.getsize(files['B'])
+
+    cache.get_dataframe('C', queries)
+    assert not os.path.exists(files['A'])
+    assert os.path.exists(files['B'])
+
+
+def test_new_load_version_invalidates_both_tiers(cache, queries, versions, tmp_path):
+    cache.get_dataframe('A', queries)
+    versions.version = 2
+    cache.get_dataframe('A', queries)
+    assert queries.calls == ['A', 'A']
+    assert len(cache.memory) == 1
+    # Entries of the old version are removed from disk when the new one is written
+    assert [name.split('_')[0] for name in os.listdir(tmp_path)] == ['2']
+
+
+def test_no_version_disables_caching(cache, queries, versions, tmp_path):
+    versions.version = None
+    cache.get_dataframe('A', queries)
+    cache.get_dataframe('A', queries)
+    assert queries.calls == ['A', 'A']
+    assert not cache.memory and not os.listdir(tmp_path)
+
+
+def test_pinned_version_is_read_once_per_block(cache, queries, versions):
+    with cache.pinned_version() as version:
+        assert version == 1
+        cache.get_dataframe('A', queries)
+        versions.version = 2
+        cache.get_dataframe('A', queries)
+        with cache.pinned_version() as inner:
+            assert inner == 1
+            cache.get_dataframe('B', queries)
+    assert versions.reads == 1
+    assert queries.calls == ['A', 'B']
+
+    # Outside the block every query reads the version again
+    cache.get_dataframe('A', queries)
+    assert versions.reads == 2
+    assert queries.calls == ['A', 'B', 'A']
@@ -0,0 +1,51 @@
+"""
+Parity of the vectorized sales transform (load_sales(batch=True)) with the
+row-wise transform_sales_row: same values and same Python types
+"""
+import itertools
+
+import sys
+sys.path.append('.')
+from sources.sales import SALES_COLUMNS, iter_sales_batches, transform_sales_row
+
+DATES = [20101229, 20240229, 20240231, 20231301, 20230100, 0, None, 2010122, -2010122, -20101229, 123456789]
+AMOUNTS = [None, 0, -10, 10, 25, 7]
+QUANTITIES = [None, 0, -2, 1, 2, 3]
+
+
+def quirky_rows():
+    """Bronze sales rows covering every combination of edge amounts, plus edge dates"""
+    rows = []
+    for i, (sales, quantity, price) in enumerate(itertools.product(AMOUNTS, QUANTITIES, AMOUNTS)):
+        rows.append({
+            'sls_ord_num': f'SO{i}', 'sls_prd_key': 'BK-R93R-62', 'sls_cust_id': 21768,
+            'sls_order_dt': DATES[i % len(DATES)],
+            'sls_ship_dt': DATES[(i + 3) % len(DATES)],
+            'sls_due_dt': DATES[(i + 7) % len(DATES)],
+            'sls_sales': sales, 'sls_quantity': quantity, 'sls_price': price,
+        })
+    return rows
+
+
+def batch_records(rows, batchsize):
+    """Records of the vectorized path, fed dict rows like the SQLSource of load_sales"""
+    source = [dict(row) for row in rows]
+    return [record for chunk in iter_sales_batches(source, batchsize) for record in chunk.to_dict('records')]
+
+
+def test_batch_transform_matches_row_transform():
+    rows = quirky_rows()
+    expected = [transform_sales_row(dict(row)) for row in rows]
+    for batchsize in (7, len(rows)):
+        actual = batch_records(rows, batchsize)
+        assert len(actual) == len(expected)
+        for want, got in zip(expected, actual):
+            assert got == want, (want, got)
+            for column in SALES_COLUMNS:
+                assert type(got[column]) is type(want[column]), (column, want, got)
+
+
+def test_quirky_rows_cover_derived_float_prices():
+    prices = [transform_sales_row(dict(row))['sls_price'] for row in quirky_rows()]
+    assert any(isinstance(price, float) for price in prices)
+    assert any(isinstance(price, int) for price in prices)
@@ -0,0 +1,166 @@
+"""
+In-memory sales cube checked against pandas: a synthetic star schema is fed to
+SalesCube.from_chunks in small chunks, and group_by / top_n / where must agree
+with a groupby over the same rows joined in pandas
+"""
+import itertools
+import random
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sys
+sys.path.append('.')
+from dashboards.sales_cube import NULL_DAY, SalesCube, cube_kpi_data
+
+MEASURE_COLUMNS = ['total_sales', 'total_quantity', 'nb_transactions', 'nb_orders', 'nb_customers',
+                   'avg_sales', 'avg_price']
+
+PRODUCTS = [
+    (1, 'Bikes', 'Road', 'Road-150'),
+    (2, 'Bikes', 'Mountain', 'Mountain-200'),
+    (3, 'Accessories', None, 'Helmet'),
+    (5, None, 'Touring', 'Touring-1000'),
+]
+
+CUSTOMERS = [
+    (10, 'France', 'Female', 'Married', 'Ana Lopez'),
+    (11, 'Germany', 'Male', 'Single', 'Jon Berg'),
+    (12, 'France', 'Male', None, 'Li Wei'),
+    (14, 'n/a', 'n/a', 'Single', 'Ana Lopez'),
+]
+
+
+def synthetic_facts(count=400, seed=7):
+    """(order_number, product_key, customer_key, day, sales, quantity, price) rows, quirks included"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        day = date(2012, 12, 1).toordinal() - date(1970, 1, 1).toordinal() + rng.randrange(120)
+        rows.append((
+            rng.choice([f"SO{i // 3}", f"SO{rng.randrange(50)}", None]),
+            rng.choice([1, 1, 2, 3, 5, 99, -1]),
+            rng.choice([10, 11, 11, 12, 14, 77, -1]),
+            rng.choice([day, day, day, NULL_DAY]),
+            rng.choice([None, 0.0, 25.0, 1200.0, 3578.0, 7.0]),
+            rng.choice([None, 1.0, 2.0]),
+            rng.choice([None, 12.5, 25.0, 3578.0]),
+        ))
+    return rows
+
+
+def chunked(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def joined_frame(facts):
+    """The fact rows LEFT JOINed with their dimension attributes, as the old cube query did"""
+    df = pd.DataFrame(facts, columns=['order_number', 'product_key', 'customer_key', 'day',
+                                      'sales_amount', 'quantity', 'price'])
+    products = pd.DataFrame(PRODUCTS, columns=['product_key', 'category', 'product_line', 'product_name'])
+    customers = pd.DataFrame(CUSTOMERS, columns=['customer_key', 'country', 'gender', 'marital_status',
+                                                 'customer_name'])
+    df = df.merge(products, on='product_key', how='left').merge(customers, on='customer_key', how='left')
+    # Unknown keys: the cube keeps their attributes NULL and the customer_key label NULL
+    df.loc[~df['customer_key'].isin(customers['customer_key']), 'customer_key'] = None
+    dates = pd.to_datetime(np.where(df['day'] == NULL_DAY, np.nan, df['day']), unit='D')
+    df['month'] = dates.to_period('M').to_timestamp()
+    return df
+
+
+def expected_group_by(df, by):
+    """The cube's measures computed by a pandas groupby"""
+    groups = df.groupby(by, dropna=False) if by else df.groupby(np.zeros(len(df)))
+    result = pd.DataFrame({
+        'total_sales': groups['sales_amount'].sum().round().astype('int64'),
+        'total_quantity': groups['quantity'].sum().round().astype('int64'),
+        'nb_transactions': groups.size(),
+        'nb_orders': groups['order_number'].nunique(),
+        'nb_customers': groups['customer_key'].nunique(),
+        'avg_sales': groups['sales_amount'].mean(),
+        'avg_price': groups['price'].mean(),
+    })
+    return result.reset_index(drop=not by)
+
+
+def normalized(df, by):
+    """Rows keyed by their group labels (NULL labels made comparable), measures as floats"""
+    rows = {}
+    for record in df.to_dict('records'):
+        key = tuple(None if pd.isna(record[name]) else record[name] for name in by)
+        rows[key] = [float(record[column]) for column in MEASURE_COLUMNS]
+    return rows
+
+
+def assert_same_groups(actual, expected, by):
+    rows = len(actual)
+    actual, expected = normalized(actual, by), normalized(expected, by)
+    assert len(actual) == rows
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        np.testing.assert_allclose(actual[key], expected[key], rtol=1e-12, equal_nan=True, err_msg=str(key))
+
+
+@pytest.fixture(scope='module')
+def facts():
+    return synthetic_facts()
+
+
+@pytest.fixture(scope='module')
+def cube(facts):
+    return SalesCube.from_chunks(PRODUCTS, CUSTOMERS, chunked(facts, 7))
+
+
+def test_columns_are_typed_arrays(cube, facts):
+    assert len(cube) == len(facts)
+    assert cube.days.dtype == np.int32
+    assert all(values.dtype == np.float64 for values in cube.measures.values())
+    assert all(codes.dtype.kind == 'i' for codes, _ in cube.dims.values())
+    # Attribute labels are encoded once per dimension row, not per fact row
+    assert len(cube.dims['customer_name'][1]) <= len(CUSTOMERS) + 1
+
+
+def test_chunk_size_does_not_change_the_cube(cube, facts):
+    whole = SalesCube.from_chunks(PRODUCTS, CUSTOMERS, [facts])
+    for by in (['order_number'], ['customer_key', 'category']):
+        assert_same_groups(whole.group_by(by), cube.group_by(by), by)
+
+
+@pytest.mark.parametrize('by', [
+    [], ['category'], ['country'], ['month'], ['product_line'], ['product_name'], ['marital_status'],
+    ['country', 'gender'], ['category', 'month'], ['customer_key', 'customer_name', 'country'],
+])
+def test_group_by_matches_pandas(cube, facts, by):
+    df = joined_frame(facts)
+    assert_same_groups(cube.group_by(by), expected_group_by(df, by), by)
+
+
+@pytest.mark.parametrize('conditions', [
+    {'country': 'France'}, {'category': 'Bikes', 'gender': 'Male'}, {'country': 'Nowhere'},
+])
+def test_where_matches_a_pandas_filter(cube, facts, conditions):
+    df = joined_frame(facts)
+    for name, value in conditions.items():
+        df = df[df[name] == value]
+    by = ['product_name']
+    assert_same_groups(cube.where(**conditions).group_by(by), expected_group_by(df, by), by)
+
+
+@pytest.mark.parametrize('n, measure',
+                         list(itertools.product([1, 3, 50], ['total_sales', 'nb_transactions'])))
+def test_top_n_matches_pandas(cube, facts, n, measure):
+    df = expected_group_by(joined_frame(facts), ['product_name'])
+    top = cube.top_n('product_name', n, measure)
+    assert len(top) == min(n, len(df))
+    assert top[measure].is_monotonic_decreasing
+    assert list(top[measure]) == sorted(df[measure], reverse=True)[:n]
+
+
+def test_empty_fact_table(cube):
+    empty = SalesCube.from_chunks(PRODUCTS, CUSTOMERS, iter([]))
+    assert len(empty) == 0
+    assert empty.group_by('country').empty
+    assert set(cube_kpi_data(empty)) == set(cube_kpi_data(cube))